@@ -0,0 +1,310 @@
+"""Reproducible benchmarks of parsing, training and inference throughput
+
+A run generates a synthetic training file and network of configurable size
+(from a fixed seed, so every run measures the same work) and times:
+
+    parse_text        get_examples on the .train file
+    parse_stream      stream_examples over the .train file
+    parse_binary      get_examples on the binary examples file (touching
+                      every value)
+    train_<engine>    --epochs training epochs
+    predict_<engine>  confusion counts of every example
+    phases_node       forward_propagate, back_propagate and update_weights
+                      per example of the node engine
+
+for the node engine (online back_prop_learning/predict over Node objects)
+and the vectorized engine (train_weights with --batch-size/predict_batch).
+Every benchmark reports the median time over --repeats runs (and the best
+time, which is reported only), the throughput at the median time, and the peak memory allocated
+while it ran (measured in a separate run with tracemalloc). Training is
+timed over --epochs epochs per run and reported per epoch, so that the
+setup of a run and timer noise do not dominate small networks; small
+configurations still vary by several percent between runs, so use enough
+examples, epochs and repeats for stable comparisons.
+
+Results are written as JSON; compare reports every throughput that dropped
+(or time/memory that grew) by more than a threshold between two runs, e.g.
+of two commits, and exits with status 1 if there is any regression.
+
+Example:
+    python3 benchmarks.py run baseline.json --examples 5000 --hidden 16 8
+    python3 benchmarks.py run current.json --examples 5000 --hidden 16 8
+    python3 benchmarks.py compare baseline.json current.json --threshold 0.1
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from back_prop_algorithm import (
+    back_prop_learning, load_input_values, forward_propagate, back_propagate, update_weights
+)
+from helper_functions import (
+    derivative_of_sigmoid_from_value
+)
+from neural_network_programs import (
+    generate_new_network, get_examples, stream_examples, convert_examples_to_binary,
+    predict, predict_batch
+)
+from training_telemetry import (
+    timer
+)
+from vectorized_back_prop import (
+    network_to_weights, train_weights
+)
+
+ENGINES = ("node", "vectorized")
+
+# Metrics where a larger value is better; every other metric is better smaller
+THROUGHPUT_METRICS = ("examples_per_second", "epochs_per_second")
+# Metrics reported but not compared: the best time of a few runs is too
+# noisy to flag regressions with, the median is compared instead
+REPORTED_METRICS = ("best_seconds",)
+
+def write_synthetic_examples(filename, num_examples, num_inputs, num_outputs, seed=0):
+    """
+    Writes a formatted training file (.train) of random examples whose
+    outputs are a (learnable) thresholded random linear function of the inputs
+    """
+    rng = np.random.default_rng(seed)
+    inputs = rng.uniform(-1, 1, (num_examples, num_inputs))
+    teacher = rng.normal(size=(num_inputs, num_outputs))
+    outputs = (inputs @ teacher > 0).astype(int)
+    row_format = " ".join(["%1.3f"] * num_inputs + ["%d"] * num_outputs)
+    with open(filename, "w+") as file:
+        file.write(str(num_examples) + " " + str(num_inputs) + " " + str(num_outputs) + "\n")
+        np.savetxt(file, np.hstack((inputs, outputs)), fmt=row_format)
+
+def generate_synthetic_network(num_inputs, num_hidden_nodes, num_outputs, seed=0):
+    """Returns generate_new_network with its random weights drawn from seed"""
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return generate_new_network(num_inputs, num_hidden_nodes, num_outputs)
+    finally:
+        random.setstate(state)
+
+def measure(function, repeats):
+    """
+    Returns the median and best wall time in seconds of repeats calls of
+    function and the peak memory in bytes allocated during one extra call
+    under tracemalloc
+    """
+    times = []
+    for _ in range(repeats):
+        start = timer()
+        function()
+        times.append(timer() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return float(np.median(times)), min(times), peak
+
+def time_node_phases(network, inputs, outputs, learning_rate):
+    """Returns the mean seconds per example spent in forward_propagate,
+    back_propagate and update_weights by back_prop_learning"""
+    forward_time = backward_time = update_time = 0.0
+    for input, output in zip(inputs, outputs):
+        start = timer()
+        load_input_values(network[0], input)
+        forward_propagate(network)
+        forward_time += timer() - start
+        start = timer()
+        delta = [[] for layer in network]
+        for i, node in enumerate(network[-1]):
+            delta[-1].append(derivative_of_sigmoid_from_value(node.value)
+                             * (output[i] - node.value))
+        back_propagate(network, delta)
+        backward_time += timer() - start
+        start = timer()
+        update_weights(network, delta, learning_rate)
+        update_time += timer() - start
+    num_examples = len(inputs)
+    return {"forward_seconds_per_example": forward_time / num_examples,
+            "backward_seconds_per_example": backward_time / num_examples,
+            "update_seconds_per_example": update_time / num_examples}
+
+def run_benchmarks(num_examples=2000, num_inputs=4, num_hidden_nodes=(2,), num_outputs=1,
+                   learning_rate=0.1, batch_size=1, repeats=5, engines=ENGINES, seed=0,
+                   num_epochs=5):
+    """
+    Returns the benchmark results as a dictionary with the keys config,
+    environment and benchmarks (a dictionary of metrics per benchmark)
+    """
+    if repeats < 1 or num_epochs < 1:
+        raise ValueError("Repeats and epochs must be positive integers")
+    for engine in engines:
+        if engine not in ENGINES:
+            raise ValueError("Engine must be one of " + ", ".join(ENGINES) + ", got '"
+                             + str(engine) + "'")
+    config = {"examples": num_examples, "inputs": num_inputs,
+              "hidden": list(num_hidden_nodes), "outputs": num_outputs,
+              "learning_rate": learning_rate, "batch_size": batch_size,
+              "repeats": repeats, "epochs": num_epochs, "engines": list(engines),
+              "seed": seed}
+    benchmarks = {}
+    with tempfile.TemporaryDirectory() as directory:
+        text_file = os.path.join(directory, "synthetic.train")
+        binary_file = os.path.join(directory, "synthetic.bin")
+        write_synthetic_examples(text_file, num_examples, num_inputs, num_outputs, seed)
+        convert_examples_to_binary(text_file, binary_file)
+
+        def load_binary():
+            inputs, outputs = get_examples(binary_file)
+            return float(inputs.sum()) + float(outputs.sum())
+
+        parsers = {
+            "parse_text": lambda: get_examples(text_file),
+            "parse_stream": lambda: sum(len(inputs) for inputs, _ in stream_examples(text_file)),
+            "parse_binary": load_binary,
+        }
+        for name, function in parsers.items():
+            seconds, best, peak = measure(function, repeats)
+            benchmarks[name] = {"seconds": seconds, "best_seconds": best,
+                                "examples_per_second": num_examples / seconds,
+                                "peak_memory_bytes": peak}
+        examples = get_examples(text_file)
+        arrays = (np.array(examples[0], dtype=np.float64), np.array(examples[1]))
+
+    network = generate_synthetic_network(num_inputs, list(num_hidden_nodes), num_outputs, seed)
+    initial_weights = network_to_weights(network)
+    # Every run (the timed repeats and the tracemalloc run) trains a fresh
+    # copy of the same network, built before timing starts
+    node_networks = iter([generate_synthetic_network(num_inputs, list(num_hidden_nodes),
+                                                     num_outputs, seed)
+                          for _ in range(repeats + 1 if "node" in engines else 0)])
+    training = {
+        "node": lambda: back_prop_learning(examples, next(node_networks), learning_rate,
+                                           num_epochs),
+        "vectorized": lambda: train_weights(
+            arrays[0], arrays[1], [layer_weights.copy() for layer_weights in initial_weights],
+            learning_rate, num_epochs, batch_size, verbose=False),
+    }
+    inference = {
+        "node": lambda: predict(network, examples),
+        "vectorized": lambda: predict_batch(network, arrays),
+    }
+    for engine in engines:
+        # The node engine prints every completed epoch
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, best, peak = measure(training[engine], repeats)
+        # Seconds per epoch
+        seconds /= num_epochs
+        benchmarks["train_" + engine] = {"seconds": seconds, "best_seconds": best / num_epochs,
+                                         "epochs_per_second": 1 / seconds,
+                                         "examples_per_second": num_examples / seconds,
+                                         "peak_memory_bytes": peak}
+        seconds, best, peak = measure(inference[engine], repeats)
+        benchmarks["predict_" + engine] = {"seconds": seconds, "best_seconds": best,
+                                           "examples_per_second": num_examples / seconds,
+                                           "peak_memory_bytes": peak}
+    if "node" in engines:
+        benchmarks["phases_node"] = time_node_phases(
+            generate_synthetic_network(num_inputs, list(num_hidden_nodes), num_outputs, seed),
+            examples[0], examples[1], learning_rate)
+    return {"config": config, "environment": environment(), "benchmarks": benchmarks}
+
+def environment():
+    """Returns the versions and commit the benchmarks ran with"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(),
+            "cpus": os.cpu_count(), "commit": commit or None}
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Returns the regressions of current against baseline benchmark results
+
+    A throughput (examples/epochs per second) regresses when it is more than
+    threshold (a fraction) below the baseline, any other metric (seconds,
+    memory) when it is more than threshold above it. Benchmarks or metrics
+    missing from either run and REPORTED_METRICS are skipped.
+
+    Returns:
+        regressions: Array of (benchmark, metric, baseline value, current
+            value, relative change) tuples
+    """
+    regressions = []
+    for name, metrics in sorted(baseline["benchmarks"].items()):
+        for metric, old in sorted(metrics.items()):
+            new = current["benchmarks"].get(name, {}).get(metric)
+            if metric in REPORTED_METRICS or new is None or not old:
+                continue
+            change = (new - old) / old
+            if metric in THROUGHPUT_METRICS:
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold
+            if regressed:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+def main(argv=None):
+    """Runs or compares benchmarks from command line arguments, returns the exit status"""
+    parser = argparse.ArgumentParser(description="Benchmark training and inference")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run = subparsers.add_parser("run", help="run the benchmarks and write the JSON results")
+    run.add_argument("output_file", help="JSON results file to write, - for standard output")
+    run.add_argument("--examples", type=int, default=2000)
+    run.add_argument("--inputs", type=int, default=4)
+    run.add_argument("--hidden", type=int, nargs="+", default=[2],
+                     help="number of nodes of each hidden layer")
+    run.add_argument("--outputs", type=int, default=1)
+    run.add_argument("--learning-rate", type=float, default=0.1)
+    run.add_argument("--batch-size", type=int, default=1)
+    run.add_argument("--repeats", type=int, default=5,
+                     help="timed runs of every benchmark, the median is reported (default 5)")
+    run.add_argument("--epochs", type=int, default=5,
+                     help="training epochs per timed run (default 5)")
+    run.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    run.add_argument("--seed", type=int, default=0)
+    compare = subparsers.add_parser("compare", help="report regressions between two runs")
+    compare.add_argument("baseline_file")
+    compare.add_argument("current_file")
+    compare.add_argument("--threshold", type=float, default=0.1,
+                         help="relative change counted as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(args.examples, args.inputs, args.hidden, args.outputs,
+                                 args.learning_rate, args.batch_size, args.repeats,
+                                 args.engines, args.seed, args.epochs)
+        text = json.dumps(results, indent=2, sort_keys=True)
+        if args.output_file == "-":
+            print(text)
+        else:
+            with open(args.output_file, "w+") as file:
+                file.write(text + "\n")
+        return 0
+
+    with open(args.baseline_file, "r") as file:
+        baseline = json.load(file)
+    with open(args.current_file, "r") as file:
+        current = json.load(file)
+    if baseline["config"] != current["config"]:
+        print("warning: the runs used different configurations", file=sys.stderr)
+    regressions = compare_results(baseline, current, args.threshold)
+    for name, metric, old, new, change in regressions:
+        print(name + " " + metric + ": " + "{0:.6g} -> {1:.6g} ({2:+.1%})".format(old, new, change))
+    if not regressions:
+        print("No regressions above " + "{0:.0%}".format(args.threshold))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
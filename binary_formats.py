@@ -0,0 +1,180 @@
+"""Compact binary file formats read through memory mapping
+
+Binary examples file (alternative to .train/.test):
+    • A 64 byte header: the magic bytes EXAMPLES_MAGIC, the format version,
+      the size in bytes of each input value (4 for float32, 8 for float64),
+      the number of examples, Ni and No (little-endian).
+    • The inputs as a [num_examples x Ni] float matrix in row-major order.
+    • The outputs as a [num_examples x No] uint8 matrix in row-major order.
+
+Binary network file (alternative to .init/.trained, see NETWORK_EXTENSION):
+    • A 16 byte header: the magic bytes NETWORK_MAGIC, the format version and
+      the number of layers (including the input layer) (little-endian).
+    • The size of each layer as uint32 values, padded to a multiple of 8 bytes.
+    • The full precision float64 weight matrix of each non-input layer in
+      row-major order, laid out exactly like the lines of a .init file
+      ([num_nodes x (num_nodes_in_previous_layer + 1)], bias weight first).
+
+Loading only maps the file into memory, so no text has to be parsed and the
+operating system pages in examples as they are used.
+"""
+import struct
+
+import numpy as np
+
+EXAMPLES_MAGIC = b"NNEX"
+EXAMPLES_VERSION = 1
+# magic, version, input value size, padding, num_examples, Ni, No
+EXAMPLES_HEADER = struct.Struct("<4sBB2xQII")
+HEADER_SIZE = 64
+INPUT_DTYPES = {4: np.dtype("<f4"), 8: np.dtype("<f8")}
+
+NETWORK_MAGIC = b"NNWT"
+NETWORK_VERSION = 1
+# magic, version, number of layers
+NETWORK_HEADER = struct.Struct("<4sII4x")
+# Networks written to files with this extension use the binary format
+NETWORK_EXTENSION = ".nnw"
+WEIGHT_DTYPE = np.dtype("<f8")
+
+def is_binary_examples_file(filename):
+    """Returns True if filename starts with the binary examples magic bytes"""
+    with open(filename, "rb") as file:
+        return file.read(len(EXAMPLES_MAGIC)) == EXAMPLES_MAGIC
+
+def read_binary_examples_header(filename):
+    """
+    Returns the header of a binary examples file
+
+    Returns:
+        num_examples, num_inputs, num_outputs, input_dtype
+    """
+    with open(filename, "rb") as file:
+        header = file.read(EXAMPLES_HEADER.size)
+    if len(header) < EXAMPLES_HEADER.size:
+        raise ValueError("Truncated binary examples file: '" + filename + "'")
+    magic, version, value_size, num_examples, num_inputs, num_outputs = \
+        EXAMPLES_HEADER.unpack(header)
+    if magic != EXAMPLES_MAGIC:
+        raise ValueError("Not a binary examples file: '" + filename + "'")
+    if version != EXAMPLES_VERSION or value_size not in INPUT_DTYPES:
+        raise ValueError("Unsupported binary examples file: '" + filename + "'")
+    return num_examples, num_inputs, num_outputs, INPUT_DTYPES[value_size]
+
+def load_binary_examples(filename):
+    """
+    Returns memory mapped inputs and outputs from a binary examples file
+
+    Args:
+        filename: String referring to name of binary examples file
+    Returns:
+        inputs, outputs: Read-only 2 dimensional arrays
+            e.g [num_examples x num_inputs] floats, [num_examples x num_outputs] uint8
+    """
+    num_examples, num_inputs, num_outputs, input_dtype = read_binary_examples_header(filename)
+    inputs_size = num_examples * num_inputs * input_dtype.itemsize
+    if num_examples == 0:
+        return (np.zeros((0, num_inputs), dtype=input_dtype),
+                np.zeros((0, num_outputs), dtype=np.uint8))
+    inputs = np.memmap(filename, dtype=input_dtype, mode="r", offset=HEADER_SIZE,
+                       shape=(num_examples, num_inputs))
+    outputs = np.memmap(filename, dtype=np.uint8, mode="r", offset=HEADER_SIZE + inputs_size,
+                        shape=(num_examples, num_outputs))
+    return inputs, outputs
+
+def write_binary_examples(filename, chunks, num_examples, num_inputs, num_outputs,
+                          dtype=np.float64):
+    """
+    Writes chunks of examples to a binary examples file
+
+    Args:
+        filename: String referring to name of binary examples file
+        chunks: Iterable of (inputs, outputs) pairs of 2 dimensional arrays,
+            e.g. from stream_examples, with num_examples rows in total
+        num_examples, num_inputs, num_outputs: Integers
+        dtype: np.float32 or np.float64, type used to store inputs
+    """
+    input_dtype = np.dtype(dtype).newbyteorder("<")
+    if input_dtype.kind != "f" or input_dtype.itemsize not in INPUT_DTYPES:
+        raise ValueError("Inputs must be stored as float32 or float64, got " + str(dtype))
+    inputs_size = num_examples * num_inputs * input_dtype.itemsize
+    with open(filename, "wb") as file:
+        file.write(EXAMPLES_HEADER.pack(EXAMPLES_MAGIC, EXAMPLES_VERSION, input_dtype.itemsize,
+                                        num_examples, num_inputs, num_outputs))
+        file.truncate(HEADER_SIZE + inputs_size + num_examples * num_outputs)
+    if num_examples == 0:
+        return
+    inputs = np.memmap(filename, dtype=input_dtype, mode="r+", offset=HEADER_SIZE,
+                       shape=(num_examples, num_inputs))
+    outputs = np.memmap(filename, dtype=np.uint8, mode="r+", offset=HEADER_SIZE + inputs_size,
+                        shape=(num_examples, num_outputs))
+    start = 0
+    for chunk_inputs, chunk_outputs in chunks:
+        stop = start + len(chunk_inputs)
+        if stop > num_examples:
+            raise ValueError("More than " + str(num_examples) + " examples given")
+        inputs[start:stop] = chunk_inputs
+        outputs[start:stop] = chunk_outputs
+        start = stop
+    if start != num_examples:
+        raise ValueError("Expected " + str(num_examples) + " examples, got " + str(start))
+    inputs.flush()
+    outputs.flush()
+    del inputs, outputs
+
+def is_binary_network_file(filename):
+    """Returns True if filename starts with the binary network magic bytes"""
+    with open(filename, "rb") as file:
+        return file.read(len(NETWORK_MAGIC)) == NETWORK_MAGIC
+
+def load_binary_weights(filename):
+    """
+    Returns memory mapped weight matrices from a binary network file
+
+    Args:
+        filename: String referring to name of binary network file
+    Returns:
+        weights: Array of read-only 2 dimensional float arrays, one per
+            non-input layer e.g. [num_nodes x (num_nodes_in_previous_layer + 1)]
+    """
+    with open(filename, "rb") as file:
+        header = file.read(NETWORK_HEADER.size)
+        if len(header) < NETWORK_HEADER.size:
+            raise ValueError("Truncated binary network file: '" + filename + "'")
+        magic, version, num_layers = NETWORK_HEADER.unpack(header)
+        if magic != NETWORK_MAGIC:
+            raise ValueError("Not a binary network file: '" + filename + "'")
+        if version != NETWORK_VERSION:
+            raise ValueError("Unsupported binary network file: '" + filename + "'")
+        layer_sizes = np.frombuffer(file.read(4 * num_layers), dtype="<u4").tolist()
+    if len(layer_sizes) != num_layers:
+        raise ValueError("Truncated binary network file: '" + filename + "'")
+    offset = NETWORK_HEADER.size + _padded_size(4 * num_layers)
+    weights = []
+    for i in range(1, num_layers):
+        shape = (layer_sizes[i], layer_sizes[i-1] + 1)
+        weights.append(np.memmap(filename, dtype=WEIGHT_DTYPE, mode="r", offset=offset,
+                                 shape=shape))
+        offset += shape[0] * shape[1] * WEIGHT_DTYPE.itemsize
+    return weights
+
+def write_binary_weights(filename, weights):
+    """
+    Writes full precision weight matrices to a binary network file
+
+    Args:
+        filename: String referring to name of binary network file
+        weights: Array of 2 dimensional float arrays, one per non-input layer
+            e.g. [num_nodes x (num_nodes_in_previous_layer + 1)]
+    """
+    layer_sizes = [weights[0].shape[1] - 1] + [len(layer_weights) for layer_weights in weights]
+    sizes = np.array(layer_sizes, dtype="<u4").tobytes()
+    with open(filename, "wb") as file:
+        file.write(NETWORK_HEADER.pack(NETWORK_MAGIC, NETWORK_VERSION, len(layer_sizes)))
+        file.write(sizes + bytes(_padded_size(len(sizes)) - len(sizes)))
+        for layer_weights in weights:
+            file.write(np.ascontiguousarray(layer_weights, dtype=WEIGHT_DTYPE).tobytes())
+
+def _padded_size(size):
+    """Returns size rounded up to a multiple of 8 bytes"""
+    return (size + 7) // 8 * 8
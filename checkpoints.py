@@ -0,0 +1,165 @@
+"""Periodic full precision training checkpoints and resuming
+
+A checkpoint is a NumPy .npz archive holding the float64 weight matrices,
+the number of completed epochs, the state of the random number generator
+used for training (if any) and any extra named arrays (e.g. optimizer
+state). Checkpoints are taken at epoch boundaries and written atomically:
+the archive is written to a temporary file that then replaces the
+checkpoint, so a job killed while saving keeps the previous checkpoint.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from training_telemetry import (
+    timer
+)
+
+def save_checkpoint(filename, weights, epoch, rng=None, extra=None):
+    """
+    Atomically writes a checkpoint
+
+    Args:
+        filename: String referring to name of checkpoint file
+        weights: Array of weight matrices (see network_to_weights)
+        epoch: Integer number of completed epochs
+        rng: np.random.Generator used for training, or None
+        extra: Dictionary of additional named arrays, or None
+    """
+    arrays = {"epoch": np.array(epoch), "num_layers": np.array(len(weights))}
+    for i, layer_weights in enumerate(weights):
+        arrays["weights_" + str(i)] = np.asarray(layer_weights, dtype=np.float64)
+    if rng is not None:
+        arrays["rng_state"] = np.array(json.dumps(rng.bit_generator.state))
+    for name, value in (extra or {}).items():
+        arrays["extra_" + name] = np.asarray(value)
+    directory = os.path.dirname(os.path.abspath(filename))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            np.savez(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def load_checkpoint(filename):
+    """
+    Returns the contents of a checkpoint as a dictionary with the keys
+    weights (array of weight matrices), epoch (integer), rng_state
+    (dictionary or None) and extra (dictionary of named arrays)
+    """
+    with np.load(filename, allow_pickle=False) as archive:
+        num_layers = int(archive["num_layers"])
+        checkpoint = {
+            "weights": [archive["weights_" + str(i)] for i in range(num_layers)],
+            "epoch": int(archive["epoch"]),
+            "rng_state": None,
+            "extra": {},
+        }
+        if "rng_state" in archive:
+            checkpoint["rng_state"] = json.loads(str(archive["rng_state"]))
+        for name in archive.files:
+            if name.startswith("extra_"):
+                checkpoint["extra"][name[len("extra_"):]] = archive[name]
+    return checkpoint
+
+class Checkpointer:
+    """
+    Training callback saving a checkpoint every every_epochs epochs and/or
+    every every_seconds seconds, and restoring training from it
+
+    Attributes:
+        filename: String referring to name of checkpoint file
+        every_epochs: Integer number of epochs between checkpoints, or None
+        every_seconds: Floating point seconds between checkpoints, or None
+        rng: np.random.Generator used for training whose state is saved, or None
+        extra_state: Function returning a dictionary of additional named
+            arrays to save, or None
+        last_epoch: Integer epoch of the last saved checkpoint, or None
+    """
+    def __init__(self, filename, every_epochs=None, every_seconds=None, rng=None,
+                 extra_state=None):
+        if every_epochs is None and every_seconds is None:
+            every_epochs = 1
+        self.filename = filename
+        self.every_epochs = every_epochs
+        self.every_seconds = every_seconds
+        self.rng = rng
+        self.extra_state = extra_state
+        self.last_epoch = None
+        self.last_time = timer()
+
+    def __call__(self, record, weights):
+        epoch = record["epoch"]
+        due = self.every_epochs is not None and epoch % self.every_epochs == 0
+        if self.every_seconds is not None and timer() - self.last_time >= self.every_seconds:
+            due = True
+        if due:
+            self.save(weights, epoch)
+        return False
+
+    def save(self, weights, epoch):
+        """Write a checkpoint of weights after epoch"""
+        extra = self.extra_state() if self.extra_state is not None else None
+        save_checkpoint(self.filename, weights, epoch, self.rng, extra)
+        self.last_epoch = epoch
+        self.last_time = timer()
+
+    def resume(self, weights):
+        """
+        Restores weights (in place) and the random number generator from the
+        checkpoint file if it exists
+
+        Returns:
+            checkpoint: Dictionary of load_checkpoint, or None if there is no
+                checkpoint to resume from (training starts at epoch 0)
+        """
+        if not os.path.exists(self.filename):
+            return None
+        checkpoint = load_checkpoint(self.filename)
+        if [layer.shape for layer in checkpoint["weights"]] != \
+                [layer.shape for layer in weights]:
+            raise ValueError("Checkpoint '" + self.filename
+                             + "' does not match the layer sizes of the network")
+        for layer_weights, saved_weights in zip(weights, checkpoint["weights"]):
+            layer_weights[...] = saved_weights
+        if self.rng is not None and checkpoint["rng_state"] is not None:
+            self.rng.bit_generator.state = checkpoint["rng_state"]
+        self.last_epoch = checkpoint["epoch"]
+        return checkpoint
+
+def prepare_checkpointing(checkpointer, weights, callbacks, resume, optimizer=None,
+                          extra_states=()):
+    """
+    Returns the epoch training starts at and the callbacks to train with when
+    checkpointing with checkpointer (None for no checkpoints). With resume,
+    weights are restored from the checkpoint file if it exists. The state of
+    optimizer (see optimizers.py), if given, and of every object of
+    extra_states (e.g. early_stopping.EarlyStopping; objects with the
+    get_state and load_state methods of an optimizer) is saved with the
+    checkpoints and restored with the weights.
+    """
+    callbacks = list(callbacks or [])
+    if checkpointer is None:
+        return 0, callbacks
+    holders = ([optimizer] if optimizer is not None else []) + list(extra_states)
+    if holders:
+        def extra_state():
+            arrays = {}
+            for holder in holders:
+                arrays.update(holder.get_state())
+            return arrays
+        checkpointer.extra_state = extra_state
+    start_epoch = 0
+    if resume:
+        checkpoint = checkpointer.resume(weights)
+        if checkpoint is not None:
+            start_epoch = checkpoint["epoch"]
+            for holder in holders:
+                holder.load_state(checkpoint["extra"], weights)
+    return start_epoch, callbacks + [checkpointer]
@@ -0,0 +1,578 @@
+"""Non-interactive command line interface for the training and testing programs
+
+Subcommands:
+    train  WEIGHTS TRAINING OUTPUT --epochs N --learning-rate LR [options]
+    test   NETWORK TESTING RESULTS [options]
+    score  NETWORK EXAMPLES [OUTPUT]
+    jobs   MANIFEST [--workers N]
+    scaling WEIGHTS TRAINING --epochs N --learning-rate LR [--worker-counts N ...]
+    precision WEIGHTS TRAINING TESTING --epochs N --learning-rate LR
+    cross-validate WEIGHTS TRAINING --folds K --epochs N --learning-rate LR
+    online NETWORK STREAM OUTPUT --learning-rate LR [--publish-rows N] [--checkpoint FILE]
+
+A job manifest lists one train/test/score command per line, written exactly
+as the arguments of this program. Blank lines and lines starting with # are
+ignored. With --workers N the jobs run in N worker processes; a line
+containing only "wait" waits for every earlier job to finish, e.g. before
+testing the networks trained above it:
+
+    train youtube.init youtube.train youtube.1.100.trained --epochs 100 --learning-rate 0.1
+    train youtube.init youtube.train youtube.1.500.trained --epochs 500 --learning-rate 0.1
+    wait
+    test youtube.1.100.trained youtube.test youtube.1.100.results
+    test youtube.1.500.trained youtube.test youtube.1.500.results
+
+Exit status is 0 on success, 1 if a command (or any job of a manifest)
+failed and 2 for invalid arguments.
+"""
+import argparse
+import json
+import shlex
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from back_prop_algorithm import (
+    back_prop_learning, prefers_node_engine
+)
+from checkpoints import (
+    Checkpointer
+)
+from cross_validation import (
+    cross_validate, format_summary
+)
+from data_parallel import (
+    data_parallel_back_prop_learning, measure_scaling
+)
+from early_stopping import (
+    early_stopping_back_prop_learning
+)
+from helper_functions import (
+    ACTIVATIONS
+)
+from metrics import (
+    confusion_counts, evaluation_report
+)
+from neural_network_programs import (
+    generate_network, load_examples, stream_examples, write_network_to_file,
+    back_prop_learning_from_file, write_statistics_to_file, DEFAULT_CHUNK_SIZE
+)
+from normalization import (
+    copy_normalization, load_network_normalization, standardize_chunks
+)
+from online_learning import (
+    online_learning, DEFAULT_MAX_UPDATE
+)
+from optimizers import (
+    LearningRateSchedule, make_optimizer, OPTIMIZERS, SCHEDULES
+)
+from precision import (
+    precision_drift, DRIFT_METRICS
+)
+from shuffling import (
+    SHUFFLE_MODES
+)
+from training_telemetry import (
+    JsonlTrainingLog
+)
+from vectorized_back_prop import (
+    network_to_weights, confusion_counts_chunks, forward_propagate_matrix,
+    output_activations_chunks, vectorized_back_prop_learning, PRECISIONS
+)
+
+class CommandError(Exception):
+    """Error of a command that should be reported without a traceback"""
+
+class ArgumentParser(argparse.ArgumentParser):
+    """Argument parser raising CommandError instead of exiting, so that bad
+    lines of a job manifest do not end the whole run"""
+    def __init__(self, *args, exit_on_error=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.raise_errors = not exit_on_error
+
+    def error(self, message):
+        if self.raise_errors:
+            raise CommandError(message)
+        super().error(message)
+
+def positive_int(text):
+    """Returns text as a positive integer for argparse"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer, got " + text)
+    return value
+
+def add_optimizer_arguments(parser):
+    """Adds the optimizer and learning rate schedule options to a subcommand parser"""
+    parser.add_argument("--optimizer", choices=list(OPTIMIZERS), default="sgd",
+                        help="weight update rule (default sgd, plain gradient descent)")
+    parser.add_argument("--momentum", type=float, default=0.9,
+                        help="momentum of the momentum and nesterov optimizers (default 0.9)")
+    parser.add_argument("--beta1", type=float, default=0.9,
+                        help="decay of the mean of the adam optimizer (default 0.9)")
+    parser.add_argument("--beta2", type=float, default=0.999,
+                        help="decay of the mean square of the adam optimizer (default 0.999)")
+    parser.add_argument("--decay", type=float, default=0.9,
+                        help="decay of the mean square of the rmsprop optimizer (default 0.9)")
+    parser.add_argument("--epsilon", type=float, default=1e-8,
+                        help="term added to root mean squares by adam and rmsprop")
+    parser.add_argument("--schedule", choices=SCHEDULES, default="constant",
+                        help="learning rate schedule (default constant)")
+    parser.add_argument("--step-size", type=positive_int, default=10,
+                        help="epochs between steps of the step schedule (default 10)")
+    parser.add_argument("--gamma", type=float, default=0.5,
+                        help="factor of the step and exponential schedules (default 0.5)")
+    parser.add_argument("--min-learning-rate", type=float, default=0.0,
+                        help="final learning rate of the cosine schedule (default 0)")
+
+def build_parser(exit_on_error=True):
+    """Returns the argument parser of the command line interface"""
+    parser = ArgumentParser(prog="main.py", exit_on_error=exit_on_error,
+                            description="Train and test neural networks.")
+    subparsers = parser.add_subparsers(dest="command", required=True,
+                                       parser_class=ArgumentParser)
+
+    train = subparsers.add_parser("train", exit_on_error=exit_on_error,
+                                  help="train a network and write the trained weights")
+    train.add_argument("weights_file", help="initial weights file (.init)")
+    train.add_argument("training_file", help="training file (.train or binary)")
+    train.add_argument("output_file", help="trained weights file to write (.nnw for binary)")
+    train.add_argument("--epochs", type=positive_int, required=True,
+                       help="number of epochs (maximum with early stopping)")
+    train.add_argument("--learning-rate", type=float, required=True)
+    train.add_argument("--batch-size", type=int, default=1,
+                       help="examples per weight update, 0 for full-batch (default 1)")
+    train.add_argument("--stream", action="store_true",
+                       help="stream the training file in chunks instead of loading it")
+    train.add_argument("--chunk-size", type=positive_int, default=DEFAULT_CHUNK_SIZE)
+    train.add_argument("--log", help="write per-epoch telemetry to this JSONL file")
+    train.add_argument("--profile", action="store_true",
+                       help="include forward/backward/update timings in the log")
+    train.add_argument("--validation-fraction", type=float,
+                       help="hold out this fraction of examples for early stopping")
+    train.add_argument("--validation-file",
+                       help="examples file used for early stopping")
+    train.add_argument("--patience", type=positive_int, default=5)
+    train.add_argument("--check-interval", type=positive_int, default=1)
+    train.add_argument("--checkpoint", help="write full precision checkpoints to this file")
+    train.add_argument("--checkpoint-every", type=positive_int,
+                       help="epochs between checkpoints (default 1 unless --checkpoint-seconds)")
+    train.add_argument("--checkpoint-seconds", type=float,
+                       help="seconds between checkpoints")
+    train.add_argument("--resume", action="store_true",
+                       help="continue from the checkpoint file if it exists")
+    train.add_argument("--workers", type=positive_int,
+                       help="train data-parallel in this many worker processes")
+    train.add_argument("--hogwild", action="store_true",
+                       help="with --workers, update the shared weights asynchronously")
+    train.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid",
+                       help="hidden layer activation function (default sigmoid)")
+    train.add_argument("--precision", choices=list(PRECISIONS), default="float64",
+                       help="floating point type of weights and examples (default float64)")
+    add_optimizer_arguments(train)
+    train.add_argument("--shuffle", choices=SHUFFLE_MODES, default="none",
+                       help="order of the examples in every epoch: none (file order), "
+                            "random, or stratified to spread every class evenly")
+    train.add_argument("--seed", type=int, default=0,
+                       help="seed of the shuffled orders and of the validation holdout")
+    train.add_argument("--normalization",
+                       help="standardization statistics of the training file (written by "
+                            "dataset_builder.py) to keep next to the output file")
+    train.add_argument("--quiet", action="store_true", help="do not print every epoch")
+    train.set_defaults(run=run_train)
+
+    test = subparsers.add_parser("test", exit_on_error=exit_on_error,
+                                 help="test a network and write the results file")
+    test.add_argument("network_file", help="trained weights file")
+    test.add_argument("testing_file", help="testing file (.test or binary)")
+    test.add_argument("results_file", help="results file to write")
+    test.add_argument("--stream", action="store_true",
+                      help="stream the testing file in chunks instead of loading it")
+    test.add_argument("--chunk-size", type=positive_int, default=DEFAULT_CHUNK_SIZE)
+    test.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid",
+                      help="activation the network was trained with; sigmoid_table for a "
+                           "faster approximate sigmoid")
+    test.add_argument("--precision", choices=list(PRECISIONS), default="float64")
+    test.add_argument("--raw", action="store_true",
+                      help="inputs are raw feature values, standardize them with the "
+                           "statistics kept next to the network file")
+    test.add_argument("--report",
+                      help="also write a JSON report with metrics at --thresholds, ROC and "
+                           "precision-recall curves and their areas (see metrics.py)")
+    test.add_argument("--thresholds", type=float, nargs="+", default=[0.5],
+                      help="thresholds of the metrics of --report (default 0.5)")
+    test.add_argument("--no-curves", action="store_true",
+                      help="leave the curve points out of --report, keeping the areas")
+    test.set_defaults(run=run_test)
+
+    score = subparsers.add_parser("score", exit_on_error=exit_on_error,
+                                  help="write the output activations of every example")
+    score.add_argument("network_file", help="trained weights file")
+    score.add_argument("examples_file", help="examples file (.test, .train or binary)")
+    score.add_argument("output_file", nargs="?", default="-",
+                       help="file to write, standard output if omitted or -")
+    score.add_argument("--chunk-size", type=positive_int, default=DEFAULT_CHUNK_SIZE)
+    score.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid",
+                       help="activation the network was trained with; sigmoid_table for a "
+                            "faster approximate sigmoid")
+    score.add_argument("--precision", choices=list(PRECISIONS), default="float64")
+    score.add_argument("--raw", action="store_true",
+                       help="inputs are raw feature values, standardize them with the "
+                            "statistics kept next to the network file")
+    score.set_defaults(run=run_score)
+
+    jobs = subparsers.add_parser("jobs", exit_on_error=exit_on_error,
+                                 help="run the train/test/score jobs of a manifest file")
+    jobs.add_argument("manifest_file")
+    jobs.add_argument("--workers", type=positive_int, default=1,
+                      help="number of worker processes (default 1, jobs run in order)")
+    jobs.set_defaults(run=run_jobs)
+
+    scaling = subparsers.add_parser("scaling", exit_on_error=exit_on_error,
+                                    help="report data-parallel speedup per number of workers")
+    scaling.add_argument("weights_file", help="initial weights file (.init)")
+    scaling.add_argument("training_file", help="training file (.train or binary)")
+    scaling.add_argument("--epochs", type=positive_int, required=True)
+    scaling.add_argument("--learning-rate", type=float, required=True)
+    scaling.add_argument("--batch-size", type=int, default=0,
+                         help="examples per weight update, 0 for full-batch (default 0)")
+    scaling.add_argument("--worker-counts", type=positive_int, nargs="+",
+                         help="numbers of workers to measure (default powers of 2 up to "
+                              "the number of cores)")
+    scaling.add_argument("--hogwild", action="store_true",
+                         help="measure asynchronous instead of synchronous updates")
+    scaling.set_defaults(run=run_scaling)
+
+    precision = subparsers.add_parser("precision", exit_on_error=exit_on_error,
+                                      help="report accuracy drift of float32 against float64")
+    precision.add_argument("weights_file", help="initial weights file (.init)")
+    precision.add_argument("training_file", help="training file (.train or binary)")
+    precision.add_argument("testing_file", help="testing file (.test or binary)")
+    precision.add_argument("--epochs", type=positive_int, required=True)
+    precision.add_argument("--learning-rate", type=float, required=True)
+    precision.add_argument("--batch-size", type=positive_int, default=1)
+    precision.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid")
+    precision.set_defaults(run=run_precision)
+
+    cross_validate = subparsers.add_parser("cross-validate", exit_on_error=exit_on_error,
+                                           help="k-fold cross-validation of a training file")
+    cross_validate.add_argument("weights_file", help="initial weights file (.init)")
+    cross_validate.add_argument("training_file", help="training file (.train or binary)")
+    cross_validate.add_argument("--folds", type=positive_int, default=5,
+                                help="number of folds k (default 5)")
+    cross_validate.add_argument("--epochs", type=positive_int, required=True)
+    cross_validate.add_argument("--learning-rate", type=float, required=True)
+    cross_validate.add_argument("--batch-size", type=int, default=1,
+                                help="examples per weight update, 0 for full batch (default 1)")
+    cross_validate.add_argument("--workers", type=positive_int,
+                                help="processes training folds at the same time "
+                                     "(default one per fold, at most one per core)")
+    cross_validate.add_argument("--stratified", action="store_true",
+                                help="give every fold the class proportions of the file")
+    cross_validate.add_argument("--seed", type=int, default=0,
+                                help="seed of the folds and of shuffled orders")
+    cross_validate.add_argument("--shuffle", choices=SHUFFLE_MODES, default="none")
+    cross_validate.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid")
+    add_optimizer_arguments(cross_validate)
+    cross_validate.add_argument("--results-prefix",
+                                help="write the results of fold i to PREFIX.fold<i>.results")
+    cross_validate.add_argument("--json", help="write the summary to this JSON file")
+    cross_validate.set_defaults(run=run_cross_validate)
+
+    online = subparsers.add_parser("online", exit_on_error=exit_on_error,
+                                   help="keep training a network on examples appended to a "
+                                        "file and publish it at intervals")
+    online.add_argument("network_file", help="trained network file (.trained or binary)")
+    online.add_argument("stream", help="file examples are appended to, one .train line per "
+                                       "example, or - for standard input")
+    online.add_argument("output_file", help="weights file to publish (full precision for "
+                                            ".nnw)")
+    online.add_argument("--learning-rate", type=float, required=True)
+    online.add_argument("--batch-size", type=positive_int, default=1,
+                        help="examples per weight update (default 1)")
+    online.add_argument("--max-update", type=float, default=DEFAULT_MAX_UPDATE,
+                        help="maximum L2 norm of the weight update of a batch, 0 for "
+                             "unbounded updates (default " + str(DEFAULT_MAX_UPDATE) + ")")
+    online.add_argument("--publish-rows", type=positive_int, default=1000,
+                        help="examples learned from between publishes (default 1000)")
+    online.add_argument("--publish-seconds", type=float,
+                        help="also publish after this many seconds with new examples")
+    online.add_argument("--checkpoint",
+                        help="save the weights and stream position at every publish and "
+                             "resume from this file if it exists")
+    online.add_argument("--from-start", action="store_true",
+                        help="also learn from the examples already in the stream file")
+    online.add_argument("--raw", action="store_true",
+                        help="examples hold raw features, standardize them with the "
+                             "statistics kept next to the network")
+    online.add_argument("--poll-interval", type=float, default=1.0,
+                        help="seconds between checks for new examples (default 1)")
+    online.add_argument("--idle-timeout", type=float,
+                        help="stop after this many seconds without new examples "
+                             "(default follow the stream forever)")
+    online.add_argument("--max-rows", type=positive_int,
+                        help="stop after learning from this many examples")
+    online.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid")
+    online.add_argument("--log", help="append a JSON record of every publish to this file")
+    online.add_argument("--quiet", action="store_true", help="do not print publishes")
+    online.set_defaults(run=run_online)
+    return parser
+
+def run_train(args):
+    """Trains a network as described by the train subcommand arguments"""
+    network = generate_network(args.weights_file)
+    batch_size = None if args.batch_size == 0 else args.batch_size
+    if batch_size is not None and batch_size < 0:
+        raise CommandError("batch size must not be negative")
+    callbacks = []
+    if args.log:
+        callbacks.append(JsonlTrainingLog(args.log, args.profile))
+    early_stopping = args.validation_fraction is not None or args.validation_file is not None
+    checkpointer = None
+    if args.checkpoint:
+        checkpointer = Checkpointer(args.checkpoint, args.checkpoint_every,
+                                    args.checkpoint_seconds)
+    elif args.resume:
+        raise CommandError("--resume needs --checkpoint")
+    if args.hogwild and args.workers is None:
+        raise CommandError("--hogwild needs --workers")
+    if args.workers is not None and (args.stream or early_stopping):
+        raise CommandError("--workers is not supported with --stream or early stopping")
+    if args.workers is not None and args.precision != "float64":
+        raise CommandError("data-parallel training only supports --precision float64")
+    optimizer, schedule = make_training_optimizer(args)
+    if args.workers is not None and (optimizer is not None or schedule is not None
+                                     or args.shuffle != "none"):
+        raise CommandError("data-parallel training only supports --optimizer sgd with "
+                           "--schedule constant and --shuffle none")
+    dtype = PRECISIONS[args.precision]
+    if args.stream:
+        if early_stopping:
+            raise CommandError("early stopping is not supported with --stream")
+        back_prop_learning_from_file(args.training_file, network, args.learning_rate,
+                                     args.epochs, batch_size, args.chunk_size, callbacks,
+                                     not args.quiet, checkpointer, args.resume, args.activation,
+                                     dtype, optimizer, schedule, args.shuffle, args.seed)
+    elif early_stopping:
+        validation_examples = None
+        if args.validation_file is not None:
+            validation_examples = load_examples(args.validation_file, dtype)
+        early_stopping_back_prop_learning(
+            load_examples(args.training_file, dtype), network, args.learning_rate, args.epochs,
+            batch_size, args.validation_fraction or 0.2, validation_examples,
+            args.patience, args.check_interval, seed=args.seed, callbacks=callbacks,
+            verbose=not args.quiet, activation=args.activation, dtype=dtype,
+            optimizer=optimizer, schedule=schedule, shuffle=args.shuffle,
+            checkpointer=checkpointer, resume=args.resume)
+    elif args.workers is not None:
+        data_parallel_back_prop_learning(load_examples(args.training_file), network,
+                                         args.learning_rate, args.epochs, batch_size,
+                                         args.workers, "hogwild" if args.hogwild else "sync",
+                                         callbacks, not args.quiet, checkpointer, args.resume,
+                                         args.activation)
+    elif batch_size == 1 and not callbacks and checkpointer is None \
+            and args.activation == "sigmoid" and args.precision == "float64" \
+            and optimizer is None and schedule is None and prefers_node_engine(network):
+        # Small networks train faster one example at a time with the Node engine
+        inputs, outputs = load_examples(args.training_file)
+        back_prop_learning((inputs.tolist(), outputs.tolist()), network, args.learning_rate,
+                           args.epochs, shuffle=args.shuffle, seed=args.seed,
+                           verbose=not args.quiet)
+    else:
+        vectorized_back_prop_learning(load_examples(args.training_file, dtype), network,
+                                      args.learning_rate, args.epochs, batch_size, callbacks,
+                                      not args.quiet, checkpointer, args.resume, args.activation,
+                                      dtype, optimizer, schedule, args.shuffle, args.seed)
+    write_network_to_file(args.output_file, network)
+    if args.normalization is not None:
+        copy_normalization(args.normalization, args.output_file)
+
+def make_training_optimizer(args):
+    """Returns the optimizer and learning rate schedule of the train
+    subcommand arguments, None for plain gradient descent and a constant
+    learning rate"""
+    parameters = {
+        "sgd": {},
+        "momentum": {"momentum": args.momentum},
+        "nesterov": {"momentum": args.momentum},
+        "rmsprop": {"decay": args.decay, "epsilon": args.epsilon},
+        "adam": {"beta1": args.beta1, "beta2": args.beta2, "epsilon": args.epsilon},
+    }[args.optimizer]
+    optimizer = None if args.optimizer == "sgd" else make_optimizer(args.optimizer,
+                                                                    **parameters)
+    schedule = None
+    if args.schedule != "constant":
+        schedule = LearningRateSchedule(args.schedule, args.step_size, args.gamma,
+                                        args.min_learning_rate)
+    return optimizer, schedule
+
+def run_test(args):
+    """Tests a network as described by the test subcommand arguments"""
+    weights = network_to_weights(generate_network(args.network_file), PRECISIONS[args.precision])
+    if args.stream:
+        chunks = stream_examples(args.testing_file, args.chunk_size)
+    else:
+        inputs, outputs = load_examples(args.testing_file, PRECISIONS[args.precision])
+        chunks = ((inputs[start:start + args.chunk_size], outputs[start:start + args.chunk_size])
+                  for start in range(0, len(inputs), args.chunk_size))
+    if args.raw:
+        chunks = standardize_chunks(chunks, *load_network_normalization(args.network_file))
+    if args.report is None:
+        a, b, c, d = confusion_counts_chunks(weights, chunks, args.activation)
+    else:
+        scores, expected = output_activations_chunks(weights, chunks, args.activation)
+        a, b, c, d = confusion_counts(scores >= 0.5, expected)
+        with open(args.report, "w+") as file:
+            json.dump(evaluation_report(scores, expected, args.thresholds, not args.no_curves),
+                      file, indent=2)
+            file.write("\n")
+    write_statistics_to_file(args.results_file, a.tolist(), b.tolist(), c.tolist(), d.tolist())
+
+def run_score(args):
+    """Writes output activations as described by the score subcommand arguments"""
+    dtype = PRECISIONS[args.precision]
+    weights = network_to_weights(generate_network(args.network_file), dtype)
+    chunks = stream_examples(args.examples_file, args.chunk_size)
+    if args.raw:
+        chunks = standardize_chunks(chunks, *load_network_normalization(args.network_file))
+    file = sys.stdout if args.output_file == "-" else open(args.output_file, "w+")
+    try:
+        for inputs, _ in chunks:
+            inputs = inputs.astype(dtype, copy=False)
+            for row in forward_propagate_matrix(weights, inputs, args.activation)[-1]:
+                file.write(" ".join("{0:.6f}".format(value) for value in row) + "\n")
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+def run_scaling(args):
+    """Prints the data-parallel scaling report described by the scaling subcommand arguments"""
+    batch_size = None if args.batch_size == 0 else args.batch_size
+    if batch_size is not None and batch_size < 0:
+        raise CommandError("batch size must not be negative")
+    inputs, outputs = load_examples(args.training_file)
+    weights = network_to_weights(generate_network(args.weights_file))
+    results = measure_scaling(inputs, outputs, weights, args.learning_rate, args.epochs,
+                              batch_size, args.worker_counts,
+                              "hogwild" if args.hogwild else "sync")
+    print("{0:>8} {1:>10} {2:>14} {3:>8} {4:>11}".format(
+        "workers", "seconds", "examples/s", "speedup", "efficiency"))
+    for result in results:
+        workers = "serial" if result["workers"] == 0 else str(result["workers"])
+        print("{0:>8} {1:>10.3f} {2:>14.1f} {3:>8.2f} {4:>11.2f}".format(
+            workers, result["seconds"], result["examples_per_second"], result["speedup"],
+            result["efficiency"]))
+
+def run_precision(args):
+    """Prints the float32 drift report described by the precision subcommand arguments"""
+    weights = network_to_weights(generate_network(args.weights_file))
+    drift = precision_drift(weights, args.training_file, args.testing_file, args.learning_rate,
+                            args.epochs, args.batch_size, args.activation)
+    print("{0:<28} {1:>10} {2:>10} {3:>10}".format("", "float64", "float32", "drift"))
+    for metric in DRIFT_METRICS:
+        values = [drift["float64"][metric], drift["float32"][metric], drift[metric + "_drift"]]
+        print("{0:<28} ".format(metric) + " ".join("{0:>10.6f}".format(value)
+                                                   for value in values))
+    print("{0:<28} {1:>10} {2:>10}".format("memory_bytes", drift["float64"]["memory_bytes"],
+                                           drift["float32"]["memory_bytes"]))
+    print("max weight difference: " + "{0:.3g}".format(drift["max_weight_difference"]))
+    print("max output difference: " + "{0:.3g}".format(drift["max_output_difference"]))
+    print("prediction agreement:  " + "{0:.4%}".format(drift["prediction_agreement"]))
+
+def run_cross_validate(args):
+    """Prints the report of the cross-validate subcommand arguments"""
+    batch_size = None if args.batch_size == 0 else args.batch_size
+    if batch_size is not None and batch_size < 0:
+        raise CommandError("batch size must not be negative")
+    optimizer, schedule = make_training_optimizer(args)
+    weights = network_to_weights(generate_network(args.weights_file))
+    inputs, outputs = load_examples(args.training_file)
+    summary = cross_validate(inputs, outputs, weights, args.learning_rate, args.epochs,
+                             args.folds, batch_size, args.workers, args.seed, args.stratified,
+                             args.activation, optimizer, schedule, args.shuffle,
+                             args.results_prefix)
+    for line in format_summary(summary):
+        print(line)
+    if args.json:
+        with open(args.json, "w+") as file:
+            json.dump(summary, file, indent=2)
+            file.write("\n")
+
+def run_online(args):
+    """Trains a network on appended examples as described by the online subcommand arguments"""
+    callbacks = [JsonlTrainingLog(args.log)] if args.log else []
+    online_learning(args.network_file, args.stream, args.output_file, args.learning_rate,
+                    args.batch_size, args.max_update or None, args.publish_rows,
+                    args.publish_seconds, args.checkpoint, args.from_start, args.raw,
+                    args.poll_interval, args.idle_timeout, args.max_rows, callbacks,
+                    not args.quiet, args.activation)
+
+def read_manifest(filename):
+    """
+    Returns the stages of a job manifest, each an array of (line number,
+    argument list) jobs that may run concurrently
+    """
+    stages = [[]]
+    with open(filename, "r") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line == "wait":
+                stages.append([])
+                continue
+            stages[-1].append((line_number, shlex.split(line)))
+    return [stage for stage in stages if stage]
+
+def run_job(argv):
+    """Runs one manifest job, returns (exit status, error message)"""
+    try:
+        args = build_parser(exit_on_error=False).parse_args(argv)
+        if args.command == "jobs":
+            raise CommandError("manifests cannot contain jobs commands")
+        args.run(args)
+    except (CommandError, OSError, ValueError, StopIteration) as error:
+        return 1, describe_error(error)
+    return 0, None
+
+def run_jobs(args):
+    """Runs the jobs of a manifest file, raising CommandError if any job failed"""
+    stages = read_manifest(args.manifest_file)
+    failures = 0
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    try:
+        for stage in stages:
+            argvs = [argv for _, argv in stage]
+            if executor is None:
+                results = map(run_job, argvs)
+            else:
+                results = executor.map(run_job, argvs)
+            for (line_number, argv), (status, message) in zip(stage, results):
+                if status:
+                    failures += 1
+                    print("Job on line " + str(line_number) + " failed (" + " ".join(argv)
+                          + "): " + message, file=sys.stderr)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    if failures:
+        raise CommandError(str(failures) + " of " + str(sum(len(stage) for stage in stages))
+                           + " jobs failed")
+
+def describe_error(error):
+    """Returns a one line description of an error"""
+    if isinstance(error, StopIteration):
+        return "file ended before all examples or weights were read"
+    return str(error)
+
+def main(argv=None):
+    """Runs the command line interface, returns the exit status"""
+    args = build_parser().parse_args(argv)
+    try:
+        args.run(args)
+    except (CommandError, OSError, ValueError, StopIteration) as error:
+        print("error: " + describe_error(error), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
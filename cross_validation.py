@@ -0,0 +1,181 @@
+"""k-fold cross-validation
+
+The examples of a training file are split into k folds by index: a seeded
+permutation of the row numbers (stratified so that every fold gets the
+class proportions of the whole file, if asked) is cut into k contiguous
+parts. Model i is trained from the same initial weights on every fold but
+fold i and tested on fold i.
+
+The examples are placed once in shared memory (see
+data_parallel.SharedArrays) and the k models are trained in worker
+processes that gather chunks of rows of their folds from it by index, so
+the dataset is not copied per fold. The confusion matrices and the metrics
+of compute_statistics (as written by write_statistics_to_file) of the folds
+are summarised as mean and standard deviation over the folds.
+"""
+import copy
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_parallel import (
+    SharedArrays
+)
+from neural_network_programs import (
+    compute_statistics, write_statistics_to_file
+)
+from shuffling import (
+    check_shuffle, class_indices, stratified_order, shuffled_chunks
+)
+from vectorized_back_prop import (
+    check_batch_size, confusion_counts_chunks, shuffled_chunk_source, train_weights_streaming
+)
+
+# Metrics of compute_statistics summarised over the folds
+FOLD_METRICS = ("micro_avg_overall_accuracy", "micro_avg_precision", "micro_avg_recall",
+                "micro_avg_f_1", "macro_avg_overall_accuracy", "macro_avg_precision",
+                "macro_avg_recall", "macro_avg_f_1")
+
+def fold_indices(outputs, num_folds, seed=0, stratified=False):
+    """
+    Returns the row indices of every fold, each in increasing row order
+
+    Args:
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        num_folds: Integer number of folds, at least 2
+        seed: Integer seed of the assignment of rows to folds
+        stratified: Boolean, give every fold the class proportions of outputs
+    """
+    num_examples = len(outputs)
+    if not 2 <= num_folds <= num_examples:
+        raise ValueError("Number of folds must be between 2 and the number of examples ("
+                         + str(num_examples) + "), got " + str(num_folds))
+    rng = np.random.default_rng(seed)
+    if stratified:
+        # Every stretch of a stratified order has the class proportions of the file
+        order = stratified_order(class_indices(outputs), rng)
+    else:
+        order = rng.permutation(num_examples)
+    bounds = [num_examples * fold // num_folds for fold in range(num_folds + 1)]
+    return [np.sort(order[bounds[fold]:bounds[fold + 1]]) for fold in range(num_folds)]
+
+def _train_fold(fold, folds, name, shapes, weights, learning_rate, num_epochs, batch_size,
+                activation, optimizer, schedule, shuffle, seed):
+    """Trains on every fold but fold, returns the confusion matrix values of
+    fold (run in a worker process)"""
+    examples = SharedArrays(shapes, name)
+    try:
+        inputs, outputs = examples.arrays
+        training_rows = np.sort(np.concatenate(folds[:fold] + folds[fold + 1:]))
+        # Full-batch gradient descent uses every training row of this fold
+        batch_size = check_batch_size(batch_size, len(training_rows))
+        chunk_source = shuffled_chunk_source(inputs, outputs, shuffle,
+                                             np.random.default_rng([seed, fold]), training_rows)
+        weights = [layer_weights.copy() for layer_weights in weights]
+        train_weights_streaming(chunk_source, weights, learning_rate, num_epochs, batch_size,
+                                verbose=False, activation=activation,
+                                optimizer=copy.deepcopy(optimizer), schedule=schedule)
+        a, b, c, d = confusion_counts_chunks(
+            weights, shuffled_chunks(inputs, outputs, folds[fold]), activation)
+        return a.tolist(), b.tolist(), c.tolist(), d.tolist()
+    finally:
+        examples.close()
+
+def summarize_folds(fold_counts):
+    """
+    Returns the metrics of every fold and their mean and standard deviation
+
+    Args:
+        fold_counts: Array of (a, b, c, d) confusion matrix values per fold
+
+    Returns:
+        summary: Dictionary with folds (per fold a dictionary of a, b, c, d
+            and the FOLD_METRICS), mean and std (dictionaries of the
+            FOLD_METRICS over the folds) and total (a, b, c, d summed over
+            the folds)
+    """
+    folds = []
+    for a, b, c, d in fold_counts:
+        fold = {"a": a, "b": b, "c": c, "d": d}
+        statistics = compute_statistics(a, b, c, d)
+        fold.update({metric: statistics[metric] for metric in FOLD_METRICS})
+        folds.append(fold)
+    summary = {"folds": folds, "mean": {}, "std": {}}
+    for metric in FOLD_METRICS:
+        values = [fold[metric] for fold in folds]
+        summary["mean"][metric] = float(np.mean(values))
+        summary["std"][metric] = float(np.std(values))
+    summary["total"] = {key: np.sum([fold[key] for fold in folds], axis=0).tolist()
+                        for key in ("a", "b", "c", "d")}
+    return summary
+
+def cross_validate(inputs, outputs, weights, learning_rate, num_epochs, num_folds=5,
+                   batch_size=1, num_workers=None, seed=0, stratified=False,
+                   activation="sigmoid", optimizer=None, schedule=None, shuffle="none",
+                   results_prefix=None):
+    """
+    Returns the summary of k-fold cross-validation (see summarize_folds)
+
+    Args:
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        weights: Array of initial weight matrices (see network_to_weights)
+            every fold is trained from, not modified
+        learning_rate: Floating point number
+        num_epochs: Integer
+        num_folds: Integer number of folds k
+        batch_size: Integer number of examples per weight update, None for
+            full-batch gradient descent
+        num_workers: Integer number of processes training folds at the same
+            time, None for one per fold (at most one per core)
+        seed: Integer seed of the folds and of shuffled orders
+        stratified: Boolean, give every fold the class proportions of outputs
+        activation: String name of the hidden layer activation function
+        optimizer: Optimizer (see optimizers.py), copied for every fold, None
+            for plain gradient descent
+        schedule: LearningRateSchedule, None for a constant learning rate
+        shuffle: String order of the training examples in every epoch (see
+            shuffling.py)
+        results_prefix: String, write the results of fold i to
+            results_prefix + ".fold<i>.results" (see write_statistics_to_file),
+            None to write no files
+    """
+    check_shuffle(shuffle)
+    folds = fold_indices(outputs, num_folds, seed, stratified)
+    if batch_size is not None:
+        check_batch_size(batch_size, len(inputs))
+    if num_workers is None:
+        num_workers = min(num_folds, os.cpu_count())
+    weights = [np.asarray(layer_weights, dtype=np.float64) for layer_weights in weights]
+    examples = SharedArrays([np.shape(inputs), np.shape(outputs)])
+    try:
+        examples.arrays[0][...] = inputs
+        examples.arrays[1][...] = outputs
+        with ProcessPoolExecutor(num_workers) as executor:
+            futures = [executor.submit(_train_fold, fold, folds, examples.name, examples.shapes,
+                                       weights, learning_rate, num_epochs, batch_size,
+                                       activation, optimizer, schedule, shuffle, seed)
+                       for fold in range(num_folds)]
+            fold_counts = [future.result() for future in futures]
+    finally:
+        examples.close()
+        examples.unlink()
+    summary = summarize_folds(fold_counts)
+    if results_prefix is not None:
+        for i, (a, b, c, d) in enumerate(fold_counts):
+            write_statistics_to_file(results_prefix + ".fold" + str(i + 1) + ".results",
+                                     a, b, c, d)
+    return summary
+
+def format_summary(summary):
+    """Returns the lines of a cross-validation report"""
+    lines = []
+    for i, fold in enumerate(summary["folds"]):
+        counts = " ".join(str(sum(fold[key])) for key in ("a", "b", "c", "d"))
+        metrics = " ".join("{0:.3f}".format(fold[metric]) for metric in FOLD_METRICS[:4])
+        lines.append("fold " + str(i + 1) + ": " + counts + " " + metrics)
+    for metric in FOLD_METRICS:
+        lines.append(metric + " " + "{0:.3f} +/- {1:.3f}".format(summary["mean"][metric],
+                                                                 summary["std"][metric]))
+    return lines
@@ -0,0 +1,348 @@
+"""Data-parallel training across worker processes
+
+The weights, the training examples and one gradient buffer per worker are
+placed in shared memory once, so nothing is pickled while training.
+
+Synchronous mode ("sync"): every batch of batch_size examples is split into
+num_workers contiguous shards. Each worker computes the summed weight
+updates of its shard into its gradient buffer, the main process adds the
+buffers and updates the shared weights once per batch. This gives the same
+weights as train_weights with the same batch size (up to the order in
+which floating point sums are accumulated).
+
+Asynchronous mode ("hogwild"): the examples are split into num_workers
+shards and each worker trains on its own shard with train_epoch, updating
+the shared weights in place without locks (Hogwild!). Updates of different
+workers may overwrite each other, which trades exactness for throughput.
+
+In both modes the workers meet at the end of every epoch so that the main
+process can run the epoch callbacks (see training_telemetry.py). A worker
+that fails (or is killed, e.g. by the out-of-memory killer) breaks the
+barrier, so training stops with RuntimeError instead of waiting forever.
+
+Synchronisation costs two barrier waits per batch in synchronous mode, so it
+pays off for large batches and wide networks; measure_scaling reports the
+speedup and efficiency for a range of worker counts.
+"""
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from checkpoints import (
+    prepare_checkpointing
+)
+from helper_functions import (
+    get_activation
+)
+from training_telemetry import (
+    EpochStatistics, run_callbacks, timer
+)
+from vectorized_back_prop import (
+    network_to_weights, copy_weights_to_network, check_batch_size, compute_gradients,
+    train_epoch, train_weights
+)
+
+PARALLEL_MODES = ("sync", "hogwild")
+
+# Seconds between checks of the watcher thread whether training has ended
+WATCH_INTERVAL = 0.1
+
+class SharedArrays:
+    """
+    Arrays of given shapes placed one after another in one shared memory block
+
+    Attributes:
+        name: String name of the shared memory block
+        shapes: Array of array shapes
+    """
+    def __init__(self, shapes, name=None):
+        self.shapes = [tuple(shape) for shape in shapes]
+        size = max(sum(int(np.prod(shape)) for shape in self.shapes), 1) * 8
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.arrays = []
+        offset = 0
+        for shape in self.shapes:
+            self.arrays.append(np.ndarray(shape, dtype=np.float64, buffer=self.memory.buf,
+                                          offset=offset))
+            offset += int(np.prod(shape)) * 8
+
+    def close(self):
+        """Detach from the shared memory block"""
+        self.arrays = []
+        self.memory.close()
+
+    def unlink(self):
+        """Free the shared memory block (once every process has closed it)"""
+        self.memory.unlink()
+
+def shard_bounds(start, stop, shard, num_shards):
+    """Returns the rows [lo, hi) of shard out of num_shards of rows [start, stop)"""
+    size = stop - start
+    return (start + size * shard // num_shards, start + size * (shard + 1) // num_shards)
+
+def _worker(worker, num_workers, names, shapes, learning_rate, num_epochs, batch_size, mode,
+            activation, barrier, stop):
+    """Training loop of one worker process"""
+    attached = []
+    try:
+        for key, key_shapes in (("weights", shapes["weights"]),
+                                ("gradients", shapes["gradients"] * num_workers),
+                                ("examples", shapes["examples"]),
+                                ("losses", [(num_workers,)])):
+            attached.append(SharedArrays(key_shapes, names[key]))
+        weights, gradients, examples, losses = attached
+        num_layers = len(shapes["weights"])
+        own_gradients = gradients.arrays[worker * num_layers:(worker + 1) * num_layers]
+        inputs, outputs = examples.arrays
+        num_examples = len(inputs)
+        for _ in range(num_epochs):
+            statistics = EpochStatistics()
+            if mode == "sync":
+                for batch_start in range(0, num_examples, batch_size):
+                    lo, hi = shard_bounds(batch_start, min(batch_start + batch_size, num_examples),
+                                          worker, num_workers)
+                    if hi > lo:
+                        shard_gradients = compute_gradients(weights.arrays, inputs[lo:hi],
+                                                            outputs[lo:hi], statistics,
+                                                            activation)
+                        for buffer, layer_gradients in zip(own_gradients, shard_gradients):
+                            buffer[...] = layer_gradients
+                    else:
+                        for buffer in own_gradients:
+                            buffer.fill(0)
+                    # Gradients ready, then wait for the main process to update weights
+                    barrier.wait()
+                    barrier.wait()
+            else:
+                lo, hi = shard_bounds(0, num_examples, worker, num_workers)
+                train_epoch([(inputs[lo:hi], outputs[lo:hi])], weights.arrays, learning_rate,
+                            batch_size, statistics, activation)
+            losses.arrays[0][worker] = statistics.loss_sum
+            # Epoch done, then wait for the main process to run the callbacks
+            barrier.wait()
+            barrier.wait()
+            if stop.value:
+                break
+    except Exception:
+        barrier.abort()
+        raise
+    finally:
+        for shared_array in attached:
+            shared_array.close()
+
+def _watch_workers(workers, barrier, done):
+    """Aborts barrier, failing the waits of the main process, as soon as a
+    worker process exits with an error (an exception or a signal)"""
+    sentinels = {worker.sentinel: worker for worker in workers}
+    while sentinels and not done.is_set():
+        for sentinel in multiprocessing.connection.wait(list(sentinels), WATCH_INTERVAL):
+            if sentinels.pop(sentinel).exitcode != 0:
+                barrier.abort()
+                return
+
+def data_parallel_train_weights(inputs, outputs, weights, learning_rate, num_epochs,
+                                batch_size=None, num_workers=None, mode="sync",
+                                verbose=True, callbacks=None, start_epoch=0,
+                                activation="sigmoid"):
+    """
+    Returns weight matrices after training them in num_workers processes
+
+    Args:
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        weights: Array of weight matrices (see network_to_weights), updated
+            in place
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update (split across
+            the workers in sync mode, at least num_workers, per worker in
+            hogwild mode), None for full-batch in sync mode. Defaults to 1 in
+            hogwild mode
+        num_workers: Integer number of worker processes, None for all cores
+        mode: "sync" or "hogwild"
+        verbose: Boolean, print a line after every completed epoch
+        callbacks: Array of functions called with the record of every epoch
+            (see training_telemetry.py)
+        start_epoch: Integer number of epochs already completed (when
+            resuming), training runs epochs start_epoch + 1 to num_epochs
+        activation: String name of the hidden layer activation function
+
+    Returns:
+        weights: Array of weight matrices
+    """
+    if mode not in PARALLEL_MODES:
+        raise ValueError("Parallel mode must be one of " + ", ".join(PARALLEL_MODES)
+                         + ", got '" + str(mode) + "'")
+    get_activation(activation)
+    inputs = np.asarray(inputs, dtype=np.float64)
+    outputs = np.asarray(outputs, dtype=np.float64)
+    num_examples = len(inputs)
+    num_workers = num_workers or os.cpu_count()
+    if mode == "hogwild" and batch_size is None:
+        batch_size = 1
+    batch_size = check_batch_size(batch_size, num_examples)
+    if mode == "sync" and batch_size < min(num_workers, num_examples):
+        # Every batch costs two barrier waits: batches smaller than the number of
+        # workers leave workers idle and train far slower than one process
+        raise ValueError("Synchronous data-parallel training needs a batch size of at least "
+                         "the number of workers (" + str(num_workers) + "), got "
+                         + str(batch_size) + "; use a large batch size or None for "
+                         "full-batch gradient descent")
+    callbacks = list(callbacks or [])
+
+    shapes = {
+        "weights": [layer_weights.shape for layer_weights in weights],
+        "gradients": [layer_weights.shape for layer_weights in weights],
+        "examples": [inputs.shape, outputs.shape],
+    }
+    shared_weights = SharedArrays(shapes["weights"])
+    shared_gradients = SharedArrays(shapes["gradients"] * num_workers)
+    shared_examples = SharedArrays(shapes["examples"])
+    shared_losses = SharedArrays([(num_workers,)])
+    shared = [shared_weights, shared_gradients, shared_examples, shared_losses]
+    names = {"weights": shared_weights.name, "gradients": shared_gradients.name,
+             "examples": shared_examples.name, "losses": shared_losses.name}
+    for shared_array, array in zip(shared_weights.arrays + shared_examples.arrays,
+                                   list(weights) + [inputs, outputs]):
+        shared_array[...] = array
+
+    context = multiprocessing.get_context()
+    barrier = context.Barrier(num_workers + 1)
+    stop = context.Value("b", 0)
+    workers = [context.Process(target=_worker, daemon=True,
+                               args=(worker, num_workers, names, shapes, learning_rate,
+                                     num_epochs - start_epoch, batch_size, mode, activation,
+                                     barrier, stop))
+               for worker in range(num_workers)]
+    num_layers = len(weights)
+    done = threading.Event()
+    try:
+        for worker in workers:
+            worker.start()
+        threading.Thread(target=_watch_workers, args=(workers, barrier, done),
+                         daemon=True).start()
+        training_start = timer()
+        for epoch in range(start_epoch, num_epochs):
+            epoch_start = timer()
+            if mode == "sync":
+                for batch_start in range(0, num_examples, batch_size):
+                    num_rows = min(batch_size, num_examples - batch_start)
+                    barrier.wait()
+                    for i, layer_weights in enumerate(shared_weights.arrays):
+                        layer_gradients = shared_gradients.arrays[i]
+                        for worker in range(1, num_workers):
+                            layer_gradients = layer_gradients + \
+                                shared_gradients.arrays[worker * num_layers + i]
+                        layer_weights += (learning_rate / num_rows) * layer_gradients
+                    barrier.wait()
+            barrier.wait()
+            if verbose:
+                print("Completed epoch " + str(epoch + 1))
+            if callbacks:
+                epoch_end = timer()
+                statistics = EpochStatistics()
+                statistics.loss_sum = float(shared_losses.arrays[0].sum())
+                statistics.num_examples = num_examples
+                record = statistics.record(epoch + 1, epoch_end - epoch_start,
+                                           epoch_end - training_start)
+                record["workers"] = num_workers
+                if run_callbacks(callbacks, record, shared_weights.arrays):
+                    stop.value = 1
+            barrier.wait()
+            if stop.value:
+                break
+        for worker in workers:
+            worker.join()
+    except threading.BrokenBarrierError:
+        for worker in workers:
+            worker.join(WATCH_INTERVAL)
+        exit_codes = [worker.exitcode for worker in workers if worker.exitcode]
+        raise RuntimeError("A data-parallel training worker failed"
+                           + (" (exit code " + str(exit_codes[0]) + ")" if exit_codes else "")
+                           ) from None
+    finally:
+        done.set()
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for layer_weights, shared_array in zip(weights, shared_weights.arrays):
+            layer_weights[...] = shared_array
+        for shared_array in shared:
+            shared_array.close()
+            shared_array.unlink()
+    return weights
+
+def data_parallel_back_prop_learning(examples, network, learning_rate, num_epochs,
+                                     batch_size=None, num_workers=None, mode="sync",
+                                     callbacks=None, verbose=True, checkpointer=None,
+                                     resume=False, activation="sigmoid"):
+    """
+    Returns a network after training it in num_workers processes (see
+    data_parallel_train_weights for batch_size, num_workers, mode and
+    activation)
+
+    Args:
+        examples: Array of examples in the form of input and output values
+            e.g [[num_examples x num_inputs],[num_examples x num_outputs]]
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+        checkpointer: Checkpointer saving periodic checkpoints (see
+            checkpoints.py), or None
+        resume: Boolean, continue from the checkpointer's file if it exists
+
+    Returns:
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+    """
+    inputs, outputs = examples
+    weights = network_to_weights(network)
+    start_epoch, callbacks = prepare_checkpointing(checkpointer, weights, callbacks, resume)
+    data_parallel_train_weights(inputs, outputs, weights, learning_rate, num_epochs, batch_size,
+                                num_workers, mode, verbose, callbacks, start_epoch, activation)
+    return copy_weights_to_network(weights, network)
+
+def measure_scaling(inputs, outputs, weights, learning_rate, num_epochs, batch_size=None,
+                    worker_counts=None, mode="sync"):
+    """
+    Returns the training throughput for each number of workers
+
+    Every run starts from a copy of weights. The baseline is train_weights in
+    the current process with the same batch size.
+
+    Returns:
+        results: Array of dictionaries with the keys workers, seconds,
+            examples_per_second, speedup (over the baseline) and efficiency
+            (speedup divided by the number of workers); workers is 0 for the
+            single process baseline
+    """
+    if worker_counts is None:
+        worker_counts = [count for count in (1, 2, 4, 8, 16, 32) if count <= os.cpu_count()]
+    num_examples = len(inputs)
+    start = timer()
+    baseline_batch_size = 1 if mode == "hogwild" and batch_size is None else batch_size
+    train_weights(inputs, outputs, [layer_weights.copy() for layer_weights in weights],
+                  learning_rate, num_epochs, baseline_batch_size, verbose=False)
+    baseline = timer() - start
+    results = [{"workers": 0, "seconds": baseline,
+                "examples_per_second": num_examples * num_epochs / baseline,
+                "speedup": 1.0, "efficiency": 1.0}]
+    for num_workers in worker_counts:
+        start = timer()
+        data_parallel_train_weights(inputs, outputs,
+                                    [layer_weights.copy() for layer_weights in weights],
+                                    learning_rate, num_epochs, batch_size, num_workers, mode,
+                                    verbose=False)
+        seconds = timer() - start
+        results.append({"workers": num_workers, "seconds": seconds,
+                        "examples_per_second": num_examples * num_epochs / seconds,
+                        "speedup": baseline / seconds,
+                        "efficiency": baseline / seconds / num_workers})
+    return results
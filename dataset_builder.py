@@ -0,0 +1,233 @@
+"""Builds training and testing files from raw feature matrices
+
+Each source is a .npy matrix of raw feature rows (e.g. trending_stats.npy
+written by retrieve_youtube_data.py or youtube_fetcher.py) whose rows all
+get the same 0/1 label. The build:
+
+    1. drops rows with missing (NaN) or infinite values
+    2. draws, per class and from a seed, which rows go to which split
+       (stratified: every split gets the same ratio of every class), taking
+       at most --per-class rows of each class; --balance takes as many rows
+       of every class as the smallest class has
+    3. computes the standardization statistics of the training split in a
+       single streaming pass (RunningStatistics) and saves them to
+       <prefix>.normalization.json
+    4. writes every split, standardized and shuffled, in chunks of rows
+       (text .train/.test files, or binary examples files with --binary)
+
+Sources are memory mapped and read in chunks, so they may be larger than
+memory. Pass the statistics file to "main.py train --normalization" to keep
+it next to the trained network; "main.py score --raw", "main.py test --raw"
+and the scoring service (with "raw": true) then standardize raw feature
+rows with it automatically.
+
+Example (the split of create_train_test_files_youtube.py):
+    python3 dataset_builder.py youtube --source 1 trending_stats.npy
+        --source 0 nontrending_stats.npy --per-class 800 --balance
+        --split train 0.5 --split test 0.5 --seed 0
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from binary_formats import (
+    write_binary_examples
+)
+from normalization import (
+    RunningStatistics, save_normalization, standardize_rows, NORMALIZATION_EXTENSION
+)
+
+# Number of rows read from the sources at a time
+DEFAULT_CHUNK_SIZE = 65536
+
+# File extension of each split name; other splits are written to <prefix>.<name>
+SPLIT_EXTENSIONS = {"train": ".train", "test": ".test", "validation": ".validation"}
+
+def open_source(filename):
+    """Returns the rows of a .npy matrix, memory mapped"""
+    rows = np.load(filename, mmap_mode="r")
+    if rows.ndim != 2:
+        raise ValueError("'" + filename + "' must hold a 2 dimensional matrix of feature rows")
+    return rows
+
+def valid_rows(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns the indices of the rows without NaN or infinite values"""
+    valid = np.empty(len(rows), dtype=bool)
+    for start in range(0, len(rows), chunk_size):
+        valid[start:start + chunk_size] = np.isfinite(rows[start:start + chunk_size]).all(axis=1)
+    return np.flatnonzero(valid)
+
+def split_counts(num_rows, ratios):
+    """Returns the number of rows of each split, rounding so that they add
+    up to num_rows when the ratios add up to 1"""
+    boundaries = np.round(np.cumsum(ratios) * num_rows).astype(int)
+    boundaries = np.minimum(boundaries, num_rows)
+    return np.diff(np.concatenate(([0], boundaries))).tolist()
+
+def assign_splits(row_indices, ratios, per_class, rng):
+    """
+    Returns, per source, an array of row index arrays (one per split),
+    each in increasing row order
+
+    Args:
+        row_indices: Array of index arrays of the valid rows of each source
+        ratios: Array of floating point fractions of rows per split
+        per_class: Integer maximum number of rows used per source, or None
+        rng: np.random.Generator drawing the rows of each split
+    """
+    assignment = []
+    for indices in row_indices:
+        chosen = rng.permutation(indices)
+        if per_class is not None:
+            chosen = chosen[:per_class]
+        splits = []
+        start = 0
+        for count in split_counts(len(chosen), ratios):
+            splits.append(np.sort(chosen[start:start + count]))
+            start += count
+        assignment.append(splits)
+    return assignment
+
+def read_rows(rows, indices, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the rows at sorted indices as float64 chunks"""
+    for start in range(0, len(indices), chunk_size):
+        yield np.asarray(rows[indices[start:start + chunk_size]], dtype=np.float64)
+
+def split_chunks(sources, labels, split_indices, order, mean, std,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields the standardized (inputs, outputs) chunks of one split
+
+    Args:
+        sources: Array of memory mapped source matrices
+        labels: Array of integer labels of the sources
+        split_indices: Array of sorted row index arrays, one per source
+        order: Permutation of the rows of the split (rows numbered source by
+            source) giving the order they are written in
+    """
+    source_ids = np.concatenate([np.full(len(indices), source, dtype=np.intp)
+                                 for source, indices in enumerate(split_indices)])
+    row_ids = np.concatenate(split_indices).astype(np.intp)
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start:start + chunk_size]
+        chunk_sources = source_ids[chunk]
+        chunk_rows = row_ids[chunk]
+        inputs = np.empty((len(chunk), sources[0].shape[1]))
+        outputs = np.empty((len(chunk), 1), dtype=np.uint8)
+        for source, rows in enumerate(sources):
+            selected = np.flatnonzero(chunk_sources == source)
+            if not len(selected):
+                continue
+            # Read the rows of the chunk in file order, then put them in place
+            by_row = np.argsort(chunk_rows[selected], kind="stable")
+            inputs[selected[by_row]] = rows[chunk_rows[selected][by_row]]
+            outputs[selected] = labels[source]
+        yield standardize_rows(inputs, mean, std), outputs
+
+def write_split(filename, chunks, num_examples, num_inputs, binary=False,
+                input_format="%1.3f"):
+    """Writes the chunks of a split as a text examples file (like
+    youtube.train) or, with binary, a binary examples file"""
+    if binary:
+        write_binary_examples(filename, chunks, num_examples, num_inputs, 1)
+        return
+    row_format = " ".join([input_format] * num_inputs + ["%d"])
+    with open(filename, "w+") as file:
+        file.write(str(num_examples) + " " + str(num_inputs) + " 1\n")
+        for inputs, outputs in chunks:
+            np.savetxt(file, np.hstack((inputs, outputs)), fmt=row_format)
+
+def build_dataset(prefix, sources, splits=(("train", 0.5), ("test", 0.5)), seed=0,
+                  per_class=None, balance=False, binary=False, input_format="%1.3f",
+                  chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Builds split files and the normalization statistics of a dataset
+
+    Args:
+        prefix: String prefix of the files to write, e.g. "youtube"
+        sources: Array of (label, filename) pairs of .npy feature matrices
+        splits: Array of (name, ratio) pairs; the first split is the one the
+            statistics are computed on
+        seed: Integer seed of the split assignment and shuffling
+        per_class: Integer maximum number of rows per source, or None
+        balance: Boolean, use as many rows of every source as the smallest has
+        binary: Boolean, write binary examples files instead of text
+        input_format: Format of input values of text files
+        chunk_size: Integer number of rows processed at a time
+
+    Returns:
+        files: Dictionary of split name -> (filename, number of examples),
+            with the statistics file under "normalization"
+    """
+    if not sources:
+        raise ValueError("At least one source is needed")
+    ratios = [ratio for _, ratio in splits]
+    if any(ratio < 0 for ratio in ratios) or sum(ratios) > 1 + 1e-9:
+        raise ValueError("Split ratios must be non-negative and add up to at most 1")
+    labels = [label for label, _ in sources]
+    matrices = [open_source(filename) for _, filename in sources]
+    num_inputs = matrices[0].shape[1]
+    if any(matrix.shape[1] != num_inputs for matrix in matrices):
+        raise ValueError("Every source must have the same number of columns")
+    row_indices = [valid_rows(matrix, chunk_size) for matrix in matrices]
+    if balance:
+        smallest = min(len(indices) for indices in row_indices)
+        per_class = smallest if per_class is None else min(per_class, smallest)
+    rng = np.random.default_rng(seed)
+    assignment = assign_splits(row_indices, ratios, per_class, rng)
+
+    # One streaming pass over the rows of the first split
+    statistics = RunningStatistics(num_inputs)
+    for matrix, source_splits in zip(matrices, assignment):
+        for rows in read_rows(matrix, source_splits[0], chunk_size):
+            statistics.update(rows)
+    mean, std = statistics.mean, statistics.std()
+    files = {"normalization": (prefix + NORMALIZATION_EXTENSION, statistics.count)}
+    save_normalization(files["normalization"][0], mean, std, statistics.count)
+
+    for i, (name, _) in enumerate(splits):
+        split_indices = [source_splits[i] for source_splits in assignment]
+        num_examples = sum(len(indices) for indices in split_indices)
+        order = rng.permutation(num_examples)
+        filename = prefix + SPLIT_EXTENSIONS.get(name, "." + name)
+        write_split(filename, split_chunks(matrices, labels, split_indices, order, mean, std,
+                                           chunk_size),
+                    num_examples, num_inputs, binary, input_format)
+        files[name] = (filename, num_examples)
+    return files
+
+def main(argv=None):
+    """Builds a dataset from command line arguments, returns the exit status"""
+    parser = argparse.ArgumentParser(description="Build training and testing files")
+    parser.add_argument("prefix", help="prefix of the files to write, e.g. youtube")
+    parser.add_argument("--source", nargs=2, action="append", metavar=("LABEL", "NPY_FILE"),
+                        required=True, help="feature matrix whose rows get label (0 or 1)")
+    parser.add_argument("--split", nargs=2, action="append", metavar=("NAME", "RATIO"),
+                        help="split name and fraction of rows (default train 0.5, test 0.5); "
+                             "statistics are computed on the first split")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--per-class", type=int, help="maximum rows used per source")
+    parser.add_argument("--balance", action="store_true",
+                        help="use as many rows of every source as the smallest has")
+    parser.add_argument("--binary", action="store_true", help="write binary examples files")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    try:
+        sources = [(int(label), filename) for label, filename in args.source]
+        splits = [(name, float(ratio)) for name, ratio in args.split or
+                  [("train", "0.5"), ("test", "0.5")]]
+        if any(label not in (0, 1) for label, _ in sources):
+            raise ValueError("Labels must be 0 or 1")
+        files = build_dataset(args.prefix, sources, splits, args.seed, args.per_class,
+                              args.balance, args.binary, chunk_size=args.chunk_size)
+    except (OSError, ValueError) as error:
+        print("error: " + str(error), file=sys.stderr)
+        return 1
+    for name, (filename, count) in files.items():
+        print("Wrote " + filename + " (" + str(count) + " rows"
+              + (" used for the statistics" if name == "normalization" else "") + ")")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""Early stopping on a validation holdout
+
+Part of the training examples is held out for validation. Every
+check_interval epochs the network is scored on the holdout with the
+confusion matrix metrics of predict/write_statistics_to_file, the best
+weights so far are kept, and training stops once patience checks in a row
+have not improved the metric. The returned network has the best weights.
+
+With checkpoints the best weights, best score and number of checks without
+improvement are saved with every checkpoint, so a resumed run stops at the
+same epoch, with the same best weights, as an uninterrupted run.
+"""
+import numpy as np
+
+from checkpoints import (
+    prepare_checkpointing
+)
+from neural_network_programs import (
+    compute_statistics
+)
+from vectorized_back_prop import (
+    network_to_weights, copy_weights_to_network, confusion_counts_matrix, train_weights
+)
+
+def split_validation(inputs, outputs, validation_fraction, seed=0):
+    """
+    Returns examples split into a training part and a validation holdout
+
+    Args:
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        validation_fraction: Floating point fraction of examples held out
+        seed: Integer seed of the random choice of held out examples
+    Returns:
+        (training_inputs, training_outputs), (validation_inputs, validation_outputs)
+    """
+    if not 0 < validation_fraction < 1:
+        raise ValueError("Validation fraction must be between 0 and 1, got "
+                         + str(validation_fraction))
+    inputs = np.asarray(inputs)
+    if inputs.dtype.kind != "f":
+        inputs = inputs.astype(np.float64)
+    outputs = np.asarray(outputs)
+    num_validation = int(round(len(inputs) * validation_fraction))
+    if num_validation < 1 or num_validation >= len(inputs):
+        raise ValueError("Validation fraction leaves no training or validation examples")
+    order = np.random.default_rng(seed).permutation(len(inputs))
+    # Keep the training examples in their original order
+    validation_indices = np.sort(order[:num_validation])
+    training_indices = np.sort(order[num_validation:])
+    return ((inputs[training_indices], outputs[training_indices]),
+            (inputs[validation_indices], outputs[validation_indices]))
+
+def validation_score(weights, validation_examples, metric, activation="sigmoid"):
+    """Returns metric of compute_statistics for the validation examples"""
+    inputs, outputs = validation_examples
+    a, b, c, d = [counts.tolist() for counts in
+                  confusion_counts_matrix(weights, inputs, outputs, activation=activation)]
+    return compute_statistics(a, b, c, d)[metric]
+
+class EarlyStopping:
+    """
+    Training callback that keeps the best weights on validation examples and
+    stops training when the validation metric stops improving
+
+    Attributes:
+        validation_examples: (inputs, outputs) pair of validation arrays
+        patience: Integer number of checks without improvement before stopping
+        check_interval: Integer number of epochs between checks
+        metric: String name of a micro/macro average of compute_statistics
+        min_delta: Floating point improvement needed to count as better
+        best_score: Floating point best validation metric so far
+        best_epoch: Integer epoch of the best weights (0 for the initial weights)
+        best_weights: Array of weight matrices with the best validation metric
+        stopped_epoch: Integer epoch training was stopped at, None if not stopped
+        activation: String name of the hidden layer activation function
+    """
+    def __init__(self, validation_examples, patience=5, check_interval=1,
+                 metric="micro_avg_overall_accuracy", min_delta=0.0, initial_weights=None,
+                 activation="sigmoid"):
+        if patience < 1 or check_interval < 1:
+            raise ValueError("Patience and check interval must be positive integers")
+        self.validation_examples = validation_examples
+        self.patience = patience
+        self.check_interval = check_interval
+        self.metric = metric
+        self.min_delta = min_delta
+        self.best_score = float("-inf")
+        self.best_epoch = 0
+        self.best_weights = None
+        self.stopped_epoch = None
+        self.num_bad_checks = 0
+        self.activation = activation
+        if initial_weights is not None:
+            self.best_score = validation_score(initial_weights, validation_examples, metric,
+                                               activation)
+            self.best_weights = [layer_weights.copy() for layer_weights in initial_weights]
+
+    def __call__(self, record, weights):
+        if record["epoch"] % self.check_interval:
+            return False
+        score = validation_score(weights, self.validation_examples, self.metric,
+                                 self.activation)
+        record["validation_" + self.metric] = score
+        if self.best_weights is None or score > self.best_score + self.min_delta:
+            self.best_score = score
+            self.best_epoch = record["epoch"]
+            self.best_weights = [layer_weights.copy() for layer_weights in weights]
+            self.num_bad_checks = 0
+            return False
+        self.num_bad_checks += 1
+        if self.num_bad_checks >= self.patience:
+            self.stopped_epoch = record["epoch"]
+            return True
+        return False
+
+    def get_state(self):
+        """Returns the state as a dictionary of named arrays for checkpoints"""
+        arrays = {
+            "early_stopping_best_score": np.array(self.best_score),
+            "early_stopping_best_epoch": np.array(self.best_epoch),
+            "early_stopping_bad_checks": np.array(self.num_bad_checks),
+            "early_stopping_stopped_epoch": np.array(-1 if self.stopped_epoch is None
+                                                     else self.stopped_epoch),
+        }
+        for i, layer_weights in enumerate(self.best_weights or []):
+            arrays["early_stopping_best_weights_" + str(i)] = layer_weights
+        return arrays
+
+    def load_state(self, arrays, weights):
+        """
+        Restores the state saved by get_state (e.g. the extra arrays of a
+        checkpoint), raising ValueError if the checkpoint has none
+
+        Args:
+            arrays: Dictionary of named arrays
+            weights: Array of weight matrices the state belongs to
+        """
+        if "early_stopping_best_score" not in arrays:
+            raise ValueError("Checkpoint was not trained with early stopping")
+        self.best_score = float(arrays["early_stopping_best_score"])
+        self.best_epoch = int(arrays["early_stopping_best_epoch"])
+        self.num_bad_checks = int(arrays["early_stopping_bad_checks"])
+        stopped_epoch = int(arrays["early_stopping_stopped_epoch"])
+        self.stopped_epoch = None if stopped_epoch < 0 else stopped_epoch
+        if "early_stopping_best_weights_0" in arrays:
+            self.best_weights = [np.array(arrays["early_stopping_best_weights_" + str(i)],
+                                          dtype=layer_weights.dtype)
+                                 for i, layer_weights in enumerate(weights)]
+
+def early_stopping_back_prop_learning(examples, network, learning_rate, max_epochs,
+                                      batch_size=1, validation_fraction=0.2,
+                                      validation_examples=None, patience=5, check_interval=1,
+                                      metric="micro_avg_overall_accuracy", seed=0,
+                                      callbacks=None, verbose=True, activation="sigmoid",
+                                      dtype=np.float64, optimizer=None, schedule=None,
+                                      shuffle="none", checkpointer=None, resume=False):
+    """
+    Returns a network after training it for at most max_epochs, set to the
+    weights that scored best on the validation examples, and the
+    EarlyStopping callback describing the run
+
+    Args:
+        examples: Array of examples in the form of input and output values
+            e.g [[num_examples x num_inputs],[num_examples x num_outputs]]
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+        learning_rate: Floating point number
+        max_epochs: Integer maximum number of epochs
+        batch_size: Integer number of examples per weight update
+        validation_fraction: Floating point fraction of examples held out for
+            validation, ignored if validation_examples is given
+        validation_examples: Separate (inputs, outputs) validation examples,
+            e.g. from get_examples, or None to hold out part of examples
+        patience: Integer number of checks without improvement before stopping
+        check_interval: Integer number of epochs between checks
+        metric: String name of a micro/macro average of compute_statistics
+        seed: Integer seed of the validation holdout and of shuffled orders
+        callbacks: Array of additional epoch callbacks (see training_telemetry.py)
+        verbose: Boolean, print a line after every completed epoch
+        activation: String name of the hidden layer activation function (see
+            helper_functions.ACTIVATIONS)
+        dtype: np.float64 or np.float32, type training runs in
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent
+        schedule: LearningRateSchedule giving the learning rate of every
+            epoch (max_epochs long), None for a constant learning rate
+        shuffle: String order of the examples in every epoch, "none",
+            "random" or "stratified" (see shuffling.py)
+        checkpointer: Checkpointer saving periodic checkpoints (see
+            checkpoints.py) including the early stopping state, or None
+        resume: Boolean, continue from the checkpointer's file if it exists
+
+    Returns:
+        network, early_stopping
+    """
+    inputs, outputs = examples
+    if validation_examples is None:
+        (inputs, outputs), validation_examples = split_validation(
+            inputs, outputs, validation_fraction, seed)
+    weights = network_to_weights(network, dtype)
+    early_stopping = EarlyStopping(validation_examples, patience, check_interval, metric,
+                                   initial_weights=weights, activation=activation)
+    rng = np.random.default_rng(seed)
+    if checkpointer is not None:
+        checkpointer.rng = rng
+    start_epoch, callbacks = prepare_checkpointing(
+        checkpointer, weights, [early_stopping] + list(callbacks or []), resume, optimizer,
+        [early_stopping])
+    # A run resumed from the checkpoint of the epoch it stopped at is finished
+    if early_stopping.stopped_epoch is None:
+        train_weights(inputs, outputs, weights, learning_rate, max_epochs, batch_size,
+                      verbose, callbacks, start_epoch, activation=activation,
+                      optimizer=optimizer, schedule=schedule, shuffle=shuffle, rng=rng)
+    if verbose and early_stopping.stopped_epoch is not None:
+        print("Stopped early at epoch " + str(early_stopping.stopped_epoch)
+              + ", best epoch " + str(early_stopping.best_epoch))
+    return copy_weights_to_network(early_stopping.best_weights, network), early_stopping
@@ -0,0 +1,174 @@
+"""Program to train and test a grid of hyperparameters in parallel
+
+Every combination of learning rate, number of epochs and hidden layer sizes
+is trained in its own worker process. For each configuration a .trained and
+.results file are written (named like youtube.1.500.h2.trained for learning
+rate 0.1, 500 epochs and 2 hidden nodes, or youtube.1.500.h8-4.trained for
+hidden layers of 8 and 4 nodes) and a summary table
+ranked by one of the metrics of write_statistics_to_file is written to
+<output prefix>.sweep.
+
+Example:
+    python3 hyperparameter_sweep.py youtube.init youtube.train youtube.test youtube
+        --learning-rates 0.05 0.1 --epochs 100 200 500 --hidden 2 4 8,4
+"""
+import argparse
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from neural_network_programs import (
+    generate_weights, generate_new_network, get_examples, write_weights_to_file,
+    compute_statistics, write_statistics_to_file
+)
+from vectorized_back_prop import (
+    network_to_weights, train_weights, confusion_counts_matrix
+)
+
+# Metrics of write_statistics_to_file that the summary can be ranked by
+RANKING_METRICS = (
+    "micro_avg_overall_accuracy", "micro_avg_precision", "micro_avg_recall", "micro_avg_f_1",
+    "macro_avg_overall_accuracy", "macro_avg_precision", "macro_avg_recall", "macro_avg_f_1"
+)
+
+def format_learning_rate(learning_rate):
+    """Returns learning rate as used in file names, e.g. 0.1 -> '1', 0.05 -> '05'"""
+    text = "{0:g}".format(learning_rate)
+    if text.startswith("0."):
+        return text[2:]
+    return text
+
+def format_hidden_sizes(num_hidden_nodes):
+    """Returns hidden layer sizes as used in file names, e.g. (8, 4) -> '8-4'"""
+    return "-".join(str(size) for size in num_hidden_nodes)
+
+def parse_hidden_sizes(text):
+    """Returns hidden layer sizes given as comma separated integers, e.g. '8,4'"""
+    sizes = tuple(int(size) for size in text.split(","))
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError("invalid hidden layer sizes: '" + text + "'")
+    return sizes
+
+def configuration_name(prefix, learning_rate, num_epochs, num_hidden_nodes):
+    """Returns the file name prefix of a configuration"""
+    return (prefix + "." + format_learning_rate(learning_rate) + "." + str(num_epochs)
+            + ".h" + format_hidden_sizes(num_hidden_nodes))
+
+def run_configuration(job):
+    """
+    Trains and tests one configuration, writing its .trained and .results files
+
+    Args:
+        job: Dictionary with the keys weights_file, training_file, testing_file,
+            name, learning_rate, num_epochs, num_hidden_nodes, batch_size and seed
+    Returns:
+        record: Dictionary with the configuration, output file names and the
+            statistics of compute_statistics
+    """
+    weights = generate_weights(job["weights_file"])
+    num_inputs = weights[0].shape[1] - 1
+    num_outputs = weights[-1].shape[0]
+    if [len(layer_weights) for layer_weights in weights[:-1]] != list(job["num_hidden_nodes"]):
+        # Hidden layer sizes differ from the weights file, start from random weights
+        random.seed(job["seed"])
+        weights = network_to_weights(generate_new_network(num_inputs, job["num_hidden_nodes"],
+                                                          num_outputs))
+    inputs, outputs = get_examples(job["training_file"])
+    train_weights(inputs, outputs, weights, job["learning_rate"], job["num_epochs"],
+                  job["batch_size"], verbose=False)
+    trained_file = job["name"] + ".trained"
+    results_file = job["name"] + ".results"
+    write_weights_to_file(trained_file, weights)
+    a, b, c, d = [counts.tolist() for counts in
+                  confusion_counts_matrix(weights, *get_examples(job["testing_file"]))]
+    record = {key: job[key] for key in ("learning_rate", "num_epochs", "num_hidden_nodes")}
+    record["trained_file"] = trained_file
+    record["results_file"] = results_file
+    record["statistics"] = compute_statistics(a, b, c, d)
+    write_statistics_to_file(results_file, a, b, c, d)
+    return record
+
+def run_sweep(weights_file, training_file, testing_file, prefix, learning_rates, epochs,
+              hidden_sizes, batch_size=1, num_workers=None, seed=0):
+    """
+    Trains every configuration of the grid in a process pool
+
+    Args:
+        weights_file: String, initial weights file (.init) of the network
+        training_file, testing_file: Strings, training and testing files
+        prefix: String prefix of the written files
+        learning_rates: Array of floating point learning rates
+        epochs: Array of integer numbers of epochs
+        hidden_sizes: Array of hidden layer sizes, each an array of integer
+            numbers of nodes per hidden layer
+        batch_size: Integer number of examples per weight update
+        num_workers: Integer number of processes, None for all cores
+        seed: Integer seed of random initial weights for other hidden sizes
+    Returns:
+        records: Array of records of run_configuration in grid order
+    """
+    jobs = []
+    hidden_sizes = [tuple(num_hidden_nodes) for num_hidden_nodes in hidden_sizes]
+    for learning_rate, num_epochs, num_hidden_nodes in itertools.product(
+            learning_rates, epochs, hidden_sizes):
+        jobs.append({
+            "weights_file": weights_file,
+            "training_file": training_file,
+            "testing_file": testing_file,
+            "name": configuration_name(prefix, learning_rate, num_epochs, num_hidden_nodes),
+            "learning_rate": learning_rate,
+            "num_epochs": num_epochs,
+            "num_hidden_nodes": num_hidden_nodes,
+            "batch_size": batch_size,
+            "seed": seed + hidden_sizes.index(num_hidden_nodes),
+        })
+    with ProcessPoolExecutor(max_workers=num_workers or os.cpu_count()) as executor:
+        return list(executor.map(run_configuration, jobs))
+
+def rank_records(records, metric="micro_avg_f_1"):
+    """Returns records sorted from best to worst by metric"""
+    if metric not in RANKING_METRICS:
+        raise ValueError("Unknown metric '" + metric + "', choose from "
+                         + ", ".join(RANKING_METRICS))
+    return sorted(records, key=lambda record: record["statistics"][metric], reverse=True)
+
+def write_summary_to_file(filename, records, metric="micro_avg_f_1"):
+    """Writes a table of the configurations ranked by metric to a file"""
+    file = open(filename, "w+")
+    file.write("rank learning_rate epochs hidden " + " ".join(RANKING_METRICS) + " trained_file\n")
+    for rank, record in enumerate(rank_records(records, metric)):
+        metrics = " ".join("{0:.3f}".format(record["statistics"][name])
+                           for name in RANKING_METRICS)
+        file.write(str(rank + 1) + " " + "{0:g}".format(record["learning_rate"]) + " "
+                   + str(record["num_epochs"]) + " " + format_hidden_sizes(record["num_hidden_nodes"]) + " "
+                   + metrics + " " + record["trained_file"] + "\n")
+    file.close()
+
+def main():
+    """Runs a hyperparameter sweep from command line arguments"""
+    parser = argparse.ArgumentParser(description="Train a grid of hyperparameters in parallel")
+    parser.add_argument("weights_file", help="initial weights file (.init)")
+    parser.add_argument("training_file", help="training file (.train)")
+    parser.add_argument("testing_file", help="testing file (.test)")
+    parser.add_argument("prefix", help="prefix of the written .trained/.results files")
+    parser.add_argument("--learning-rates", type=float, nargs="+", required=True)
+    parser.add_argument("--epochs", type=int, nargs="+", required=True)
+    parser.add_argument("--hidden", type=parse_hidden_sizes, nargs="+", required=True,
+                        help="hidden layer sizes, comma separated for deeper networks")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metric", default="micro_avg_f_1", choices=RANKING_METRICS,
+                        help="metric the summary is ranked by")
+    args = parser.parse_args()
+    records = run_sweep(args.weights_file, args.training_file, args.testing_file, args.prefix,
+                        args.learning_rates, args.epochs, args.hidden, args.batch_size,
+                        args.workers, args.seed)
+    summary_file = args.prefix + ".sweep"
+    write_summary_to_file(summary_file, records, args.metric)
+    print("Wrote " + str(len(records)) + " configurations, summary in " + summary_file)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""Long-running HTTP scoring service
+
+Keeps trained networks in memory and scores single rows or micro-batches of
+input rows with the vectorized forward pass.
+
+Requests:
+    POST /predict   {"network": "youtube.1.500.trained", "rows": [[0.4, -0.2, -0.1, -0.1]]}
+                    ("row": [...] may be given instead of "rows"; with "raw": true
+                    the rows are raw feature values, standardized with the
+                    statistics kept next to the network, see normalization.py;
+                    "activation": "tanh" scores a network whose hidden layers
+                    were trained with another activation than the server's
+                    --activation, see helper_functions.ACTIVATIONS)
+                    -> {"outputs": [[0.93]], "predictions": [[1]]}
+    GET  /stats     -> request count, p50/p99 latency in milliseconds and
+                       the networks in the cache
+
+Network files do not record the activation function their hidden layers
+were trained with, so every network is scored with the activation given by
+--activation (sigmoid by default) unless a request names another one;
+requests naming an unknown activation are rejected.
+
+Network paths are relative to the model directory given on the command
+line; paths outside it are rejected. Networks are cached in a least
+recently used cache keyed by path and modification time, so a retrained
+network (or its statistics) is picked up on its next request. Requests
+that arrive while a forward pass is running are coalesced: their rows are
+stacked per network and scored together in a single pass.
+
+Invalid requests are answered with status 400, failures of the server
+(e.g. a network or statistics file that cannot be read) with status 500.
+
+Example:
+    python3 inference_server.py youtube-neural-network-files --port 8000
+"""
+import argparse
+import collections
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from helper_functions import (
+    get_activation, ACTIVATIONS
+)
+from neural_network_programs import (
+    generate_weights
+)
+from normalization import (
+    load_normalization, normalization_file, standardize_rows
+)
+from vectorized_back_prop import (
+    forward_propagate_matrix
+)
+
+class NetworkCache:
+    """
+    Least recently used cache of weight matrices keyed by (path, mtime)
+
+    Attributes:
+        max_size: Integer maximum number of cached networks
+        loader: Function reading the file at a path, generate_weights by
+            default (load_normalization to cache standardization statistics)
+    """
+    def __init__(self, max_size=8, loader=generate_weights):
+        self.max_size = max_size
+        self.loader = loader
+        self.networks = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Returns the weight matrices of the network file at path"""
+        key = (path, os.stat(path).st_mtime_ns)
+        with self.lock:
+            if key in self.networks:
+                self.networks.move_to_end(key)
+                return self.networks[key]
+        weights = self.loader(path)
+        with self.lock:
+            # Drop older versions of the same file
+            for old_key in [old_key for old_key in self.networks if old_key[0] == path]:
+                del self.networks[old_key]
+            self.networks[key] = weights
+            while len(self.networks) > self.max_size:
+                self.networks.popitem(last=False)
+        return weights
+
+    def paths(self):
+        """Returns the paths of the cached networks, least recently used first"""
+        with self.lock:
+            return [path for path, _ in self.networks]
+
+class LatencyTracker:
+    """Keeps the latencies of the most recent requests"""
+    def __init__(self, window=10000):
+        self.latencies = collections.deque(maxlen=window)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        """Record the latency of one request"""
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+
+    def summary(self):
+        """Returns request count and p50/p99 latency in milliseconds"""
+        with self.lock:
+            latencies = np.array(self.latencies)
+            count = self.count
+        if not len(latencies):
+            return {"requests": count, "p50_ms": None, "p99_ms": None}
+        p50, p99 = np.percentile(latencies * 1000, [50, 99])
+        return {"requests": count, "p50_ms": float(p50), "p99_ms": float(p99)}
+
+class NetworkLoadError(Exception):
+    """A network or statistics file could not be loaded (a failure of the
+    server, not of the request)"""
+
+class PendingRequest:
+    """Rows of one request waiting to be scored"""
+    def __init__(self, path, rows, activation="sigmoid"):
+        self.path = path
+        self.rows = rows
+        self.activation = activation
+        self.outputs = None
+        self.error = None
+        self.done = threading.Event()
+
+class RequestBatcher:
+    """
+    Scores requests on a single worker thread, stacking the rows of all
+    requests waiting for the same network into one forward pass
+
+    Attributes:
+        cache: NetworkCache the networks are loaded from
+        max_batch_rows: Integer maximum number of rows per forward pass
+        max_delay: Floating point seconds to wait for more requests to join
+            a batch (0 to only coalesce requests that are already waiting)
+    """
+    def __init__(self, cache, max_batch_rows=4096, max_delay=0.0):
+        self.cache = cache
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def predict(self, path, rows, activation="sigmoid"):
+        """Returns the output activations of rows, blocking until scored"""
+        request = PendingRequest(path, rows, activation)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.outputs
+
+    def next_batch(self):
+        """Returns the requests scored in the next pass"""
+        batch = [self.requests.get()]
+        num_rows = len(batch[0].rows)
+        deadline = time.monotonic() + self.max_delay
+        while num_rows < self.max_batch_rows:
+            try:
+                request = self.requests.get(timeout=max(deadline - time.monotonic(), 0)) \
+                    if self.max_delay else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            num_rows += len(request.rows)
+        return batch
+
+    def run(self):
+        """Worker loop scoring batches of requests"""
+        while True:
+            by_network = collections.defaultdict(list)
+            for request in self.next_batch():
+                by_network[request.path, request.activation].append(request)
+            for (path, activation), requests in by_network.items():
+                self.score(path, requests, activation)
+
+    def score(self, path, requests, activation="sigmoid"):
+        """Scores the requests of one network (with the same hidden layer
+        activation) in a single forward pass"""
+        try:
+            try:
+                weights = self.cache.get(path)
+            except Exception as error:
+                raise NetworkLoadError("Could not load network '" + os.path.basename(path)
+                                       + "': " + (str(error) or type(error).__name__)) from error
+            num_inputs = weights[0].shape[1] - 1
+            # Rows of the wrong width fail only their own request
+            for request in requests:
+                if request.rows.shape[1] != num_inputs:
+                    request.error = ValueError("Expected " + str(num_inputs)
+                                               + " inputs per row, got "
+                                               + str(request.rows.shape[1]))
+                    request.done.set()
+            requests = [request for request in requests if request.error is None]
+            if not requests:
+                return
+            rows = np.concatenate([request.rows for request in requests])
+            outputs = forward_propagate_matrix(weights, rows, activation)[-1]
+        except Exception as error:
+            for request in requests:
+                request.error = error
+                request.done.set()
+            return
+        start = 0
+        for request in requests:
+            request.outputs = outputs[start:start + len(request.rows)]
+            start += len(request.rows)
+            request.done.set()
+
+class ScoringService:
+    """
+    Scoring service shared by the HTTP request handlers
+
+    Attributes:
+        activation: String name of the hidden layer activation networks are
+            scored with unless a request names another one
+    """
+    def __init__(self, model_dir, cache_size=8, max_batch_rows=4096, max_delay=0.0,
+                 activation="sigmoid"):
+        get_activation(activation)
+        self.model_dir = os.path.realpath(model_dir)
+        self.activation = activation
+        self.cache = NetworkCache(cache_size)
+        self.normalizations = NetworkCache(cache_size, load_normalization)
+        self.batcher = RequestBatcher(self.cache, max_batch_rows, max_delay)
+        self.latency = LatencyTracker()
+
+    def resolve(self, network):
+        """Returns the path of a network inside the model directory"""
+        path = os.path.realpath(os.path.join(self.model_dir, network))
+        if os.path.commonpath([path, self.model_dir]) != self.model_dir:
+            raise ValueError("Network must be inside the model directory: '" + network + "'")
+        if not os.path.isfile(path):
+            raise ValueError("No such network: '" + network + "'")
+        return path
+
+    def predict(self, request):
+        """Returns the response to a /predict request dictionary"""
+        if "network" not in request or ("rows" not in request and "row" not in request):
+            raise ValueError("Request needs 'network' and 'rows' (or 'row')")
+        rows = request["rows"] if "rows" in request else [request["row"]]
+        rows = np.array(rows, dtype=np.float64)
+        if rows.ndim != 2 or not len(rows):
+            raise ValueError("'rows' must be a non-empty list of rows of numbers")
+        activation = request.get("activation", self.activation)
+        get_activation(activation)
+        path = self.resolve(request["network"])
+        if request.get("raw"):
+            rows = standardize_rows(rows, *self.normalization(path, request["network"]))
+        outputs = self.batcher.predict(path, rows, activation)
+        return {"outputs": outputs.tolist(),
+                "predictions": (outputs >= 0.5).astype(int).tolist()}
+
+    def normalization(self, path, network):
+        """Returns the mean and std kept next to the network file at path"""
+        try:
+            return self.normalizations.get(normalization_file(path))
+        except FileNotFoundError:
+            raise ValueError("No normalization statistics for '" + network + "'") from None
+        except Exception as error:
+            raise NetworkLoadError("Could not load the normalization statistics of '" + network
+                                   + "': " + (str(error) or type(error).__name__)) from error
+
+    def stats(self):
+        """Returns the response to a /stats request"""
+        stats = self.latency.summary()
+        stats["cached_networks"] = [os.path.relpath(path, self.model_dir)
+                                    for path in self.cache.paths()]
+        return stats
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """HTTP request handler of the scoring service"""
+    service = None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self.send_json(404, {"error": "Not found"})
+            return
+        start = time.perf_counter()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            response = self.service.predict(json.loads(self.rfile.read(length)))
+        except NetworkLoadError as error:
+            self.send_json(500, {"error": str(error)})
+            return
+        except (ValueError, TypeError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+        except OSError as error:
+            self.send_json(500, {"error": str(error)})
+            return
+        except Exception as error:
+            # e.g. a corrupt network file; the client still gets a response
+            self.send_json(500, {"error": "Could not score request: " + type(error).__name__
+                                 + (": " + str(error) if str(error) else "")})
+            return
+        self.service.latency.add(time.perf_counter() - start)
+        self.send_json(200, response)
+
+    def send_json(self, status, body):
+        """Send a JSON response"""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Do not log every request"""
+
+class ScoringServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a listen backlog large enough for bursts of
+    concurrent clients"""
+    request_queue_size = 128
+    daemon_threads = True
+
+def make_server(model_dir, host="127.0.0.1", port=8000, cache_size=8, max_batch_rows=4096,
+                max_delay=0.0, activation="sigmoid"):
+    """Returns an HTTP server for the scoring service (call serve_forever to run it)"""
+    service = ScoringService(model_dir, cache_size, max_batch_rows, max_delay, activation)
+    handler = type("ScoringRequestHandler", (RequestHandler,), {"service": service})
+    return ScoringServer((host, port), handler)
+
+def main():
+    """Runs the scoring service from command line arguments"""
+    parser = argparse.ArgumentParser(description="Serve predictions of trained networks")
+    parser.add_argument("model_dir", help="directory containing the network files")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--cache-size", type=int, default=8,
+                        help="number of networks kept in memory")
+    parser.add_argument("--max-batch-rows", type=int, default=4096,
+                        help="maximum number of rows scored in one forward pass")
+    parser.add_argument("--max-delay-ms", type=float, default=0.0,
+                        help="time to wait for more requests to join a batch")
+    parser.add_argument("--activation", choices=list(ACTIVATIONS), default="sigmoid",
+                        help="hidden layer activation the networks were trained with "
+                             "(default sigmoid)")
+    args = parser.parse_args()
+    server = make_server(args.model_dir, args.host, args.port, args.cache_size,
+                         args.max_batch_rows, args.max_delay_ms / 1000, args.activation)
+    print("Serving on http://" + args.host + ":" + str(server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
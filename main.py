@@ -1,4 +1,14 @@
-"""Main program"""
+"""Main program
+
+Without arguments the training or testing program is chosen interactively.
+With arguments the non-interactive command line interface is used instead,
+see command_line.py or run: python3 main.py --help
+"""
+import sys
+
+from command_line import (
+    main as command_line_main
+)
 from neural_network_programs import (
     training_program, testing_program
 )
@@ -9,11 +19,18 @@ def main():
         print("Program Options:")
         print("0  |  Training Program\n1  |  Testing Program")
         mode = input("To choose a program, type 0 or 1 and hit enter:\n")
-        if mode == '0':
-            print("Entered Training Program\n------------------------")
-            training_program()
-        if mode == '1':
-            print("Entered Testing Program\n------------------------")
-            testing_program()
+        try:
+            if mode == '0':
+                print("Entered Training Program\n------------------------")
+                training_program()
+            if mode == '1':
+                print("Entered Testing Program\n------------------------")
+                testing_program()
+        except FileNotFoundError as error:
+            print(error.args[0])
+            sys.exit(1)
 
-main()
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(command_line_main(sys.argv[1:]))
+    main()
@@ -0,0 +1,222 @@
+"""Vectorized evaluation metrics
+
+Confusion matrix values per output, as in write_statistics_to_file:
+    A: predicted 1, expected 1    B: predicted 1, expected 0
+    C: predicted 0, expected 1    D: predicted 0, expected 0
+
+compute_metrics derives accuracy, precision, recall and F1 per output and
+their micro and macro averages with array operations. Ratios whose
+denominator is zero (e.g. the precision of an output that is never
+predicted positive) are set to zero_division (0 by default) instead of
+raising ZeroDivisionError. Where the denominators are not zero the values
+are computed with the same floating point operations, in the same order, as
+the original per-output Python loop, so .results files are unchanged.
+
+roc_curve and precision_recall_curve give the metrics at every threshold
+of the output activations at once: the activations are sorted once and the
+true and false positives above each distinct activation are cumulative sums
+over the sorted labels. roc_auc and average_precision summarise the curves.
+"""
+import numpy as np
+
+def confusion_counts(predicted, expected):
+    """
+    Returns confusion matrix values A, B, C, D per output
+
+    Args:
+        predicted: 2 dimensional boolean array [num_examples x num_outputs]
+        expected: 2 dimensional array of 0/1 labels [num_examples x num_outputs]
+    Returns:
+        a, b, c, d: Integer arrays [num_outputs]
+    """
+    predicted = np.asarray(predicted, dtype=bool)
+    expected = np.asarray(expected)
+    actual_positive = expected == 1
+    actual_negative = expected == 0
+    return (np.count_nonzero(predicted & actual_positive, axis=0),
+            np.count_nonzero(predicted & actual_negative, axis=0),
+            np.count_nonzero(~predicted & actual_positive, axis=0),
+            np.count_nonzero(~predicted & actual_negative, axis=0))
+
+def safe_divide(numerator, denominator, zero_division=0.0):
+    """Returns numerator / denominator as floats, zero_division where the
+    denominator is zero"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    result = np.full(np.broadcast(numerator, denominator).shape, zero_division)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+def sequential_mean(values, zero_division=0.0):
+    """Returns the mean of values summed from left to right (like Python's
+    sum, unlike the pairwise summation of np.sum)"""
+    if not len(values):
+        return zero_division
+    return float(np.cumsum(values)[-1] / len(values))
+
+def f_1_score(precision, recall, zero_division=0.0):
+    """Returns the harmonic mean of precision and recall"""
+    precision = np.asarray(precision, dtype=np.float64)
+    return safe_divide(2 * precision * recall, precision + recall, zero_division)
+
+def compute_metrics(a, b, c, d, zero_division=0.0):
+    """
+    Returns accuracy, precision, recall and F1 per output and their micro
+    and macro averages given confusion matrix values A, B, C, D
+
+    Args:
+        a, b, c, d: Integer arrays or lists [num_outputs]
+        zero_division: Floating point value of ratios with a zero denominator
+
+    Returns:
+        metrics: Dictionary with per output float arrays overall_accuracy,
+            precision, recall and f_1 and the floats micro_avg_* and
+            macro_avg_* of every metric (keys of compute_statistics)
+    """
+    a, b, c, d = [np.asarray(counts, dtype=np.int64) for counts in (a, b, c, d)]
+    metrics = {
+        "overall_accuracy": safe_divide(a + d, a + b + c + d, zero_division),
+        "precision": safe_divide(a, a + b, zero_division),
+        "recall": safe_divide(a, a + c, zero_division),
+    }
+    metrics["f_1"] = f_1_score(metrics["precision"], metrics["recall"], zero_division)
+
+    a_global, b_global, c_global, d_global = [int(counts.sum()) for counts in (a, b, c, d)]
+    micro_precision = safe_divide(a_global, a_global + b_global, zero_division)
+    micro_recall = safe_divide(a_global, a_global + c_global, zero_division)
+    metrics["micro_avg_overall_accuracy"] = float(safe_divide(
+        a_global + d_global, a_global + b_global + c_global + d_global, zero_division))
+    metrics["micro_avg_precision"] = float(micro_precision)
+    metrics["micro_avg_recall"] = float(micro_recall)
+    metrics["micro_avg_f_1"] = float(f_1_score(micro_precision, micro_recall, zero_division))
+
+    macro_precision = sequential_mean(metrics["precision"], zero_division)
+    macro_recall = sequential_mean(metrics["recall"], zero_division)
+    metrics["macro_avg_overall_accuracy"] = sequential_mean(metrics["overall_accuracy"],
+                                                            zero_division)
+    metrics["macro_avg_precision"] = macro_precision
+    metrics["macro_avg_recall"] = macro_recall
+    metrics["macro_avg_f_1"] = float(f_1_score(macro_precision, macro_recall, zero_division))
+    return metrics
+
+def ranked_counts(scores, expected):
+    """
+    Returns the true and false positives when predicting 1 for every score
+    at or above each distinct score, from one sort of the scores
+
+    Args:
+        scores: 1 dimensional float array of output activations
+        expected: 1 dimensional array of 0/1 labels
+
+    Returns:
+        thresholds: Distinct scores in decreasing order
+        true_positives, false_positives: Integer arrays, counts at each threshold
+    """
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    positive = np.asarray(expected).ravel() == 1
+    order = np.argsort(-scores, kind="stable")
+    sorted_scores = scores[order]
+    # Last position of every run of equal scores
+    ends = np.append(np.flatnonzero(np.diff(sorted_scores)), len(scores) - 1) \
+        if len(scores) else np.zeros(0, dtype=np.intp)
+    true_positives = np.cumsum(positive[order])[ends]
+    false_positives = ends + 1 - true_positives
+    return sorted_scores[ends], true_positives, false_positives
+
+def roc_curve(scores, expected, zero_division=0.0):
+    """
+    Returns the receiver operating characteristic of one output
+
+    Returns:
+        false_positive_rate, true_positive_rate, thresholds: Float arrays
+            starting at (0, 0) with threshold inf
+    """
+    thresholds, true_positives, false_positives = ranked_counts(scores, expected)
+    num_positive = true_positives[-1] if len(true_positives) else 0
+    num_negative = false_positives[-1] if len(false_positives) else 0
+    return (np.append(0.0, safe_divide(false_positives, num_negative, zero_division)),
+            np.append(0.0, safe_divide(true_positives, num_positive, zero_division)),
+            np.append(np.inf, thresholds))
+
+def precision_recall_curve(scores, expected, zero_division=0.0):
+    """
+    Returns the precision and recall of one output at every threshold
+
+    Returns:
+        precision, recall, thresholds: Float arrays starting at recall 0
+            and precision 1 with threshold inf
+    """
+    thresholds, true_positives, false_positives = ranked_counts(scores, expected)
+    num_positive = true_positives[-1] if len(true_positives) else 0
+    return (np.append(1.0, safe_divide(true_positives, true_positives + false_positives,
+                                       zero_division)),
+            np.append(0.0, safe_divide(true_positives, num_positive, zero_division)),
+            np.append(np.inf, thresholds))
+
+def roc_auc(scores, expected):
+    """Returns the area under the ROC curve of one output (trapezoidal rule),
+    None if the examples are all positive or all negative"""
+    positive = np.asarray(expected).ravel() == 1
+    if positive.all() or not positive.any():
+        return None
+    false_positive_rate, true_positive_rate, _ = roc_curve(scores, expected)
+    return float(np.sum(np.diff(false_positive_rate)
+                        * (true_positive_rate[1:] + true_positive_rate[:-1]) / 2))
+
+def average_precision(scores, expected):
+    """Returns the area under the precision-recall curve of one output as
+    the sum of precisions weighted by the increase in recall, None if no
+    example is positive"""
+    if not np.any(np.asarray(expected) == 1):
+        return None
+    precision, recall, _ = precision_recall_curve(scores, expected)
+    return float(np.sum(np.diff(recall) * precision[1:]))
+
+def evaluation_report(scores, expected, thresholds=(0.5,), curves=True):
+    """
+    Returns a JSON-ready dictionary evaluating output activations
+
+    Args:
+        scores: 2 dimensional float array of output activations
+            [num_examples x num_outputs]
+        expected: 2 dimensional array of 0/1 labels [num_examples x num_outputs]
+        thresholds: Array of thresholds (activations >= threshold predict 1)
+        curves: Boolean, include the points of the ROC and precision-recall
+            curves of every output
+
+    Returns:
+        report: Dictionary with examples, thresholds (per threshold A, B, C,
+            D and the metrics of compute_metrics) and outputs (per output
+            roc_auc, average_precision and, with curves, roc and pr points;
+            infinite thresholds and undefined areas are None)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    expected = np.asarray(expected)
+    report = {"examples": len(scores), "thresholds": [], "outputs": []}
+    for threshold in thresholds:
+        a, b, c, d = confusion_counts(scores >= threshold, expected)
+        entry = {"threshold": float(threshold), "a": a.tolist(), "b": b.tolist(),
+                 "c": c.tolist(), "d": d.tolist()}
+        for key, value in compute_metrics(a, b, c, d).items():
+            entry[key] = value.tolist() if isinstance(value, np.ndarray) else value
+        report["thresholds"].append(entry)
+    for output in range(scores.shape[1]):
+        output_scores, output_expected = scores[:, output], expected[:, output]
+        entry = {"roc_auc": roc_auc(output_scores, output_expected),
+                 "average_precision": average_precision(output_scores, output_expected)}
+        if curves:
+            false_positive_rate, true_positive_rate, roc_thresholds = roc_curve(
+                output_scores, output_expected)
+            precision, recall, pr_thresholds = precision_recall_curve(output_scores,
+                                                                      output_expected)
+            entry["roc"] = {"false_positive_rate": false_positive_rate.tolist(),
+                            "true_positive_rate": true_positive_rate.tolist(),
+                            "thresholds": _finite_or_none(roc_thresholds)}
+            entry["pr"] = {"precision": precision.tolist(), "recall": recall.tolist(),
+                           "thresholds": _finite_or_none(pr_thresholds)}
+        report["outputs"].append(entry)
+    return report
+
+def _finite_or_none(values):
+    """Returns values as a list with infinite values replaced by None"""
+    return [float(value) if np.isfinite(value) else None for value in values]
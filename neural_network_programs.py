@@ -1,9 +1,35 @@
 """ Training program, test program, and functions used by both """
+import itertools
+import os
 import random
+import tempfile
+
+import numpy as np
 
 from back_prop_algorithm import (
     back_prop_learning, load_input_values, forward_propagate
 )
+from binary_formats import (
+    is_binary_examples_file, read_binary_examples_header, load_binary_examples,
+    write_binary_examples, is_binary_network_file, load_binary_weights,
+    write_binary_weights, NETWORK_EXTENSION
+)
+from checkpoints import (
+    prepare_checkpointing
+)
+from metrics import (
+    compute_metrics
+)
+from shuffling import (
+    check_shuffle
+)
+from vectorized_back_prop import (
+    network_to_weights, copy_weights_to_network, confusion_counts_matrix,
+    confusion_counts_chunks, shuffled_chunk_source, train_weights_streaming
+)
+
+# Default number of examples per chunk read by stream_examples
+DEFAULT_CHUNK_SIZE = 4096
 
 class Node:
     """
@@ -18,15 +44,27 @@ class Node:
         input_value: Floating point value of the sum of input values
                 to the node
     """
+    # inputValue is set by forward_propagate
+    __slots__ = ("weights", "inputs", "value", "input_value", "inputValue")
+
     def __init__(self):
         self.weights = []
         self.inputs = []
         self.value = 0
         self.input_value = 0
 
+def open_file(filename):
+    """Opens file for reading, raising FileNotFoundError("No such file: ...")
+    if it does not exist"""
+    try:
+        return open(filename, "r")
+    except FileNotFoundError:
+        raise FileNotFoundError("No such file: '" + filename + "'") from None
+
 def generate_network(filename):
     """
     Returns a network generated from formatted initial weights file (.init)
+    or binary network file (see binary_formats.py)
 
     Args:
         filename: String referring to name of weights file located in folder
@@ -35,11 +73,10 @@ def generate_network(filename):
             e.g. [[num_nodes_per_layer] x num_layers]
 
     """
-    try:
-        file = open(filename, "r")
-    except IOError:
-        print("No such file: '" + filename + "'")
-        quit()
+    file = open_file(filename)
+    if is_binary_network_file(filename):
+        file.close()
+        return weights_to_network(load_binary_weights(filename))
     # Get layer sizes from first line of file
     layer_sizes = []
     for size in next(file).split():
@@ -64,13 +101,49 @@ def generate_network(filename):
     file.close()
     return network
 
+def weights_to_network(weights):
+    """
+    Returns a network of nodes given weight matrices
+
+    Args:
+        weights: Array of 2 dimensional float arrays, one per non-input layer
+            e.g. [num_nodes x (num_nodes_in_previous_layer + 1)]
+    Returns:
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+    """
+    network = [[Node() for _ in range(weights[0].shape[1] - 1)]]
+    for layer_weights in weights:
+        layer = []
+        for node_weights in layer_weights:
+            node = Node()
+            node.weights = node_weights.tolist()
+            node.inputs = list(network[-1])
+            layer.append(node)
+        network.append(layer)
+    return network
+
+def generate_weights(filename):
+    """
+    Returns the weight matrices of a weights file (.init, .trained or binary)
+
+    Binary network files are copied out of the memory map so the returned
+    matrices can be trained in place.
+    """
+    file = open_file(filename)
+    file.close()
+    if is_binary_network_file(filename):
+        return [np.array(layer_weights) for layer_weights in load_binary_weights(filename)]
+    return network_to_weights(generate_network(filename))
+
 def generate_new_network(num_inputs, num_hidden_nodes, num_outputs):
     """
     Returns a random network of nodes given layer sizes
 
     Args:
         num_inputs: Integer number of input nodes
-        num_hidden_nodes: Integer number of hidden layer nodes
+        num_hidden_nodes: Integer number of hidden layer nodes, or array of
+            integer numbers of nodes per hidden layer for deeper networks
         num_outputs: Integer number of output nodes
 
     Returns:
@@ -78,8 +151,9 @@ def generate_new_network(num_inputs, num_hidden_nodes, num_outputs):
             e.g. [[num_nodes_per_layer] x num_layers]
 
     """
-    # Get layer sizes from first line of file
-    layer_sizes = [num_inputs, num_hidden_nodes, num_outputs]
+    if isinstance(num_hidden_nodes, int):
+        num_hidden_nodes = [num_hidden_nodes]
+    layer_sizes = [num_inputs] + list(num_hidden_nodes) + [num_outputs]
     # Initialize network with correct number of nodes per layer
     network = []
     for size in layer_sizes:
@@ -99,19 +173,20 @@ def generate_new_network(num_inputs, num_hidden_nodes, num_outputs):
 def get_examples(filename):
     """
     Returns inputs and outputs for examples from formatted training file (.train)
+    or binary examples file (see binary_formats.py)
 
     Args:
         filename: String referring to name of training file located in folder
     Returns:
         inputs, outputs: Array of examples in the form of input and output values
             e.g [[num_examples x num_inputs],[num_examples x num_outputs]]
+            (memory mapped arrays for binary examples files)
 
     """
-    try:
-        file = open(filename, "r")
-    except IOError:
-        print("No such file: '" + filename + "'")
-        quit()
+    file = open_file(filename)
+    if is_binary_examples_file(filename):
+        file.close()
+        return load_binary_examples(filename)
 
     num_examples, num_inputs, num_outputs = [int(x) for x in next(file).split()]
     examples = []
@@ -126,21 +201,223 @@ def get_examples(filename):
 
     return inputs, outputs
 
+def load_examples(filename, dtype=np.float64, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns inputs and outputs of a training file (.train) or binary examples
+    file as compact arrays, without building Python lists of every value
+
+    Args:
+        filename: String referring to name of training file located in folder
+        dtype: np.float64 or np.float32, type of the inputs
+        chunk_size: Integer number of examples parsed at a time
+    Returns:
+        inputs, outputs: 2 dimensional arrays [num_examples x num_inputs] of
+            dtype and [num_examples x num_outputs] uint8 labels (memory mapped
+            for binary files that already store inputs as dtype)
+    """
+    num_examples, num_inputs, num_outputs = read_examples_header(filename)
+    if is_binary_examples_file(filename):
+        inputs, outputs = load_binary_examples(filename)
+        return np.asarray(inputs, dtype=dtype), outputs
+    inputs = np.empty((num_examples, num_inputs), dtype=dtype)
+    outputs = np.empty((num_examples, num_outputs), dtype=np.uint8)
+    start = 0
+    for chunk_inputs, chunk_outputs in stream_examples(filename, chunk_size):
+        stop = start + len(chunk_inputs)
+        labels = chunk_outputs.astype(np.uint8)
+        if not np.array_equal(labels, chunk_outputs):
+            raise ValueError("Outputs of '" + filename + "' must be integers from 0 to 255")
+        inputs[start:stop] = chunk_inputs
+        outputs[start:stop] = labels
+        start = stop
+    return inputs, outputs
+
+def read_examples_header(filename):
+    """Returns (num_examples, num_inputs, num_outputs) from the first line of a
+    formatted training file (.train) or the header of a binary examples file"""
+    file = open_file(filename)
+    if is_binary_examples_file(filename):
+        file.close()
+        return read_binary_examples_header(filename)[:3]
+    with file:
+        return tuple(int(x) for x in next(file).split())
+
+def stream_examples(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yields chunks of inputs and outputs from formatted training file (.train)
+    or binary examples file so that only chunk_size examples are held in
+    memory at a time
+
+    Args:
+        filename: String referring to name of training file located in folder
+        chunk_size: Integer maximum number of examples per chunk
+    Yields:
+        inputs, outputs: Contiguous 2 dimensional float arrays
+            e.g. [chunk_size x num_inputs], [chunk_size x num_outputs]
+    """
+    file = open_file(filename)
+    if is_binary_examples_file(filename):
+        file.close()
+        inputs, outputs = load_binary_examples(filename)
+        for start in range(0, len(inputs), chunk_size):
+            yield inputs[start:start + chunk_size], outputs[start:start + chunk_size]
+        return
+    with file:
+        num_examples, num_inputs, num_outputs = [int(x) for x in next(file).split()]
+        num_columns = num_inputs + num_outputs
+        remaining = num_examples
+        while remaining > 0:
+            lines = list(itertools.islice(file, min(chunk_size, remaining)))
+            if not lines:
+                raise ValueError("'" + filename + "' ended after "
+                                 + str(num_examples - remaining) + " of "
+                                 + str(num_examples) + " examples")
+            remaining -= len(lines)
+            chunk = np.array(" ".join(lines).split(), dtype=np.float64)
+            chunk = chunk.reshape(len(lines), num_columns)
+            yield (np.ascontiguousarray(chunk[:, :num_inputs]),
+                   np.ascontiguousarray(chunk[:, num_inputs:]))
+
+def convert_examples_to_binary(text_filename, binary_filename, dtype=np.float64,
+                               chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Converts a formatted training file (.train/.test) to a binary examples file
+
+    The binary file is written under a temporary name and renamed when
+    complete, so a training file with an output that is not a 0/1 label
+    raises ValueError (naming its line) without writing binary_filename.
+
+    Args:
+        text_filename: String referring to name of training file
+        binary_filename: String referring to name of binary file to write
+        dtype: np.float32 or np.float64, type used to store inputs
+        chunk_size: Integer number of examples converted at a time
+    """
+    num_examples, num_inputs, num_outputs = read_examples_header(text_filename)
+    directory = os.path.dirname(os.path.abspath(binary_filename))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(descriptor)
+    try:
+        write_binary_examples(temporary, check_labels(text_filename, chunk_size),
+                              num_examples, num_inputs, num_outputs, dtype)
+        os.replace(temporary, binary_filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def check_labels(filename, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the chunks of stream_examples of a training file, raising
+    ValueError at the first example with an output that is not 0 or 1"""
+    # Line 1 of the file is the header
+    line = 2
+    for inputs, outputs in stream_examples(filename, chunk_size):
+        invalid = ((outputs != 0) & (outputs != 1)).any(axis=1)
+        if invalid.any():
+            row = int(np.argmax(invalid))
+            raise ValueError("Line " + str(line + row) + " of '" + filename
+                             + "': outputs must be 0 or 1, got "
+                             + " ".join("%g" % value for value in outputs[row]))
+        line += len(outputs)
+        yield inputs, outputs
+
+def convert_examples_to_text(binary_filename, text_filename, input_format="%1.3f",
+                             chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Converts a binary examples file to a formatted training file (.train/.test)
+
+    Args:
+        binary_filename: String referring to name of binary examples file
+        text_filename: String referring to name of training file to write
+        input_format: Format of input values, "%1.3f" like the youtube files
+            (use e.g. "%.17g" to keep full precision)
+        chunk_size: Integer number of examples converted at a time
+    """
+    num_examples, num_inputs, num_outputs = read_examples_header(binary_filename)
+    row_format = " ".join([input_format] * num_inputs + ["%d"] * num_outputs)
+    with open(text_filename, "w+") as file:
+        file.write(str(num_examples) + " " + str(num_inputs) + " " + str(num_outputs) + "\n")
+        for inputs, outputs in stream_examples(binary_filename, chunk_size):
+            np.savetxt(file, np.hstack((inputs, outputs)), fmt=row_format)
+
+def back_prop_learning_from_file(filename, network, learning_rate, num_epochs,
+                                 batch_size=1, chunk_size=DEFAULT_CHUNK_SIZE, callbacks=None,
+                                 verbose=True, checkpointer=None, resume=False,
+                                 activation="sigmoid", dtype=np.float64, optimizer=None,
+                                 schedule=None, shuffle="none", seed=0):
+    """
+    Returns a network after training it on a training file (.train) that is
+    streamed in chunks every epoch instead of being loaded into memory
+
+    Args:
+        filename: String referring to name of training file located in folder
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update, 1 for
+            online learning or None for full-batch gradient descent
+        chunk_size: Integer number of examples read from the file at a time
+        callbacks: Array of functions called with the record of every epoch
+            (see training_telemetry.py)
+        verbose: Boolean, print a line after every completed epoch
+        checkpointer: Checkpointer saving periodic checkpoints (see
+            checkpoints.py), or None
+        resume: Boolean, continue from the checkpointer's file if it exists
+        activation: String name of the hidden layer activation function (see
+            helper_functions.ACTIVATIONS)
+        dtype: np.float64 or np.float32, type training runs in
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent. Its state is saved with checkpoints
+        schedule: LearningRateSchedule giving the learning rate of every
+            epoch, None for a constant learning rate
+        shuffle: String order of the examples in every epoch, "none",
+            "random" or "stratified" (see shuffling.py). Shuffling reads rows
+            of a memory mapped binary examples file in random order, so it
+            is not supported for text files
+        seed: Integer seed of the shuffled orders. The state of the random
+            number generator is saved with checkpoints
+
+    Returns:
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+    """
+    if batch_size is None:
+        batch_size = read_examples_header(filename)[0]
+    chunk_source = lambda: stream_examples(filename, chunk_size)
+    rng = np.random.default_rng(seed)
+    if check_shuffle(shuffle) != "none":
+        if not is_binary_examples_file(filename):
+            raise ValueError("Shuffling a streamed training file needs a binary examples "
+                             "file, got '" + filename + "'")
+        inputs, outputs = load_binary_examples(filename)
+        chunk_source = shuffled_chunk_source(inputs, outputs, shuffle, rng)
+    weights = network_to_weights(network, dtype)
+    if checkpointer is not None:
+        checkpointer.rng = rng
+    start_epoch, callbacks = prepare_checkpointing(checkpointer, weights, callbacks, resume,
+                                                   optimizer)
+    train_weights_streaming(chunk_source, weights,
+                            learning_rate, num_epochs, batch_size, verbose, callbacks,
+                            start_epoch, activation, optimizer, schedule)
+    return copy_weights_to_network(weights, network)
+
 def write_network_to_file(filename, network):
     """
-    Writes the network (layer sizes + weights) to a file
+    Writes the network (layer sizes + weights) to a file. Filenames ending
+    in NETWORK_EXTENSION get the full precision binary format, other files
+    get the text format with weights rounded to 3 decimals.
 
     Args:
         filename: String referring to name of weights file located in folder
         network: 2 dimensional array of nodes
             e.g. [[num_nodes_per_layer] x num_layers]
     """
+    if filename.endswith(NETWORK_EXTENSION):
+        write_binary_weights(filename, network_to_weights(network))
+        return
     file = open(filename, "w+")
-    num_inputs = len(network[0])
-    num_hidden_nodes = len(network[1])
-    num_outputs = len(network[2])
-    file.write(str(num_inputs) + " " + str(num_hidden_nodes) + " " + str(num_outputs) + "\n")
-    for i in range(1, 3):
+    file.write(" ".join(str(len(layer)) for layer in network) + "\n")
+    for i in range(1, len(network)):
         for node in network[i]:
             weights = ""
             for weight in node.weights:
@@ -148,6 +425,13 @@ def write_network_to_file(filename, network):
             file.write(weights.strip() +  "\n")
     file.close()
 
+def write_weights_to_file(filename, weights):
+    """Writes weight matrices to a file in the same formats as write_network_to_file"""
+    if filename.endswith(NETWORK_EXTENSION):
+        write_binary_weights(filename, weights)
+        return
+    write_network_to_file(filename, weights_to_network(weights))
+
 def training_program():
     """Lets user specify initial weights file and a training file, generates
     the network and writes the network to user specified file"""
@@ -158,9 +442,21 @@ def training_program():
     output_file = input("Enter output filename:\n")
     num_epochs = int(input("Enter the number of epochs:\n"))
     learning_rate = float(input("Enter the learning rate:\n"))
-    trained_network = back_prop_learning(examples, network, learning_rate, num_epochs)
+    batch_size = get_batch_size(input("Enter the batch size (1 for online learning, "
+                                      "0 for full-batch, default 1):\n"))
+    trained_network = back_prop_learning(examples, network, learning_rate, num_epochs,
+                                         batch_size)
     write_network_to_file(output_file, trained_network)
 
+def get_batch_size(text):
+    """Returns batch size entered by user: 1 if blank, None (full-batch) if 0"""
+    if not text.strip():
+        return 1
+    batch_size = int(text)
+    if batch_size == 0:
+        return None
+    return batch_size
+
 def threshold_function(value):
     """Returns 0 or 1 depending on whether value is >= 0.5"""
     if value < 0.5:
@@ -172,7 +468,7 @@ def predict(network, examples):
     """Returns confusion matrix values A, B, C, D given test examples"""
     inputs, outputs = examples
     input_nodes = network[0]
-    output_nodes = network[2]
+    output_nodes = network[-1]
     num_outputs = len(output_nodes)
     a = [0 for i in range(num_outputs)]
     b = [0 for i in range(num_outputs)]
@@ -197,51 +493,62 @@ def predict(network, examples):
                     d[i] += 1
     return a, b, c, d
 
+def predict_batch(network, examples, chunk_size=None, activation="sigmoid", dtype=np.float64):
+    """
+    Returns confusion matrix values A, B, C, D given test examples, scoring
+    the examples (or chunks of chunk_size examples) in a single vectorized
+    forward pass of type dtype. Gives the same results as predict (with the
+    default sigmoid activation and float64).
+    """
+    inputs, outputs = examples
+    a, b, c, d = confusion_counts_matrix(network_to_weights(network, dtype), inputs, outputs,
+                                         chunk_size, activation)
+    return a.tolist(), b.tolist(), c.tolist(), d.tolist()
+
+def predict_from_file(network, filename, chunk_size=DEFAULT_CHUNK_SIZE, activation="sigmoid",
+                      dtype=np.float64):
+    """Returns confusion matrix values A, B, C, D for a test file (.test)
+    streamed in chunks of chunk_size examples"""
+    a, b, c, d = confusion_counts_chunks(network_to_weights(network, dtype),
+                                         stream_examples(filename, chunk_size), activation)
+    return a.tolist(), b.tolist(), c.tolist(), d.tolist()
+
+def compute_statistics(a, b, c, d):
+    """
+    Returns a dictionary of statistics given A, B, C, D confusion matrix values:
+    per output lists overall_accuracy, precision, recall and f_1, and the
+    micro_avg_* and macro_avg_* averages of each metric. Ratios with a zero
+    denominator are 0 (see metrics.compute_metrics).
+    """
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value
+            for key, value in compute_metrics(a, b, c, d).items()}
+
 def write_statistics_to_file(filename, a, b, c, d):
     """
     Computes additional statistics given A, B, C, D confusion matrix values
-    and writes metric values to user specified file.
+    and writes metric values to user specified file (metrics with a zero
+    denominator are written as 0.000).
     """
-    num_outputs = len(a)
-    overall_accuracy = [(a[i] + d[i]) / (a[i] + b[i]+ c[i]+ d[i])
-                        for i in range(num_outputs)]
-    precision = [a[i] / (a[i] + b[i]) for i in range(num_outputs)]
-    recall = [a[i] / (a[i] + c[i]) for i in range(num_outputs)]
-    f_1 = [(2 * precision[i] * recall[i]) / (precision[i] + recall[i])
-           for i in range(num_outputs)]
-
-    a_global = sum(a)
-    b_global = sum(b)
-    c_global = sum(c)
-    d_global = sum(d)
-
-    micro_avg_overall_accuracy = (a_global + d_global) / (a_global + b_global
-                                                          + c_global + d_global)
-    micro_avg_precision = a_global / (a_global + b_global)
-    micro_avg_recall = a_global / (a_global + c_global)
-    micro_avg_f_1 = (2 * micro_avg_precision * micro_avg_recall) / (micro_avg_precision
-                                                                    + micro_avg_recall)
-
-    macro_avg_overall_accuracy = sum(overall_accuracy)/len(overall_accuracy)
-    macro_avg_precision = sum(precision)/len(precision)
-    macro_avg_recall = sum(recall)/len(recall)
-    macro_avg_f_1 = (2 * macro_avg_precision * macro_avg_recall) / (macro_avg_precision
-                                                                    + macro_avg_recall)
+    statistics = compute_statistics(a, b, c, d)
+    overall_accuracy = statistics["overall_accuracy"]
+    precision = statistics["precision"]
+    recall = statistics["recall"]
+    f_1 = statistics["f_1"]
     file = open(filename, "w+")
-    for i in range(num_outputs):
+    for i in range(len(a)):
         file.write(str(a[i]) + " " + str(b[i]) + " " + str(c[i]) + " " + str(d[i]) + " "
                    + "{0:.3f}".format(overall_accuracy[i]) + " "
                    + "{0:.3f}".format(precision[i]) + " "
                    + "{0:.3f}".format(recall[i]) + " "
                    + "{0:.3f}".format(f_1[i]) + "\n");
-    file.write("{0:.3f}".format(micro_avg_overall_accuracy) + " "
-               + "{0:.3f}".format(micro_avg_precision) + " "
-               + "{0:.3f}".format(micro_avg_recall) + " "
-               + "{0:.3f}".format(micro_avg_f_1) + "\n")
-    file.write("{0:.3f}".format(macro_avg_overall_accuracy) + " "
-               + "{0:.3f}".format(macro_avg_precision) + " "
-               + "{0:.3f}".format(macro_avg_recall) + " "
-               + "{0:.3f}".format(macro_avg_f_1) + "\n");
+    file.write("{0:.3f}".format(statistics["micro_avg_overall_accuracy"]) + " "
+               + "{0:.3f}".format(statistics["micro_avg_precision"]) + " "
+               + "{0:.3f}".format(statistics["micro_avg_recall"]) + " "
+               + "{0:.3f}".format(statistics["micro_avg_f_1"]) + "\n")
+    file.write("{0:.3f}".format(statistics["macro_avg_overall_accuracy"]) + " "
+               + "{0:.3f}".format(statistics["macro_avg_precision"]) + " "
+               + "{0:.3f}".format(statistics["macro_avg_recall"]) + " "
+               + "{0:.3f}".format(statistics["macro_avg_f_1"]) + "\n");
     file.close()
 
 def testing_program():
@@ -252,5 +559,5 @@ def testing_program():
     testing_file = input("Enter testing filename:\n")
     examples = get_examples(testing_file)
     output_file = input("Enter output filename:\n")
-    a, b, c, d = predict(network, examples)
+    a, b, c, d = predict_batch(network, examples)
     write_statistics_to_file(output_file, a, b, c, d)
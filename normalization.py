@@ -0,0 +1,114 @@
+"""Standardization statistics of input features
+
+Inputs are standardized to zero mean and unit standard deviation per
+column, (x - mean) / std, like standardize in
+youtube-dataset-misc-files/create_train_test_files_youtube.py. The
+statistics are accumulated over chunks of rows in one streaming pass and
+saved as JSON, so that raw feature rows can later be put on the same scale:
+a network file's statistics are kept next to it, in
+normalization_file(network_filename).
+"""
+import json
+import os
+
+import numpy as np
+
+NORMALIZATION_EXTENSION = ".normalization.json"
+
+class RunningStatistics:
+    """
+    Per-column count, mean and variance of rows seen so far, updated one
+    chunk at a time with Welford's method (in the pairwise form of Chan et
+    al., which merges the mean and sum of squared deviations of a whole
+    chunk), so any number of rows can be summarised without precision loss
+    from large sums
+
+    Attributes:
+        count: Integer number of rows seen
+        mean: Float array [num_columns]
+        m2: Float array [num_columns] of summed squared deviations from the mean
+    """
+    def __init__(self, num_columns):
+        self.count = 0
+        self.mean = np.zeros(num_columns)
+        self.m2 = np.zeros(num_columns)
+
+    def update(self, rows):
+        """Add a chunk of rows [num_rows x num_columns]"""
+        rows = np.asarray(rows, dtype=np.float64)
+        num_rows = len(rows)
+        if not num_rows:
+            return
+        chunk_mean = rows.mean(axis=0)
+        chunk_m2 = ((rows - chunk_mean) ** 2).sum(axis=0)
+        total = self.count + num_rows
+        delta = chunk_mean - self.mean
+        self.mean = self.mean + delta * (num_rows / total)
+        self.m2 = self.m2 + chunk_m2 + delta ** 2 * (self.count * num_rows / total)
+        self.count = total
+
+    def std(self):
+        """Returns the population standard deviation per column (like np.std)"""
+        if not self.count:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self.m2 / self.count)
+
+def save_normalization(filename, mean, std, count=None):
+    """Writes standardization statistics to a JSON file"""
+    statistics = {"mean": [float(value) for value in mean],
+                  "std": [float(value) for value in std]}
+    if count is not None:
+        statistics["count"] = int(count)
+    with open(filename, "w+") as file:
+        json.dump(statistics, file, indent=2)
+        file.write("\n")
+
+def load_normalization(filename):
+    """Returns the mean and std arrays saved by save_normalization"""
+    try:
+        with open(filename, "r") as file:
+            statistics = json.load(file)
+    except FileNotFoundError:
+        raise FileNotFoundError("No such file: '" + filename + "'") from None
+    mean = np.array(statistics["mean"], dtype=np.float64)
+    std = np.array(statistics["std"], dtype=np.float64)
+    if mean.shape != std.shape or mean.ndim != 1:
+        raise ValueError("Malformed normalization file: '" + filename + "'")
+    return mean, std
+
+def normalization_file(network_filename):
+    """Returns the name of the statistics file kept next to a network file"""
+    return network_filename + NORMALIZATION_EXTENSION
+
+def copy_normalization(filename, network_filename):
+    """Saves the statistics of filename next to a network file"""
+    mean, std = load_normalization(filename)
+    save_normalization(normalization_file(network_filename), mean, std)
+
+def standardize_rows(rows, mean, std):
+    """
+    Returns raw feature rows standardized with mean and std; columns with
+    zero standard deviation are only centred
+    """
+    rows = np.asarray(rows)
+    if rows.dtype.kind != "f":
+        rows = rows.astype(np.float64)
+    if rows.shape[-1] != len(mean):
+        raise ValueError("Expected " + str(len(mean)) + " inputs per row, got "
+                         + str(rows.shape[-1]))
+    return ((rows - mean) / np.where(std > 0, std, 1)).astype(rows.dtype, copy=False)
+
+def standardize_chunks(chunks, mean, std):
+    """Yields (inputs, outputs) chunks, e.g. from stream_examples, with the
+    inputs standardized"""
+    for inputs, outputs in chunks:
+        yield standardize_rows(inputs, mean, std), outputs
+
+def load_network_normalization(network_filename):
+    """Returns the mean and std kept next to a network file, raising
+    FileNotFoundError if the network has no statistics"""
+    filename = normalization_file(network_filename)
+    if not os.path.exists(filename):
+        raise FileNotFoundError("No normalization statistics for '" + network_filename
+                                + "' (expected '" + filename + "')")
+    return load_normalization(filename)
@@ -0,0 +1,429 @@
+"""Incremental training of a trained network on appended examples
+
+Keeps a trained network current as new examples arrive, without retraining
+from scratch over the whole training file: the network is loaded once, a
+file that examples are appended to is followed (like tail -f) and every new
+example is used for one stochastic gradient descent update with the
+backprop of vectorized_back_prop.py, in batches of batch_size rows.
+
+Stream format: one example per line, the Ni input values followed by the No
+expected outputs, i.e. the lines of a .train file without its header line.
+Only complete lines (ending in a newline) are read, so a row that is still
+being written is never parsed; lines that do not hold Ni + No numbers are
+skipped and counted. A stream of "-" reads rows from standard input until
+it is closed.
+
+Updates are bounded: the update of every batch (over all layers) is scaled
+down to an L2 norm of at most max_update, and every row is seen only once,
+so a burst of unusual or mislabelled rows can only move the weights a
+limited distance. A partial batch is applied when the stream goes idle.
+
+The weights are published every publish_rows rows and/or publish_seconds
+seconds, and when learning stops: they are written to a temporary file next
+to the output file that then replaces it, so readers (e.g.
+inference_server.py, which reloads networks whose modification time
+changed) never see a partially written network. Networks published to
+NETWORK_EXTENSION files keep full precision, text files are rounded to 3
+decimals; learning always continues from the full precision weights.
+
+With a checkpoint file the weights, the byte offset reached in the stream
+and the counts of rows are saved (see checkpoints.py) whenever the weights
+are published, so a restarted learner continues after the last row it
+learned from instead of learning from rows twice (for standard input only
+the weights are restored).
+
+Example:
+    python3 main.py online youtube.1.500.trained new_rows.txt youtube.online.nnw \
+        --learning-rate 0.05 --checkpoint youtube.online.npz --publish-rows 500
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from binary_formats import (
+    NETWORK_EXTENSION
+)
+from checkpoints import (
+    load_checkpoint, save_checkpoint
+)
+from neural_network_programs import (
+    generate_weights, write_weights_to_file
+)
+from normalization import (
+    copy_normalization, load_network_normalization, normalization_file, standardize_rows
+)
+from training_telemetry import (
+    EpochStatistics, run_callbacks, timer
+)
+from vectorized_back_prop import (
+    compute_gradients
+)
+
+# Default maximum L2 norm of the weight update of one batch
+DEFAULT_MAX_UPDATE = 0.1
+
+def publish_weights(filename, weights):
+    """Atomically writes weight matrices to a weights file (see
+    write_weights_to_file): readers see either the old or the new network"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    suffix = NETWORK_EXTENSION if filename.endswith(NETWORK_EXTENSION) else ".tmp"
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=suffix)
+    os.close(descriptor)
+    try:
+        write_weights_to_file(temporary, weights)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def clip_updates(updates, max_norm):
+    """Scales updates (array of matrices) in place down to an L2 norm over
+    all layers of at most max_norm (None for no bound), returns the scale"""
+    if max_norm is None:
+        return 1.0
+    norm = np.sqrt(sum(float((layer_updates ** 2).sum()) for layer_updates in updates))
+    if norm <= max_norm:
+        return 1.0
+    scale = max_norm / norm
+    for layer_updates in updates:
+        layer_updates *= scale
+    return scale
+
+def parse_rows(lines, num_columns):
+    """
+    Returns the examples of lines of a stream
+
+    Args:
+        lines: Array of complete lines (bytes, without the newline)
+        num_columns: Integer number of values per example (Ni + No)
+    Returns:
+        rows: 2 dimensional float array [num_valid_lines x num_columns]
+        valid: Boolean array, whether each line held an example
+    """
+    rows = []
+    valid = np.zeros(len(lines), dtype=bool)
+    for i, line in enumerate(lines):
+        try:
+            values = [float(value) for value in line.split()]
+        except ValueError:
+            continue
+        if len(values) == num_columns and all(np.isfinite(values)):
+            rows.append(values)
+            valid[i] = True
+    return np.array(rows, dtype=np.float64).reshape(len(rows), num_columns), valid
+
+def follow_lines(filename, offset=0, poll_interval=1.0, idle_timeout=None):
+    """
+    Yields the complete lines appended to a file, following it as it grows
+
+    A file that shrinks (truncated) or is replaced (rotated) is read again
+    from its start.
+
+    Args:
+        filename: String referring to name of the file
+        offset: Integer byte offset to start reading at
+        poll_interval: Floating point seconds to wait when there is no new line
+        idle_timeout: Floating point seconds without a new line after which
+            to stop, None to follow the file forever
+    Yields:
+        lines, ends: Array of complete lines (bytes, without the newline) and
+            integer array of the byte offset after each line; when no line
+            arrived within poll_interval lines is empty and ends holds the
+            current offset
+    """
+    file = open(filename, "rb")
+    try:
+        file.seek(offset)
+        partial = b""
+        last_line_time = time.monotonic()
+        while True:
+            data = file.read()
+            if data:
+                data = partial + data
+                cut = data.rfind(b"\n") + 1
+                partial = data[cut:]
+                if cut:
+                    lines = data[:cut - 1].split(b"\n")
+                    ends = offset + np.cumsum([len(line) + 1 for line in lines])
+                    offset = int(ends[-1])
+                    last_line_time = time.monotonic()
+                    yield lines, ends
+                    continue
+            status = os.stat(filename)
+            if status.st_size < offset + len(partial) \
+                    or status.st_ino != os.fstat(file.fileno()).st_ino:
+                file.close()
+                file = open(filename, "rb")
+                offset = 0
+                partial = b""
+                continue
+            if idle_timeout is not None and time.monotonic() - last_line_time >= idle_timeout:
+                return
+            yield [], np.array([offset])
+            time.sleep(poll_interval)
+    finally:
+        file.close()
+
+def read_lines(file, block_size=1 << 16):
+    """Yields (lines, ends) like follow_lines from a binary stream, e.g.
+    standard input, as soon as lines arrive, until it is closed"""
+    offset = 0
+    partial = b""
+    while True:
+        data = os.read(file.fileno(), block_size)
+        if not data:
+            return
+        data = partial + data
+        cut = data.rfind(b"\n") + 1
+        partial = data[cut:]
+        if cut:
+            lines = data[:cut - 1].split(b"\n")
+            ends = offset + np.cumsum([len(line) + 1 for line in lines])
+            offset = int(ends[-1])
+            yield lines, ends
+
+class OnlineLearner:
+    """
+    Applies bounded stochastic gradient descent updates to weight matrices
+    as the lines of a stream arrive
+
+    Attributes:
+        weights: Array of weight matrices trained in place
+        learning_rate: Floating point number
+        batch_size: Integer number of rows per update
+        max_update: Floating point maximum L2 norm of the update of a batch,
+            or None
+        activation: String name of the hidden layer activation function
+        rows: Integer number of rows learned from
+        skipped: Integer number of lines that held no example
+        updates: Integer number of updates applied
+        clipped: Integer number of updates scaled down to max_update
+        offset: Integer byte offset in the stream after the last row learned
+            from (or skipped)
+        statistics: EpochStatistics of the rows since the last publish, the
+            loss measured before the update of each batch
+    """
+    def __init__(self, weights, learning_rate, batch_size=1, max_update=DEFAULT_MAX_UPDATE,
+                 activation="sigmoid"):
+        self.weights = weights
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.max_update = max_update
+        self.activation = activation
+        self.num_inputs = weights[0].shape[1] - 1
+        self.num_outputs = weights[-1].shape[0]
+        self.rows = 0
+        self.skipped = 0
+        self.updates = 0
+        self.clipped = 0
+        self.offset = 0
+        self.statistics = EpochStatistics()
+        self.pending = np.zeros((0, self.num_inputs + self.num_outputs))
+        self.pending_ends = np.zeros(0, dtype=np.int64)
+        self.standardization = None
+
+    def add_lines(self, lines, ends):
+        """Learns from the examples of complete stream lines, see follow_lines"""
+        rows, valid = parse_rows(lines, self.num_inputs + self.num_outputs)
+        self.skipped += int(len(valid) - valid.sum())
+        if not len(rows):
+            if len(ends) and not len(self.pending):
+                self.offset = int(ends[-1])
+            return
+        if self.standardization is not None:
+            rows[:, :self.num_inputs] = standardize_rows(rows[:, :self.num_inputs],
+                                                         *self.standardization)
+        self.pending = np.concatenate([self.pending, rows])
+        self.pending_ends = np.concatenate([self.pending_ends, ends[valid]])
+        while len(self.pending) >= self.batch_size:
+            self.update(self.batch_size)
+        if not len(self.pending) and len(ends):
+            self.offset = int(ends[-1])
+
+    def flush(self):
+        """Learns from the rows of a partial batch"""
+        if len(self.pending):
+            self.update(len(self.pending))
+
+    def update(self, count):
+        """Applies one bounded update for the first count pending rows"""
+        inputs = self.pending[:count, :self.num_inputs]
+        outputs = self.pending[:count, self.num_inputs:]
+        updates = compute_gradients(self.weights, inputs, outputs, self.statistics,
+                                    self.activation)
+        for layer_updates in updates:
+            layer_updates *= self.learning_rate / count
+        if clip_updates(updates, self.max_update) < 1.0:
+            self.clipped += 1
+        for layer_weights, layer_updates in zip(self.weights, updates):
+            layer_weights += layer_updates
+        self.offset = int(self.pending_ends[count - 1])
+        self.pending = self.pending[count:]
+        self.pending_ends = self.pending_ends[count:]
+        self.rows += count
+        self.updates += 1
+
+    def state(self):
+        """Returns the counters saved with checkpoints"""
+        return {"offset": self.offset, "rows": self.rows, "skipped": self.skipped,
+                "updates": self.updates, "clipped": self.clipped}
+
+    def load_state(self, extra):
+        """Restores the counters of a checkpoint (see state)"""
+        for name in ("offset", "rows", "skipped", "updates", "clipped"):
+            if name in extra:
+                setattr(self, name, int(extra[name]))
+
+def online_learning(network_file, stream, output_file, learning_rate, batch_size=1,
+                    max_update=DEFAULT_MAX_UPDATE, publish_rows=1000, publish_seconds=None,
+                    checkpoint_file=None, from_start=False, raw=False, poll_interval=1.0,
+                    idle_timeout=None, max_rows=None, callbacks=None, verbose=True,
+                    activation="sigmoid"):
+    """
+    Trains a network on the examples appended to a stream and publishes it
+    to output_file at intervals, until the stream ends, idle_timeout passes,
+    max_rows rows have been learned from, a callback asks to stop or the
+    process is interrupted
+
+    Args:
+        network_file: String referring to name of trained network file
+            (.trained, .init or binary)
+        stream: String referring to name of the file examples are appended
+            to, "-" for standard input
+        output_file: String referring to name of the weights file to publish
+        learning_rate: Floating point number
+        batch_size: Integer number of rows per update
+        max_update: Floating point maximum L2 norm of the weight update of a
+            batch, None for unbounded updates
+        publish_rows: Integer number of rows learned from between publishes
+            (the first batch boundary at or after it), or None
+        publish_seconds: Floating point seconds between publishes, or None
+        checkpoint_file: String referring to name of checkpoint file to save
+            at every publish and resume from if it exists, or None
+        from_start: Boolean, learn from the rows already in the stream file
+            instead of only from rows appended after starting
+        raw: Boolean, rows hold raw feature values, standardized with the
+            statistics kept next to network_file (see normalization.py),
+            which are also kept next to output_file
+        poll_interval: Floating point seconds between checks for new rows
+        idle_timeout: Floating point seconds without new rows after which to
+            stop, None to follow the stream forever
+        max_rows: Integer number of rows after which to stop, or None
+        callbacks: Array of functions called with (record, weights) after
+            every publish, see training_telemetry.py; a callback returning
+            True stops learning
+        verbose: Boolean, print a line per publish
+        activation: String name of the hidden layer activation function
+    Returns:
+        weights: Array of the published weight matrices
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be a positive integer, got " + str(batch_size))
+    if publish_rows is None and publish_seconds is None:
+        raise ValueError("Either publish_rows or publish_seconds must be given")
+    callbacks = list(callbacks or [])
+    learner = OnlineLearner(generate_weights(network_file), learning_rate, batch_size,
+                            max_update, activation)
+    if raw:
+        learner.standardization = load_network_normalization(network_file)
+        if os.path.abspath(output_file) != os.path.abspath(network_file):
+            copy_normalization(normalization_file(network_file), output_file)
+    resumed = checkpoint_file is not None and os.path.exists(checkpoint_file)
+    if resumed:
+        checkpoint = load_checkpoint(checkpoint_file)
+        if [layer.shape for layer in checkpoint["weights"]] != \
+                [layer.shape for layer in learner.weights]:
+            raise ValueError("Checkpoint '" + checkpoint_file
+                             + "' does not match the layer sizes of the network")
+        learner.weights = checkpoint["weights"]
+        learner.load_state(checkpoint["extra"])
+    if stream == "-":
+        learner.offset = 0
+        lines = read_lines(sys.stdin.buffer)
+    else:
+        if not resumed and not from_start:
+            learner.offset = os.path.getsize(stream)
+        lines = follow_lines(stream, learner.offset, poll_interval, idle_timeout)
+
+    start_time = timer()
+    last_publish = {"time": start_time, "rows": learner.rows, "publishes": 0}
+
+    def publish():
+        now = timer()
+        publish_weights(output_file, learner.weights)
+        if checkpoint_file is not None:
+            save_checkpoint(checkpoint_file, learner.weights, learner.updates,
+                            extra=learner.state())
+        elapsed = now - last_publish["time"]
+        new_rows = learner.rows - last_publish["rows"]
+        statistics = learner.statistics
+        last_publish.update(time=now, rows=learner.rows, publishes=last_publish["publishes"] + 1)
+        record = {
+            "publish": last_publish["publishes"],
+            "rows": learner.rows,
+            "new_rows": new_rows,
+            "skipped": learner.skipped,
+            "updates": learner.updates,
+            "clipped": learner.clipped,
+            "loss": statistics.loss_sum / statistics.num_examples
+                    if statistics.num_examples else 0.0,
+            "offset": learner.offset,
+            "elapsed_time": now - start_time,
+            "rows_per_second": new_rows / elapsed if elapsed > 0 else 0.0,
+        }
+        learner.statistics = EpochStatistics()
+        if verbose:
+            print("Published " + output_file + " after " + str(learner.rows) + " rows ("
+                  + str(new_rows) + " new, loss " + "{0:.6f}".format(record["loss"]) + ", "
+                  + str(learner.clipped) + " clipped updates)")
+        return run_callbacks(callbacks, record, learner.weights)
+
+    def rows_until_publish():
+        if publish_rows is None:
+            return None
+        received = learner.rows + len(learner.pending) - last_publish["rows"]
+        return max(publish_rows - received, 1)
+
+    try:
+        for new_lines, ends in _split_lines(lines, rows_until_publish):
+            if new_lines:
+                if max_rows is not None:
+                    new_lines = new_lines[:max_rows - learner.rows - len(learner.pending)]
+                    ends = ends[:len(new_lines)]
+                learner.add_lines(new_lines, ends)
+            else:
+                learner.flush()
+            if max_rows is not None and learner.rows + len(learner.pending) >= max_rows:
+                break
+            due = publish_rows is not None \
+                and learner.rows - last_publish["rows"] >= publish_rows
+            if publish_seconds is not None and learner.rows > last_publish["rows"] \
+                    and timer() - last_publish["time"] >= publish_seconds:
+                due = True
+            if due and publish():
+                return learner.weights
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lines.close()
+    learner.flush()
+    if learner.rows > last_publish["rows"] or not last_publish["publishes"]:
+        publish()
+    return learner.weights
+
+def _split_lines(lines, budget):
+    """Yields the (lines, ends) of lines in pieces of at most budget() lines
+    (budget is called before every piece, None for any number), so that a
+    burst of rows does not delay publishes"""
+    for new_lines, ends in lines:
+        start = 0
+        while True:
+            size = budget()
+            stop = len(new_lines) if size is None else min(start + size, len(new_lines))
+            yield new_lines[start:stop], ends[start:stop]
+            start = stop
+            if start >= len(new_lines):
+                break
@@ -0,0 +1,236 @@
+"""Optimizers and learning rate schedules of the vectorized training engine
+
+The back-propagation update of a batch (see compute_gradients) is the
+direction the weights move in, i.e. the negative gradient of the squared
+error; plain gradient descent adds learning_rate times its mean over the
+batch to the weights. The other optimizers keep per-layer state arrays with
+the same shape and floating point type as the weight matrices (created at
+the first update) and use it to scale or smooth the updates:
+
+    momentum:  v = momentum * v + g                      w += rate * v
+    nesterov:  v = momentum * v + g                      w += rate * (g + momentum * v)
+    rmsprop:   s = decay * s + (1 - decay) * g ** 2      w += rate * g / (sqrt(s) + epsilon)
+    adam:      m = beta1 * m + (1 - beta1) * g
+               s = beta2 * s + (1 - beta2) * g ** 2      w += rate * m' / (sqrt(s') + epsilon)
+               (m' and s' corrected for their zero initial values)
+
+where g is the mean update of the batch. The state is part of checkpoints
+(see state and load_state), so resumed training continues with the same
+velocities and moments.
+
+A LearningRateSchedule gives the learning rate of every epoch from the base
+learning rate. Schedules depend only on the epoch number, so resuming from
+a checkpoint continues the schedule where it stopped.
+"""
+import math
+
+import numpy as np
+
+class Optimizer:
+    """
+    Plain gradient descent (the update of update_weights_matrix); base class
+    of the optimizers keeping state
+
+    Attributes:
+        name: String name of the optimizer in OPTIMIZERS
+        slots: Array of names of the per-layer state arrays
+        state: Dictionary of slot name -> array of per-layer state arrays,
+            None before the first update
+        num_steps: Integer number of updates applied
+    """
+    name = "sgd"
+    slots = ()
+
+    def __init__(self):
+        self.state = None
+        self.num_steps = 0
+
+    def step(self, weights, updates, learning_rate, batch_size):
+        """
+        Update the weight matrices in place
+
+        Args:
+            weights: Array of weight matrices (see network_to_weights)
+            updates: Array of update matrices summed over the batch (see
+                compute_gradients), may be overwritten
+            learning_rate: Floating point learning rate of the update
+            batch_size: Integer number of examples the updates were summed over
+        """
+        if self.state is None:
+            self.state = {slot: [np.zeros_like(layer_weights) for layer_weights in weights]
+                          for slot in self.slots}
+        self.num_steps += 1
+        for i, (layer_weights, layer_updates) in enumerate(zip(weights, updates)):
+            layer_updates *= layer_updates.dtype.type(1 / batch_size)
+            self.update_layer(i, layer_weights, layer_updates, learning_rate)
+
+    def update_layer(self, i, layer_weights, mean_updates, learning_rate):
+        """Update the weights of layer i given the mean updates of the batch"""
+        layer_weights += learning_rate * mean_updates
+
+    def layer_state(self, slot, i):
+        """Returns the state array slot of layer i"""
+        return self.state[slot][i]
+
+    def get_state(self):
+        """Returns the state as a dictionary of named arrays for checkpoints"""
+        arrays = {"optimizer": np.array(self.name), "optimizer_steps": np.array(self.num_steps)}
+        for slot, layers in (self.state or {}).items():
+            for i, layer_state in enumerate(layers):
+                arrays["optimizer_" + slot + "_" + str(i)] = layer_state
+        return arrays
+
+    def load_state(self, arrays, weights):
+        """
+        Restores the state saved by get_state (e.g. the extra arrays of a
+        checkpoint); checkpoints without optimizer state count as plain
+        gradient descent
+
+        Args:
+            arrays: Dictionary of named arrays
+            weights: Array of weight matrices the state belongs to
+        """
+        name = str(arrays["optimizer"]) if "optimizer" in arrays else Optimizer.name
+        if name != self.name:
+            raise ValueError("Checkpoint was trained with the " + name + " optimizer, not "
+                             + self.name)
+        self.num_steps = int(arrays.get("optimizer_steps", 0))
+        self.state = None
+        if not self.slots or "optimizer_" + self.slots[0] + "_0" not in arrays:
+            return
+        self.state = {}
+        for slot in self.slots:
+            layers = []
+            for i, layer_weights in enumerate(weights):
+                layer_state = arrays["optimizer_" + slot + "_" + str(i)]
+                if layer_state.shape != layer_weights.shape:
+                    raise ValueError("Optimizer state does not match the layer sizes "
+                                     "of the network")
+                layers.append(layer_state.astype(layer_weights.dtype))
+            self.state[slot] = layers
+
+class Momentum(Optimizer):
+    """Gradient descent with momentum (heavy ball)"""
+    name = "momentum"
+    slots = ("velocity",)
+
+    def __init__(self, momentum=0.9):
+        super().__init__()
+        self.momentum = momentum
+
+    def update_layer(self, i, layer_weights, mean_updates, learning_rate):
+        velocity = self.layer_state("velocity", i)
+        velocity *= self.momentum
+        velocity += mean_updates
+        layer_weights += learning_rate * velocity
+
+class Nesterov(Momentum):
+    """Gradient descent with Nesterov momentum, in the form that evaluates
+    updates at the current weights"""
+    name = "nesterov"
+
+    def update_layer(self, i, layer_weights, mean_updates, learning_rate):
+        velocity = self.layer_state("velocity", i)
+        velocity *= self.momentum
+        velocity += mean_updates
+        mean_updates += self.momentum * velocity
+        layer_weights += learning_rate * mean_updates
+
+class RMSProp(Optimizer):
+    """Updates divided by a running root mean square of past updates"""
+    name = "rmsprop"
+    slots = ("mean_square",)
+
+    def __init__(self, decay=0.9, epsilon=1e-8):
+        super().__init__()
+        self.decay = decay
+        self.epsilon = epsilon
+
+    def update_layer(self, i, layer_weights, mean_updates, learning_rate):
+        mean_square = self.layer_state("mean_square", i)
+        mean_square *= self.decay
+        mean_square += (1 - self.decay) * mean_updates ** 2
+        mean_updates /= np.sqrt(mean_square) + self.epsilon
+        layer_weights += learning_rate * mean_updates
+
+class Adam(Optimizer):
+    """Adam: bias-corrected running means of the updates and their squares"""
+    name = "adam"
+    slots = ("mean", "mean_square")
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        super().__init__()
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def update_layer(self, i, layer_weights, mean_updates, learning_rate):
+        mean = self.layer_state("mean", i)
+        mean_square = self.layer_state("mean_square", i)
+        mean *= self.beta1
+        mean += (1 - self.beta1) * mean_updates
+        mean_square *= self.beta2
+        mean_square += (1 - self.beta2) * mean_updates ** 2
+        # Bias correction of both means folded into the step size
+        step_size = learning_rate * math.sqrt(1 - self.beta2 ** self.num_steps) \
+            / (1 - self.beta1 ** self.num_steps)
+        epsilon = self.epsilon * math.sqrt(1 - self.beta2 ** self.num_steps)
+        layer_weights += step_size * mean / (np.sqrt(mean_square) + epsilon)
+
+OPTIMIZERS = {
+    "sgd": Optimizer,
+    "momentum": Momentum,
+    "nesterov": Nesterov,
+    "rmsprop": RMSProp,
+    "adam": Adam,
+}
+
+def make_optimizer(name, **parameters):
+    """Returns a new optimizer called name, e.g. make_optimizer("adam", beta1=0.8)"""
+    if name not in OPTIMIZERS:
+        raise ValueError("Optimizer must be one of " + ", ".join(OPTIMIZERS) + ", got '"
+                         + str(name) + "'")
+    return OPTIMIZERS[name](**parameters)
+
+# Names of the learning rate schedules
+SCHEDULES = ("constant", "step", "exponential", "cosine")
+
+class LearningRateSchedule:
+    """
+    Learning rate of every epoch given the base learning rate:
+
+        constant:     learning_rate
+        step:         learning_rate * gamma ** (epoch // step_size)
+        exponential:  learning_rate * gamma ** epoch
+        cosine:       min_learning_rate + (learning_rate - min_learning_rate)
+                      * (1 + cos(pi * epoch / num_epochs)) / 2
+
+    with epochs counted from 0.
+
+    Attributes:
+        name: String name of the schedule, one of SCHEDULES
+        step_size: Integer number of epochs between steps of the step schedule
+        gamma: Floating point factor of the step and exponential schedules
+        min_learning_rate: Floating point final learning rate of the cosine schedule
+    """
+    def __init__(self, name="constant", step_size=10, gamma=0.5, min_learning_rate=0.0):
+        if name not in SCHEDULES:
+            raise ValueError("Learning rate schedule must be one of " + ", ".join(SCHEDULES)
+                             + ", got '" + str(name) + "'")
+        if step_size < 1:
+            raise ValueError("Step size must be a positive integer, got " + str(step_size))
+        self.name = name
+        self.step_size = step_size
+        self.gamma = gamma
+        self.min_learning_rate = min_learning_rate
+
+    def __call__(self, learning_rate, epoch, num_epochs):
+        """Returns the learning rate of epoch (counted from 0) of num_epochs"""
+        if self.name == "step":
+            return learning_rate * self.gamma ** (epoch // self.step_size)
+        if self.name == "exponential":
+            return learning_rate * self.gamma ** epoch
+        if self.name == "cosine":
+            return self.min_learning_rate + (learning_rate - self.min_learning_rate) \
+                * (1 + math.cos(math.pi * epoch / max(num_epochs, 1))) / 2
+        return learning_rate
@@ -0,0 +1,74 @@
+"""Accuracy drift of float32 training and inference against float64
+
+Trains the same initial network on the same examples once in float64 and
+once in float32 (weights and inputs in float32, labels as uint8, see
+load_examples) and compares the trained weights, the output activations and
+predictions on the testing examples, the micro-averaged metrics of
+compute_statistics and the memory held by the examples and weights.
+"""
+import numpy as np
+
+from neural_network_programs import (
+    load_examples, compute_statistics
+)
+from vectorized_back_prop import (
+    PRECISIONS, confusion_counts_matrix, forward_propagate_matrix, train_weights
+)
+
+# Metrics of compute_statistics compared between precisions
+DRIFT_METRICS = ("micro_avg_overall_accuracy", "micro_avg_precision", "micro_avg_recall",
+                 "micro_avg_f_1")
+
+def precision_drift(weights, training_file, testing_file, learning_rate, num_epochs,
+                    batch_size=1, activation="sigmoid"):
+    """
+    Returns a dictionary comparing float32 to float64 training and testing
+
+    Args:
+        weights: Array of initial weight matrices (see network_to_weights),
+            not modified
+        training_file, testing_file: Strings referring to names of example
+            files (.train/.test or binary)
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update
+        activation: String name of the hidden layer activation function
+
+    Returns:
+        drift: Dictionary with, for each precision name, a dictionary of the
+            DRIFT_METRICS and memory_bytes; and
+            max_weight_difference, max_output_difference,
+            prediction_agreement (fraction of test outputs predicted alike)
+            and the difference (float32 minus float64) of every metric
+    """
+    drift = {}
+    trained = {}
+    activations = {}
+    for name, dtype in PRECISIONS.items():
+        training_inputs, training_outputs = load_examples(training_file, dtype)
+        testing_inputs, testing_outputs = load_examples(testing_file, dtype)
+        precision_weights = [layer_weights.astype(dtype) for layer_weights in weights]
+        train_weights(training_inputs, training_outputs, precision_weights, learning_rate,
+                      num_epochs, batch_size, verbose=False, activation=activation)
+        a, b, c, d = [counts.tolist() for counts in confusion_counts_matrix(
+            precision_weights, testing_inputs, testing_outputs, activation=activation)]
+        statistics = compute_statistics(a, b, c, d)
+        metrics = {metric: statistics[metric] for metric in DRIFT_METRICS}
+        metrics["memory_bytes"] = int(
+            training_inputs.nbytes + training_outputs.nbytes + testing_inputs.nbytes
+            + testing_outputs.nbytes + sum(layer.nbytes for layer in precision_weights))
+        drift[name] = metrics
+        trained[name] = precision_weights
+        activations[name] = forward_propagate_matrix(
+            precision_weights, testing_inputs, activation)[-1].astype(np.float64)
+
+    drift["max_weight_difference"] = max(
+        float(np.abs(single.astype(np.float64) - double).max())
+        for single, double in zip(trained["float32"], trained["float64"]))
+    drift["max_output_difference"] = float(
+        np.abs(activations["float32"] - activations["float64"]).max(initial=0.0))
+    drift["prediction_agreement"] = float(
+        np.mean((activations["float32"] >= 0.5) == (activations["float64"] >= 0.5)))
+    for metric in DRIFT_METRICS:
+        drift[metric + "_drift"] = drift["float32"][metric] - drift["float64"][metric]
+    return drift
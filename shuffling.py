@@ -0,0 +1,84 @@
+"""Per-epoch ordering of training examples
+
+Examples are visited in a new seeded order every epoch by permuting an
+array of row indices; the example matrices themselves (loaded or memory
+mapped) are never reordered or copied as a whole, only gathered a chunk of
+rows at a time (see shuffled_chunks).
+
+Orders:
+    none        the order of the file, every epoch
+    random      a uniformly random permutation per epoch
+    stratified  a random order in which every class (distinct row of
+                expected outputs) is spread evenly, so that every stretch
+                of examples, and hence every batch, has about the class
+                proportions of the whole training set, e.g. for imbalanced
+                labels
+"""
+import numpy as np
+
+SHUFFLE_MODES = ("none", "random", "stratified")
+
+# Number of rows gathered from the example matrices at a time
+SHUFFLE_CHUNK_SIZE = 4096
+
+def check_shuffle(shuffle):
+    """Returns shuffle, raising ValueError if it is not one of SHUFFLE_MODES"""
+    if shuffle not in SHUFFLE_MODES:
+        raise ValueError("Shuffle must be one of " + ", ".join(SHUFFLE_MODES) + ", got '"
+                         + str(shuffle) + "'")
+    return shuffle
+
+def class_indices(outputs):
+    """Returns an integer class per example numbering the distinct rows of
+    expected outputs"""
+    outputs = np.asarray(outputs)
+    if outputs.ndim == 1 or outputs.shape[1] == 1:
+        return np.unique(outputs.ravel(), return_inverse=True)[1]
+    return np.unique(outputs, axis=0, return_inverse=True)[1].ravel()
+
+def stratified_order(classes, rng):
+    """
+    Returns a random permutation of the examples in which every class is
+    spread evenly: the k-th of the n examples of a class (in random order)
+    is placed at relative position (k + u) / n with a random offset u per
+    class, and the positions of all classes are merged
+    """
+    positions = np.empty(len(classes))
+    for label in range(classes.max() + 1 if len(classes) else 0):
+        members = np.flatnonzero(classes == label)
+        if not len(members):
+            continue
+        positions[rng.permutation(members)] = (np.arange(len(members)) + rng.random()) \
+            / len(members)
+    return np.argsort(positions, kind="stable")
+
+def epoch_order(num_examples, shuffle, rng, classes=None):
+    """
+    Returns the order in which to visit the examples in the next epoch, None
+    for the order of the file
+
+    Args:
+        num_examples: Integer number of examples
+        shuffle: String, one of SHUFFLE_MODES
+        rng: np.random.Generator drawing the order
+        classes: Integer class of every example (see class_indices), needed
+            for stratified ordering
+    """
+    if shuffle == "none":
+        return None
+    if shuffle == "random":
+        return rng.permutation(num_examples)
+    return stratified_order(classes, rng)
+
+def shuffled_chunks(inputs, outputs, order, chunk_size=SHUFFLE_CHUNK_SIZE):
+    """
+    Yields (inputs, outputs) chunks of the examples in order, gathering
+    chunk_size rows at a time; with order None the examples are yielded
+    as a single chunk, without copying
+    """
+    if order is None:
+        yield inputs, outputs
+        return
+    for start in range(0, len(order), chunk_size):
+        rows = order[start:start + chunk_size]
+        yield inputs[rows], outputs[rows]
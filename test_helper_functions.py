@@ -0,0 +1,32 @@
+""" Tests of helper functions (run with python3 -m pytest) """
+import numpy as np
+
+from helper_functions import (
+    sigmoid, SigmoidTable, SIGMOID_TABLE
+)
+
+def table_error(table, x):
+    """Returns the maximum absolute difference between table and sigmoid at x"""
+    exact = np.array([sigmoid(value) for value in x])
+    return np.abs(table(x) - exact).max()
+
+def test_sigmoid_table_default_error_bound():
+    """The default table is within its documented bound of about 8.4e-7,
+    inside and outside [-limit, limit]"""
+    assert SIGMOID_TABLE.error_bound <= 8.5e-7
+    x = np.concatenate([np.linspace(-40.0, 40.0, 400001), [-1000.0, -16.0, 16.0, 1000.0]])
+    assert table_error(SIGMOID_TABLE, x) <= SIGMOID_TABLE.error_bound
+
+def test_sigmoid_table_error_bound_small_table():
+    """The bound holds (and is not loose by orders of magnitude) for a coarse table"""
+    table = SigmoidTable(size=65, limit=8.0)
+    x = np.linspace(-20.0, 20.0, 200001)
+    error = table_error(table, x)
+    assert error <= table.error_bound
+    assert error >= table.error_bound / 10
+
+def test_sigmoid_table_exact_at_table_points():
+    """Table points are interpolated exactly"""
+    table = SigmoidTable(size=33, limit=4.0)
+    x = np.linspace(-4.0, 4.0, 33)
+    assert table_error(table, x) <= 1e-15
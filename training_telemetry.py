@@ -0,0 +1,104 @@
+"""Per-epoch training telemetry
+
+The vectorized training functions (train_weights, train_weights_streaming and
+everything built on them) accept a list of callbacks. After every epoch each
+callback is called as callback(record, weights), where record is a dictionary
+with the keys:
+
+    epoch               Integer number of the completed epoch (starting at 1)
+    loss                Mean over the epoch's examples of the summed squared
+                        error of the outputs, measured during the forward pass
+                        of each batch (i.e. before that batch's update)
+    examples            Integer number of examples seen in the epoch
+    epoch_time          Wall time of the epoch in seconds
+    elapsed_time        Wall time since training started in seconds
+    examples_per_second Training throughput of the epoch
+
+and, if any callback has a true profile attribute, the time in seconds spent
+in each phase of the epoch: forward_time, backward_time and update_time.
+
+A callback may return True to stop training after the current epoch.
+Without callbacks no statistics are collected, so disabled telemetry costs
+nothing but a check per batch.
+"""
+import json
+import time
+
+class EpochStatistics:
+    """
+    Accumulates statistics of one training epoch
+
+    Attributes:
+        profile: Boolean, whether phase timings are collected
+        loss_sum: Floating point sum of squared errors over the epoch
+        num_examples: Integer number of examples seen
+        forward_time, backward_time, update_time: Floating point seconds
+    """
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.loss_sum = 0.0
+        self.num_examples = 0
+        self.forward_time = 0.0
+        self.backward_time = 0.0
+        self.update_time = 0.0
+
+    def add_batch(self, outputs, output_values):
+        """Add the squared error of a batch of output activations"""
+        self.loss_sum += float(((outputs - output_values) ** 2).sum())
+        self.num_examples += len(outputs)
+
+    def record(self, epoch, epoch_time, elapsed_time):
+        """Returns the record of the epoch passed to callbacks"""
+        record = {
+            "epoch": epoch,
+            "loss": self.loss_sum / self.num_examples if self.num_examples else 0.0,
+            "examples": self.num_examples,
+            "epoch_time": epoch_time,
+            "elapsed_time": elapsed_time,
+            "examples_per_second": self.num_examples / epoch_time if epoch_time > 0 else 0.0,
+        }
+        if self.profile:
+            record["forward_time"] = self.forward_time
+            record["backward_time"] = self.backward_time
+            record["update_time"] = self.update_time
+        return record
+
+def wants_profile(callbacks):
+    """Returns True if any callback asks for phase timings"""
+    return any(getattr(callback, "profile", False) for callback in callbacks)
+
+def run_callbacks(callbacks, record, weights):
+    """Calls every callback with the epoch record, returns True if any asks to stop"""
+    stop = False
+    for callback in callbacks:
+        if callback(record, weights):
+            stop = True
+    return stop
+
+class JsonlTrainingLog:
+    """
+    Callback appending every epoch record as one JSON line to a file
+
+    Attributes:
+        filename: String referring to name of the log file
+        profile: Boolean, whether records include phase timings
+    """
+    def __init__(self, filename, profile=False):
+        self.filename = filename
+        self.profile = profile
+        # Start a new log for every training run
+        open(filename, "w").close()
+
+    def __call__(self, record, weights):
+        with open(self.filename, "a") as file:
+            file.write(json.dumps(record) + "\n")
+        return False
+
+def read_training_log(filename):
+    """Returns the array of epoch records stored in a JSONL training log"""
+    with open(filename, "r") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def timer():
+    """Returns the current value of the clock used for telemetry timings"""
+    return time.perf_counter()
@@ -0,0 +1,457 @@
+"""Vectorized Back-Prop-Learning Algorithm
+
+Same algorithm as back_prop_algorithm.py, but the weights of each layer are
+kept in a NumPy matrix instead of being spread over Node objects. Row j of a
+layer's matrix holds the weights entering node j of that layer; column 0 is
+the bias weight (attached to the fixed -1 input) and column k + 1 is the
+weight of the edge from node k of the previous layer, exactly as in the
+.init/.trained files.
+
+With a batch size of 1 training performs the same per-example stochastic
+gradient descent as back_prop_learning. Larger batch sizes average the
+weight updates of batch_size examples, computed together with matrix-matrix
+products, and apply them once per batch. With batch size 1 the trained
+weights agree with the Node implementation to within WEIGHT_TOLERANCE (the
+only differences come from the order in which floating point sums are
+accumulated).
+
+Every function taking an activation argument uses that activation function
+(see helper_functions.ACTIVATIONS) for the hidden layers; the default is
+the sigmoid of back_prop_learning. Networks must be tested with the
+activation they were trained with.
+
+Training functions take an optional optimizer (momentum, Nesterov, RMSProp
+or Adam instead of plain gradient descent) and learning rate schedule, see
+optimizers.py, and can visit the examples in a new seeded order every
+epoch, see shuffling.py.
+
+Weights and examples may be kept in float32 instead of float64 (see
+PRECISIONS) to halve their memory; computations run in the type of the
+weight matrices. Expected outputs may be given as uint8 labels.
+"""
+import numpy as np
+
+from helper_functions import (
+    array_sigmoid_derivative, get_activation
+)
+from checkpoints import (
+    prepare_checkpointing
+)
+from metrics import (
+    confusion_counts
+)
+from shuffling import (
+    check_shuffle, class_indices, epoch_order, shuffled_chunks
+)
+from training_telemetry import (
+    EpochStatistics, wants_profile, run_callbacks, timer
+)
+
+# Maximum absolute difference expected between weights trained with this
+# engine and weights trained with back_prop_learning
+WEIGHT_TOLERANCE = 1e-9
+
+# Floating point types weights and examples can be stored in
+PRECISIONS = {"float64": np.float64, "float32": np.float32}
+
+def network_to_weights(network, dtype=np.float64):
+    """
+    Returns the weight matrices of a network of nodes
+
+    Args:
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+        dtype: np.float64 or np.float32, type of the weight matrices
+    Returns:
+        weights: Array of 2 dimensional float arrays, one per non-input layer
+            e.g. [num_nodes x (num_nodes_in_previous_layer + 1)] x (num_layers - 1)
+    """
+    return [np.array([node.weights for node in layer], dtype=dtype)
+            for layer in network[1:]]
+
+def get_precision(name):
+    """Returns the floating point type of a precision name of PRECISIONS"""
+    if name not in PRECISIONS:
+        raise ValueError("Precision must be one of " + ", ".join(PRECISIONS) + ", got '"
+                         + str(name) + "'")
+    return PRECISIONS[name]
+
+def as_examples(weights, inputs, outputs):
+    """
+    Returns inputs as an array of the type of the weight matrices and outputs
+    as uint8 labels or an array of that type, copying only when the types
+    differ
+    """
+    dtype = weights[0].dtype
+    inputs = np.asarray(inputs, dtype=dtype)
+    outputs = np.asarray(outputs)
+    if outputs.dtype != np.uint8:
+        outputs = outputs.astype(dtype, copy=False)
+    return inputs, outputs
+
+def copy_weights_to_network(weights, network):
+    """Copy weight matrices back into the nodes of network"""
+    for layer, layer_weights in zip(network[1:], weights):
+        for node, node_weights in zip(layer, layer_weights):
+            node.weights = node_weights.tolist()
+    return network
+
+def forward_propagate_matrix(weights, inputs, activation="sigmoid"):
+    """
+    Returns the activations of every layer for a matrix of input rows
+
+    Args:
+        weights: Array of weight matrices (see network_to_weights)
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        activation: String name of the hidden layer activation function
+    Returns:
+        activations: Array of 2 dimensional float arrays, one per layer
+            (including the input layer) e.g. [num_examples x num_nodes] x num_layers
+    """
+    kernel = get_activation(activation)
+    activations = [inputs]
+    for i, layer_weights in enumerate(weights):
+        input_values = activations[-1] @ layer_weights[:, 1:].T - layer_weights[:, 0]
+        function = kernel.output_function if i == len(weights) - 1 else kernel.function
+        activations.append(function(input_values))
+    return activations
+
+def back_propagate_matrix(weights, activations, outputs, activation="sigmoid"):
+    """
+    Returns delta for every non-input layer given the activations of a
+    forward pass and the expected outputs
+
+    Derivatives are computed from the cached activations, e.g.
+    g'(in) = g(in) * (1 - g(in)) for the sigmoid, instead of re-evaluating
+    the activation function.
+    """
+    derivative = get_activation(activation).derivative
+    output_values = activations[-1]
+    delta = [None for _ in weights]
+    delta[-1] = array_sigmoid_derivative(output_values) * (outputs - output_values)
+    for i in range(len(weights) - 2, -1, -1):
+        delta[i] = derivative(activations[i + 1]) * (delta[i + 1] @ weights[i + 1][:, 1:])
+    return delta
+
+def compute_gradients(weights, inputs, outputs, statistics=None, activation="sigmoid"):
+    """
+    Returns the weight updates of a batch of examples summed over the batch
+
+    Args:
+        weights: Array of weight matrices (see network_to_weights)
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        statistics: EpochStatistics updated with the loss (and phase timings
+            if profiling) of the batch, or None
+        activation: String name of the hidden layer activation function
+    Returns:
+        gradients: Array of 2 dimensional float arrays with the same shapes as
+            weights (before scaling by the learning rate)
+    """
+    profile = statistics is not None and statistics.profile
+    if profile:
+        start = timer()
+    activations = forward_propagate_matrix(weights, inputs, activation)
+    if profile:
+        statistics.forward_time += timer() - start
+        start = timer()
+    delta = back_propagate_matrix(weights, activations, outputs, activation)
+    gradients = []
+    for i, layer_weights in enumerate(weights):
+        layer_gradients = np.empty_like(layer_weights)
+        # Bias weights are attached to the fixed -1 input
+        layer_gradients[:, 0] = -delta[i].sum(axis=0)
+        layer_gradients[:, 1:] = delta[i].T @ activations[i]
+        gradients.append(layer_gradients)
+    if statistics is not None:
+        if profile:
+            statistics.backward_time += timer() - start
+        statistics.add_batch(outputs, activations[-1])
+    return gradients
+
+def update_weights_matrix(weights, gradients, learning_rate):
+    """Update the weight matrices in place using gradients"""
+    for layer_weights, layer_gradients in zip(weights, gradients):
+        layer_weights += learning_rate * layer_gradients
+
+def train_epoch(chunks, weights, learning_rate, batch_size, statistics=None,
+                activation="sigmoid", optimizer=None):
+    """
+    Trains weight matrices in place for one pass over chunks of examples
+
+    Batches may span chunk boundaries: the weight updates of a partial batch
+    at the end of a chunk are accumulated until batch_size examples have been
+    seen, so the result does not depend on how the examples are chunked.
+
+    Args:
+        chunks: Iterable of (inputs, outputs) pairs of 2 dimensional arrays
+        weights: Array of weight matrices (see network_to_weights)
+        learning_rate: Floating point number
+        batch_size: Integer number of examples per weight update
+        statistics: EpochStatistics collecting telemetry of the epoch, or None
+        activation: String name of the hidden layer activation function
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent
+    """
+    def apply_updates(updates, count):
+        if optimizer is None:
+            update_weights_matrix(weights, updates, learning_rate / count)
+        else:
+            optimizer.step(weights, updates, learning_rate, count)
+    profile = statistics is not None and statistics.profile
+    accumulated = None
+    num_accumulated = 0
+    for inputs, outputs in chunks:
+        inputs, outputs = as_examples(weights, inputs, outputs)
+        num_rows = len(inputs)
+        start = 0
+        while start < num_rows:
+            stop = min(start + batch_size - num_accumulated, num_rows)
+            gradients = compute_gradients(weights, inputs[start:stop], outputs[start:stop],
+                                          statistics, activation)
+            if accumulated is None:
+                accumulated = gradients
+            else:
+                for layer_accumulated, layer_gradients in zip(accumulated, gradients):
+                    layer_accumulated += layer_gradients
+            num_accumulated += stop - start
+            start = stop
+            if num_accumulated == batch_size:
+                if profile:
+                    update_start = timer()
+                apply_updates(accumulated, num_accumulated)
+                if profile:
+                    statistics.update_time += timer() - update_start
+                accumulated = None
+                num_accumulated = 0
+    if num_accumulated:
+        apply_updates(accumulated, num_accumulated)
+
+def train_weights(inputs, outputs, weights, learning_rate, num_epochs, batch_size=1,
+                  verbose=True, callbacks=None, start_epoch=0, activation="sigmoid",
+                  optimizer=None, schedule=None, shuffle="none", rng=None):
+    """
+    Returns weight matrices after training them with back-prop-learning
+
+    Args:
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        weights: Array of weight matrices (see network_to_weights), updated
+            in place. Training runs in their floating point type
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update, 1 for
+            online learning or None for full-batch gradient descent
+        verbose: Boolean, print a line after every completed epoch
+        callbacks: Array of functions called with the record of every epoch
+            (see training_telemetry.py), None for no telemetry
+        start_epoch: Integer number of epochs already completed (when
+            resuming), training runs epochs start_epoch + 1 to num_epochs
+        activation: String name of the hidden layer activation function
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent
+        schedule: LearningRateSchedule giving the learning rate of every
+            epoch, None for a constant learning rate
+        shuffle: String order of the examples in every epoch, "none",
+            "random" or "stratified" (see shuffling.py)
+        rng: np.random.Generator drawing the orders, a generator seeded with
+            0 if None
+
+    Returns:
+        weights: Array of weight matrices
+    """
+    inputs, outputs = as_examples(weights, inputs, outputs)
+    batch_size = check_batch_size(batch_size, len(inputs))
+    return train_weights_streaming(shuffled_chunk_source(inputs, outputs, shuffle, rng),
+                                   weights, learning_rate, num_epochs, batch_size, verbose,
+                                   callbacks, start_epoch, activation, optimizer, schedule)
+
+def shuffled_chunk_source(inputs, outputs, shuffle="none", rng=None, rows=None):
+    """
+    Returns a chunk source for train_weights_streaming yielding the examples
+    in a new order (see shuffling.epoch_order) every time it is called,
+    gathering chunks of rows from inputs and outputs (which may be memory
+    mapped) instead of copying them
+
+    Args:
+        rows: Sorted index array of the rows to train on (e.g. the training
+            folds of cross-validation), None for every row
+    """
+    check_shuffle(shuffle)
+    if rng is None:
+        rng = np.random.default_rng(0)
+    classes = None
+    if shuffle == "stratified":
+        classes = class_indices(outputs if rows is None else outputs[rows])
+    num_examples = len(inputs) if rows is None else len(rows)
+
+    def chunk_source():
+        order = epoch_order(num_examples, shuffle, rng, classes)
+        if rows is not None:
+            order = rows if order is None else rows[order]
+        return shuffled_chunks(inputs, outputs, order)
+    return chunk_source
+
+def train_weights_streaming(chunk_source, weights, learning_rate, num_epochs, batch_size=1,
+                            verbose=True, callbacks=None, start_epoch=0, activation="sigmoid",
+                            optimizer=None, schedule=None):
+    """
+    Returns weight matrices after training them on examples that are read in
+    chunks (e.g. from stream_examples) instead of being held in memory
+
+    Args:
+        chunk_source: Function called once per epoch, returning an iterable
+            of (inputs, outputs) pairs of 2 dimensional arrays
+        weights: Array of weight matrices (see network_to_weights), updated
+            in place
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update
+        verbose: Boolean, print a line after every completed epoch
+        callbacks: Array of functions called with the record of every epoch
+            (see training_telemetry.py), None for no telemetry. Training
+            stops early if a callback returns True
+        start_epoch: Integer number of epochs already completed (when
+            resuming), training runs epochs start_epoch + 1 to num_epochs
+        activation: String name of the hidden layer activation function
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent
+        schedule: LearningRateSchedule giving the learning rate of every
+            epoch, None for a constant learning rate
+
+    Returns:
+        weights: Array of weight matrices
+    """
+    batch_size = check_batch_size(batch_size, 1)
+    # Fail on unknown activations before reading any examples
+    get_activation(activation)
+    profile = bool(callbacks) and wants_profile(callbacks)
+    training_start = timer()
+    for epoch in range(start_epoch, num_epochs):
+        statistics = EpochStatistics(profile) if callbacks else None
+        epoch_start = timer()
+        rate = learning_rate if schedule is None else schedule(learning_rate, epoch, num_epochs)
+        train_epoch(chunk_source(), weights, rate, batch_size, statistics, activation,
+                    optimizer)
+        if verbose:
+            print("Completed epoch " + str(epoch + 1))
+        if callbacks:
+            epoch_end = timer()
+            record = statistics.record(epoch + 1, epoch_end - epoch_start,
+                                       epoch_end - training_start)
+            record["learning_rate"] = rate
+            if run_callbacks(callbacks, record, weights):
+                break
+    return weights
+
+def check_batch_size(batch_size, num_examples):
+    """Returns the number of examples per batch, raising ValueError if invalid"""
+    if batch_size is None:
+        return max(num_examples, 1)
+    if batch_size < 1:
+        raise ValueError("Batch size must be a positive integer, got " + str(batch_size))
+    return batch_size
+
+def confusion_counts_matrix(weights, inputs, outputs, chunk_size=None, activation="sigmoid"):
+    """
+    Returns confusion matrix values A, B, C, D per output for test examples
+
+    Outputs are thresholded at 0.5 (>= 0.5 predicts 1) like threshold_function.
+
+    Args:
+        weights: Array of weight matrices (see network_to_weights)
+        inputs: 2 dimensional float array [num_examples x num_inputs]
+        outputs: 2 dimensional array [num_examples x num_outputs]
+        chunk_size: Integer number of examples forward propagated at a time,
+            None to score all examples in one pass
+        activation: String name of the hidden layer activation function
+    Returns:
+        a, b, c, d: Integer arrays [num_outputs]
+    """
+    inputs = np.asarray(inputs, dtype=weights[0].dtype)
+    outputs = np.asarray(outputs)
+    num_examples = len(inputs)
+    chunk_size = check_batch_size(chunk_size, num_examples)
+    chunks = ((inputs[start:start + chunk_size], outputs[start:start + chunk_size])
+              for start in range(0, num_examples, chunk_size))
+    return confusion_counts_chunks(weights, chunks, activation)
+
+def confusion_counts_chunks(weights, chunks, activation="sigmoid"):
+    """
+    Returns confusion matrix values A, B, C, D per output, accumulated over
+    an iterable of (inputs, outputs) chunks of test examples
+    """
+    counts = np.zeros((4, weights[-1].shape[0]), dtype=np.int64)
+    for inputs, expected in chunks:
+        inputs = np.asarray(inputs, dtype=weights[0].dtype)
+        predicted = forward_propagate_matrix(weights, inputs, activation)[-1] >= 0.5
+        counts += confusion_counts(predicted, expected)
+    return counts[0], counts[1], counts[2], counts[3]
+
+def output_activations_chunks(weights, chunks, activation="sigmoid"):
+    """
+    Returns the output activations and expected outputs of an iterable of
+    (inputs, outputs) chunks of test examples, e.g. for metrics.evaluation_report
+
+    Returns:
+        scores, expected: 2 dimensional arrays [num_examples x num_outputs]
+    """
+    scores = []
+    expected = []
+    for inputs, outputs in chunks:
+        inputs = np.asarray(inputs, dtype=weights[0].dtype)
+        scores.append(forward_propagate_matrix(weights, inputs, activation)[-1])
+        expected.append(np.asarray(outputs))
+    if not scores:
+        num_outputs = weights[-1].shape[0]
+        return np.zeros((0, num_outputs)), np.zeros((0, num_outputs), dtype=np.uint8)
+    return np.concatenate(scores), np.concatenate(expected)
+
+def vectorized_back_prop_learning(examples, network, learning_rate, num_epochs,
+                                  batch_size=1, callbacks=None, verbose=True,
+                                  checkpointer=None, resume=False, activation="sigmoid",
+                                  dtype=np.float64, optimizer=None, schedule=None,
+                                  shuffle="none", seed=0):
+    """
+    Returns a network after training it (drop-in for back_prop_learning)
+
+    Args:
+        examples: Array of examples in the form of input and output values
+            e.g [[num_examples x num_inputs],[num_examples x num_outputs]]
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+        learning_rate: Floating point number
+        num_epochs: Integer
+        batch_size: Integer number of examples per weight update, 1 for
+            online learning or None for full-batch gradient descent
+        callbacks: Array of functions called with the record of every epoch
+            (see training_telemetry.py)
+        verbose: Boolean, print a line after every completed epoch
+        checkpointer: Checkpointer saving periodic checkpoints (see
+            checkpoints.py), or None
+        resume: Boolean, continue from the checkpointer's file if it exists
+        activation: String name of the hidden layer activation function
+        dtype: np.float64 or np.float32, type training runs in
+        optimizer: Optimizer applying the updates (see optimizers.py), None
+            for plain gradient descent. Its state is saved with checkpoints
+        schedule: LearningRateSchedule giving the learning rate of every
+            epoch, None for a constant learning rate
+        shuffle: String order of the examples in every epoch, "none",
+            "random" or "stratified" (see shuffling.py)
+        seed: Integer seed of the shuffled orders. The state of the random
+            number generator is saved with checkpoints
+
+    Returns:
+        network: 2 dimensional array of nodes
+            e.g. [[num_nodes_per_layer] x num_layers]
+    """
+    inputs, outputs = examples
+    weights = network_to_weights(network, dtype)
+    rng = np.random.default_rng(seed)
+    if checkpointer is not None:
+        checkpointer.rng = rng
+    start_epoch, callbacks = prepare_checkpointing(checkpointer, weights, callbacks, resume,
+                                                   optimizer)
+    train_weights(inputs, outputs, weights, learning_rate, num_epochs, batch_size,
+                  verbose, callbacks, start_epoch, activation, optimizer, schedule, shuffle, rng)
+    return copy_weights_to_network(weights, network)
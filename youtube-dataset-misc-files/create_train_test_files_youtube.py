@@ -3,6 +3,9 @@ Creates youtube.train and youtube.test files from YouTube api data
 stored in numpy arrays
 (Input Attributes: view count, like count, dislike count, comment count)
 (Output Attributes: 0 or 1 to represent trending or nontrending)
+
+dataset_builder.py in the repository root builds such files with
+configurable split ratios and seed and saves the standardization statistics
 """
 import numpy as np
 
@@ -1,4 +1,8 @@
-"""Retrieve data about nontrending and trending videos from YouTube api and write to numpy files"""
+"""Retrieve data about nontrending and trending videos from YouTube api and write to numpy files
+
+Requests are sent one group at a time; youtube_fetcher.py fetches the same
+data concurrently with retries and an on-disk cache.
+"""
 import requests
 import json
 import urllib
@@ -29,21 +33,10 @@ def get_list_group_ids(filename):
     # convert to 1d array
     video_ids = video_ids.ravel()
 
-    individual_str = ""
+    # Every id is kept, including a last group of fewer than group_size ids
     list_groups_of_ids = []
-    i = 0
-    for video_id in video_ids:
-        if (i == 0):
-            individual_str += video_id
-            i += 1
-        else:
-            if (i < group_size):
-                i += 1
-                individual_str += ',' + video_id
-            else:
-                list_groups_of_ids.append(individual_str)
-                individual_str = ""
-                i = 0
+    for start in range(0, len(video_ids), group_size):
+        list_groups_of_ids.append(','.join(video_ids[start:start + group_size]))
     return list_groups_of_ids
 
 class VideoDetails:
@@ -66,29 +59,32 @@ class VideoDetails:
         self.tags = []
 
 def get_video_details(video_id, details_class, api_key):
-    """Hit api and accumulate data for given class"""
-    try:
-        searchUrl="https://www.googleapis.com/youtube/v3/videos?id="+video_id+"&key="+api_key+"&part=statistics,snippet,content_details"
-        response = urllib.request.urlopen(searchUrl).read()
-        data = json.loads(response)
-        for i in range(0, group_size):
-            details_class.video_id.append(data['items'][i]['id'])
-            details_class.video_title.append(data['items'][i]['snippet']['title'])
-            details_class.channel_title.append(data['items'][i]['snippet']['channelTitle'])
-            details_class.view_count.append(data['items'][i]['statistics']['viewCount'])
-            details_class.like_count.append(data['items'][i]['statistics']['likeCount'])
-            details_class.dislike_count.append(data['items'][i]['statistics']['dislikeCount'])
-            details_class.favorite_count.append(data['items'][i]['statistics']['favoriteCount'])
-            details_class.comment_count.append(data['items'][i]['statistics']['commentCount'])
-            details_class.content_duration.append(data['items'][i]['contentDetails']['duration'])
-            details_class.published_at.append(data['items'][i]['snippet']['publishedAt'])
-            details_class.category_id.append(data['items'][i]['snippet']['categoryId'])
-            try:
-                details_class.tags.append(data['items'][i]['snippet']['tags'])
-            except (IndexError, KeyError):
-                details_class.tags.append([])
-    except (IndexError, KeyError):
-        return
+    """Hit api and accumulate data for given class, skipping only the videos
+    that miss a field (e.g. hidden like or dislike counts)"""
+    searchUrl="https://www.googleapis.com/youtube/v3/videos?id="+video_id+"&key="+api_key+"&part=statistics,snippet,contentDetails"
+    response = urllib.request.urlopen(searchUrl).read()
+    data = json.loads(response)
+    for item in data.get('items', []):
+        try:
+            fields = (item['id'], item['snippet']['title'], item['snippet']['channelTitle'],
+                      item['statistics']['viewCount'], item['statistics']['likeCount'],
+                      item['statistics']['dislikeCount'], item['statistics']['favoriteCount'],
+                      item['statistics']['commentCount'], item['contentDetails']['duration'],
+                      item['snippet']['publishedAt'], item['snippet']['categoryId'])
+        except KeyError:
+            continue
+        details_class.video_id.append(fields[0])
+        details_class.video_title.append(fields[1])
+        details_class.channel_title.append(fields[2])
+        details_class.view_count.append(fields[3])
+        details_class.like_count.append(fields[4])
+        details_class.dislike_count.append(fields[5])
+        details_class.favorite_count.append(fields[6])
+        details_class.comment_count.append(fields[7])
+        details_class.content_duration.append(fields[8])
+        details_class.published_at.append(fields[9])
+        details_class.category_id.append(fields[10])
+        details_class.tags.append(item['snippet'].get('tags', []))
 
 def details_object_to_array(detailsObject):
     """Return a list of rows of data we care about"""
@@ -136,5 +132,5 @@ def main():
     print("Took " + str(time.time() - start_time) + " seconds.")
 
 
-
-main()
+if __name__ == "__main__":
+    main()
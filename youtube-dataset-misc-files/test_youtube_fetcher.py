@@ -0,0 +1,126 @@
+""" Tests of youtube_fetcher.py against youtube_stub_server.py (run with python3 -m pytest) """
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+from youtube_fetcher import (
+    GROUP_SIZE, FetchError, VideoFetcher, fetch_to_columns, group_ids, load_columns,
+    read_video_ids
+)
+from youtube_stub_server import (
+    StubServer, VIDEOS_PATH, load_recordings
+)
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+RECORDINGS = os.path.join(DIRECTORY, "recordings")
+NUM_GROUPS = 3
+
+@pytest.fixture
+def stub():
+    """Stub API serving the recordings, failing 30% of the requests"""
+    server = StubServer(("127.0.0.1", 0), load_recordings(RECORDINGS), fail_rate=0.3, seed=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def write_ids(filename, recorded_ids):
+    """Writes an id file of NUM_GROUPS groups holding the recorded ids
+    among ids the stub does not know, and returns the recorded ids in the
+    order of the file"""
+    ids = ["unknown" + str(index).zfill(4) for index in range(NUM_GROUPS * GROUP_SIZE)]
+    step = len(ids) // len(recorded_ids)
+    for position, video_id in enumerate(recorded_ids):
+        ids[position * step] = video_id
+    with open(filename, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Link", "URL"])
+        writer.writerows(["Video " + video_id, video_id] for video_id in ids)
+    return [video_id for video_id in ids if video_id in recorded_ids]
+
+def run_fetcher(stub, directory):
+    """Runs youtube_fetcher.py against the stub and returns its output"""
+    url = "http://127.0.0.1:" + str(stub.server_address[1]) + VIDEOS_PATH
+    result = subprocess.run(
+        [sys.executable, os.path.join(DIRECTORY, "youtube_fetcher.py"), "ids.csv", "columns",
+         "--api-key", "test", "--api-url", url, "--cache-dir", "cache", "--workers", "4",
+         "--rate", "0", "--retries", "20", "--backoff", "0", "--stats-file", "stats.npy"],
+        cwd=directory, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+def test_fetcher_retries_caches_and_keeps_incomplete_videos(stub, tmp_path):
+    """Failed requests are retried, a second run is answered from the cache,
+    and videos missing fields are kept with NaN (or "") for those fields"""
+    expected_ids = write_ids(tmp_path / "ids.csv", sorted(stub.items))
+
+    output = run_fetcher(stub, tmp_path)
+    assert stub.requests > NUM_GROUPS
+    assert "(" + str(stub.requests) + " requests, 0 cached)" in output
+    columns = load_columns(tmp_path / "columns")
+    assert list(columns["video_id"]) == expected_ids
+
+    rows = {video_id: index for index, video_id in enumerate(expected_ids)}
+    assert np.isnan(columns["like_count"][rows["pRfmrE0ToTo"]])
+    assert np.isnan(columns["dislike_count"][rows["pRfmrE0ToTo"]])
+    assert columns["comment_count"][rows["pRfmrE0ToTo"]] == 8311
+    assert np.isnan(columns["comment_count"][rows["irVIUvDTTB0"]])
+    assert np.isnan(columns["like_count"][rows["oicXRb50H_I"]])
+    for name in ("view_count", "like_count", "dislike_count", "favorite_count", "comment_count"):
+        assert np.isnan(columns[name][rows["LDXYRzerjzU"]])
+    assert columns["published_at"][rows["1roy4o4tqQM"]] == ""
+    assert columns["view_count"][rows["GKaakjMVtyE"]] == 5120887
+    complete = [video_id for video_id in expected_ids
+                if video_id in ("XG4rnKlgCN8", "-6nihDqjeXw", "1roy4o4tqQM", "GKaakjMVtyE")]
+    stats = np.load(tmp_path / "stats.npy")
+    assert stats.shape == (len(complete), 4)
+    assert stats[complete.index("GKaakjMVtyE")].tolist() == [5120887, 190233, 5521, 17002]
+
+    # Rerunning a completed run fetches nothing, and deleted columns are
+    # rebuilt from the response cache
+    requests = stub.requests
+    output = run_fetcher(stub, tmp_path)
+    assert "(0 requests, 0 cached)" in output
+    shutil.rmtree(tmp_path / "columns")
+    output = run_fetcher(stub, tmp_path)
+    assert stub.requests == requests
+    assert "(0 requests, " + str(NUM_GROUPS) + " cached)" in output
+    assert list(load_columns(tmp_path / "columns")["video_id"]) == expected_ids
+
+def test_restarted_run_appends_to_columns(stub, tmp_path):
+    """A run interrupted after some groups (without a response cache)
+    continues after the last group written, dropping a partial append"""
+    stub.fail_rate = 0.0
+    expected_ids = write_ids(tmp_path / "ids.csv", sorted(stub.items))
+    groups = group_ids(read_video_ids(tmp_path / "ids.csv"))
+    url = "http://127.0.0.1:" + str(stub.server_address[1]) + VIDEOS_PATH
+    directory = tmp_path / "columns"
+
+    class InterruptedFetcher(VideoFetcher):
+        def fetch_group(self, ids):
+            if ids == groups[-1]:
+                raise FetchError("HTTP 403 after 1 attempts")
+            return super().fetch_group(ids)
+
+    with pytest.raises(FetchError):
+        fetch_to_columns(groups, InterruptedFetcher("test", url), directory, workers=1)
+    assert stub.requests == NUM_GROUPS - 1
+    with open(directory / "view_count.f64", "ab") as file:
+        file.write(b"partial")
+
+    assert fetch_to_columns(groups, VideoFetcher("test", url), directory) == len(expected_ids)
+    assert stub.requests == NUM_GROUPS
+    columns = load_columns(directory)
+    assert list(columns["video_id"]) == expected_ids
+    assert len(columns["view_count"]) == len(expected_ids)
+
+    # A run with other groups starts over
+    assert fetch_to_columns(groups[:1], VideoFetcher("test", url), directory) < len(expected_ids)
+    assert set(load_columns(directory)["video_id"]) < set(expected_ids)
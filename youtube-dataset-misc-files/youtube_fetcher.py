@@ -0,0 +1,448 @@
+"""Concurrent, cached fetcher of YouTube video statistics
+
+Fetches the same data as retrieve_youtube_data.py, but:
+    • groups of up to 50 video ids are requested by a pool of worker threads,
+      each keeping its own persistent (keep-alive) HTTP connection
+    • requests are rate limited (token bucket, --rate requests per second)
+    • failed requests (connection errors, 429 and 5xx responses) are retried
+      with exponential backoff, honouring Retry-After
+    • every response is cached on disk keyed by its group of ids, so an
+      interrupted run resumes without requesting those groups again
+    • videos missing a statistic (e.g. hidden like counts) are kept, with NaN
+      for the missing value, instead of dropping their whole group
+    • results are appended to one file per column (see ColumnWriter) as
+      groups complete, in the order of the id file; a restarted run with
+      the same id file continues after the last group written
+
+With --stats-file the view, like, dislike and comment counts of every video
+with all four counts are also saved as a [num_videos x 4] matrix, the
+format of trending_stats.npy/nontrending_stats.npy.
+
+The API address is configurable so the fetcher can be run against
+youtube_stub_server.py, which serves recorded responses.
+
+Example:
+    python3 youtube_fetcher.py trending-yt.csv trending-columns
+        --api-key-file api_key.txt --cache-dir cache --stats-file trending_stats.npy
+"""
+import argparse
+import csv
+import hashlib
+import http.client
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+API_URL = "https://www.googleapis.com/youtube/v3/videos"
+# Maximum number of video ids per API request
+GROUP_SIZE = 50
+PARTS = "statistics,snippet,contentDetails"
+
+# Column name -> field of an API item, as (section, key)
+NUMERIC_COLUMNS = {
+    "view_count": ("statistics", "viewCount"),
+    "like_count": ("statistics", "likeCount"),
+    "dislike_count": ("statistics", "dislikeCount"),
+    "favorite_count": ("statistics", "favoriteCount"),
+    "comment_count": ("statistics", "commentCount"),
+}
+TEXT_COLUMNS = {
+    "video_id": (None, "id"),
+    "published_at": ("snippet", "publishedAt"),
+    "category_id": ("snippet", "categoryId"),
+    "content_duration": ("contentDetails", "duration"),
+}
+# Columns of the statistics matrix used by create_train_test_files_youtube.py
+STATS_COLUMNS = ("view_count", "like_count", "dislike_count", "comment_count")
+
+# File of a column directory recording the groups written (see ColumnWriter)
+PROGRESS_FILE = "progress.json"
+
+# HTTP status codes worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class FetchError(Exception):
+    """Request that failed permanently or after all retries"""
+
+def read_video_ids(filename, column=1):
+    """
+    Returns the video ids in column of a csv file with a header line,
+    skipping rows with an empty field or without that column (like the
+    dropna of retrieve_youtube_data.py)
+    """
+    video_ids = []
+    with open(filename, "r", newline="", encoding="utf-8", errors="replace") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for row in reader:
+            if len(row) > column and all(field.strip() for field in row):
+                video_ids.append(row[column].strip())
+    return video_ids
+
+def group_ids(video_ids, group_size=GROUP_SIZE):
+    """Returns video ids split into groups of at most group_size ids"""
+    return [video_ids[start:start + group_size]
+            for start in range(0, len(video_ids), group_size)]
+
+def groups_key(groups):
+    """Returns a string identifying a list of groups of video ids"""
+    return hashlib.sha256("\n".join(",".join(ids) for ids in groups).encode()).hexdigest()
+
+def write_json_atomically(filename, data):
+    """Writes data to a JSON file that is replaced, never partially written"""
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(filename) or ".",
+                                             suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as file:
+            json.dump(data, file)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+class RateLimiter:
+    """
+    Token bucket allowing rate acquisitions per second on average and up to
+    burst at once, shared by every worker thread
+
+    Attributes:
+        rate: Floating point acquisitions per second, None for no limit
+        burst: Integer maximum number of acquisitions without waiting
+    """
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        if self.rate is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+class ResponseCache:
+    """
+    On-disk cache of API responses, one JSON file per group of ids
+
+    Attributes:
+        directory: String referring to name of the cache directory
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, ids):
+        """Returns the file caching the response for a group of ids"""
+        key = hashlib.sha256(",".join(ids).encode()).hexdigest()
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, ids):
+        """Returns the cached response for a group of ids, or None"""
+        try:
+            with open(self.path(ids), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, ids, data):
+        """Atomically stores the response for a group of ids"""
+        write_json_atomically(self.path(ids), data)
+
+class VideoFetcher:
+    """
+    Fetches the API response for groups of video ids, thread safe
+
+    Attributes:
+        api_key: String API key
+        api_url: String address of the videos endpoint
+        cache: ResponseCache, or None
+        rate_limiter: RateLimiter shared by all requests
+        max_retries: Integer number of retries of a failed request
+        backoff: Floating point seconds before the first retry, doubled
+            (with random jitter) for every further retry
+        timeout: Floating point seconds before a request is abandoned
+        requests: Integer number of HTTP requests sent (including retries)
+        cache_hits: Integer number of groups answered from the cache
+    """
+    def __init__(self, api_key, api_url=API_URL, cache=None, rate_limiter=None,
+                 max_retries=5, backoff=0.5, timeout=30.0):
+        url = urllib.parse.urlsplit(api_url)
+        if url.scheme not in ("http", "https"):
+            raise ValueError("API address must be an http or https URL, got '" + api_url + "'")
+        self.api_key = api_key
+        self.api_url = api_url
+        self.scheme = url.scheme
+        self.host = url.netloc
+        self.path = url.path or "/"
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.requests = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def connection(self):
+        """Returns the persistent connection of the calling thread"""
+        if getattr(self.local, "connection", None) is None:
+            if self.scheme == "https":
+                self.local.connection = http.client.HTTPSConnection(self.host,
+                                                                    timeout=self.timeout)
+            else:
+                self.local.connection = http.client.HTTPConnection(self.host,
+                                                                   timeout=self.timeout)
+        return self.local.connection
+
+    def close_connection(self):
+        """Closes the connection of the calling thread (reopened when needed)"""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def fetch_group(self, ids):
+        """Returns the API response (dictionary) for a group of video ids"""
+        if self.cache is not None:
+            data = self.cache.get(ids)
+            if data is not None:
+                with self.lock:
+                    self.cache_hits += 1
+                return data
+        query = urllib.parse.urlencode({"id": ",".join(ids), "key": self.api_key,
+                                        "part": PARTS})
+        data = self.request(self.path + "?" + query)
+        if self.cache is not None:
+            self.cache.put(ids, data)
+        return data
+
+    def request(self, target):
+        """Returns the decoded JSON response of a GET request, retrying
+        connection errors and retryable statuses"""
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with self.lock:
+                self.requests += 1
+            retry_after = None
+            try:
+                connection = self.connection()
+                connection.request("GET", target)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException) as error:
+                self.close_connection()
+                failure = "connection error: " + str(error)
+            else:
+                if response.status == 200:
+                    return json.loads(body)
+                failure = "HTTP " + str(response.status)
+                if response.status not in RETRY_STATUSES:
+                    raise FetchError(failure + ": " + body.decode(errors="replace")[:200])
+                retry_after = response.getheader("Retry-After")
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff * 2 ** attempt * (1 + random.random())
+            if retry_after is not None and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+        raise FetchError(failure + " after " + str(self.max_retries + 1) + " attempts")
+
+def parse_items(data):
+    """
+    Returns the rows of an API response as a dictionary of column lists,
+    with NaN for missing numeric fields and "" for missing text fields
+    """
+    columns = {name: [] for name in list(TEXT_COLUMNS) + list(NUMERIC_COLUMNS)}
+    for item in data.get("items", []):
+        for name, (section, key) in TEXT_COLUMNS.items():
+            fields = item if section is None else item.get(section, {})
+            columns[name].append(str(fields.get(key, "")))
+        for name, (section, key) in NUMERIC_COLUMNS.items():
+            value = item.get(section, {}).get(key)
+            try:
+                columns[name].append(float(value))
+            except (TypeError, ValueError):
+                columns[name].append(float("nan"))
+    return columns
+
+class ColumnWriter:
+    """
+    Appends rows to one file per column in a directory: <name>.f64 holds
+    the little-endian float64 values of a numeric column, <name>.txt one
+    line per value of a text column. Files are flushed after every append,
+    and the number of groups and rows written and the size of every file
+    recorded in progress.json, so completed groups survive an interrupted
+    run. A writer opened with the key of the run recorded there continues
+    after its last complete group (anything written after it is cut off);
+    with any other key the files are rewritten from scratch.
+
+    Attributes:
+        key: String identifying the groups written (see groups_key)
+        num_groups: Integer number of groups written
+        num_rows: Integer number of rows written
+    """
+    def __init__(self, directory, key=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.key = key
+        self.paths = {name: os.path.join(directory, name + ".txt") for name in TEXT_COLUMNS}
+        self.paths.update((name, os.path.join(directory, name + ".f64"))
+                          for name in NUMERIC_COLUMNS)
+        self.num_groups = 0
+        self.num_rows = 0
+        progress = self.read_progress()
+        if progress is not None:
+            for name, path in self.paths.items():
+                os.truncate(path, progress["sizes"][name])
+            self.num_groups = progress["groups"]
+            self.num_rows = progress["rows"]
+        mode = "a" if progress is not None else "w"
+        self.files = {}
+        for name in TEXT_COLUMNS:
+            self.files[name] = open(self.paths[name], mode, encoding="utf-8")
+        for name in NUMERIC_COLUMNS:
+            self.files[name] = open(self.paths[name], mode + "b")
+        if progress is None:
+            self.write_progress()
+
+    def read_progress(self):
+        """Returns the progress recorded for this writer's key if every
+        column file holds the data it records, otherwise None"""
+        if self.key is None:
+            return None
+        try:
+            with open(os.path.join(self.directory, PROGRESS_FILE), "r") as file:
+                progress = json.load(file)
+            if progress["key"] != self.key:
+                return None
+            if any(os.path.getsize(path) < progress["sizes"][name]
+                   for name, path in self.paths.items()):
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return progress
+
+    def write_progress(self):
+        """Record the groups and rows written and the size of every file"""
+        write_json_atomically(os.path.join(self.directory, PROGRESS_FILE),
+                              {"key": self.key, "groups": self.num_groups,
+                               "rows": self.num_rows,
+                               "sizes": {name: os.fstat(file.fileno()).st_size
+                                         for name, file in self.files.items()}})
+
+    def append(self, columns):
+        """Append the rows of a group as a dictionary of column lists (see
+        parse_items)"""
+        for name in TEXT_COLUMNS:
+            self.files[name].write("".join(value.replace("\n", " ") + "\n"
+                                           for value in columns[name]))
+        for name in NUMERIC_COLUMNS:
+            self.files[name].write(np.array(columns[name], dtype="<f8").tobytes())
+        for file in self.files.values():
+            file.flush()
+        self.num_groups += 1
+        self.num_rows += len(columns["video_id"])
+        self.write_progress()
+
+    def close(self):
+        """Close every column file"""
+        for file in self.files.values():
+            file.close()
+
+def load_columns(directory):
+    """Returns the columns written by ColumnWriter as a dictionary of arrays"""
+    columns = {}
+    for name in TEXT_COLUMNS:
+        with open(os.path.join(directory, name + ".txt"), "r", encoding="utf-8") as file:
+            columns[name] = np.array(file.read().splitlines(), dtype=str)
+    for name in NUMERIC_COLUMNS:
+        columns[name] = np.fromfile(os.path.join(directory, name + ".f64"), dtype="<f8")
+    return columns
+
+def stats_matrix(columns):
+    """Returns the [num_videos x 4] view, like, dislike and comment counts of
+    the videos that have all four counts"""
+    matrix = np.column_stack([columns[name] for name in STATS_COLUMNS])
+    return matrix[~np.isnan(matrix).any(axis=1)]
+
+def fetch_to_columns(groups, fetcher, directory, workers=8):
+    """
+    Fetches groups of video ids with workers threads and writes the videos
+    to column files in directory, in the order of groups. If an earlier run
+    with the same groups was interrupted, only the groups it did not write
+    are fetched and appended.
+
+    Returns:
+        num_videos: Integer number of videos in the column files
+    """
+    writer = ColumnWriter(directory, groups_key(groups))
+    try:
+        with ThreadPoolExecutor(workers) as executor:
+            try:
+                for data in executor.map(fetcher.fetch_group, groups[writer.num_groups:]):
+                    writer.append(parse_items(data))
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+    finally:
+        writer.close()
+    return writer.num_rows
+
+def main():
+    """Fetches video statistics as described by command line arguments"""
+    parser = argparse.ArgumentParser(description="Fetch YouTube video statistics")
+    parser.add_argument("ids_file", help="csv file with video ids in its second column")
+    parser.add_argument("output_dir", help="directory of the column files to write")
+    parser.add_argument("--api-key", help="API key (or use --api-key-file)")
+    parser.add_argument("--api-key-file", default="api_key.txt")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=10.0,
+                        help="maximum requests per second, 0 for no limit (default 10)")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=0.5,
+                        help="seconds before the first retry (default 0.5)")
+    parser.add_argument("--cache-dir", help="directory caching responses by id group")
+    parser.add_argument("--limit", type=int, help="fetch only the first LIMIT groups")
+    parser.add_argument("--stats-file",
+                        help="also save the view/like/dislike/comment matrix to this .npy file")
+    args = parser.parse_args()
+
+    api_key = args.api_key
+    if api_key is None:
+        with open(args.api_key_file, "r") as file:
+            api_key = file.read().rstrip()
+    groups = group_ids(read_video_ids(args.ids_file))[:args.limit]
+    cache = ResponseCache(args.cache_dir) if args.cache_dir else None
+    fetcher = VideoFetcher(api_key, args.api_url, cache,
+                           RateLimiter(args.rate or None, max(args.workers, 1)),
+                           args.retries, args.backoff)
+    start_time = time.time()
+    num_videos = fetch_to_columns(groups, fetcher, args.output_dir, args.workers)
+    print("Fetched " + str(num_videos) + " videos in " + str(len(groups)) + " groups ("
+          + str(fetcher.requests) + " requests, " + str(fetcher.cache_hits) + " cached) in "
+          + "{0:.1f}".format(time.time() - start_time) + " seconds.")
+    if args.stats_file:
+        matrix = stats_matrix(load_columns(args.output_dir))
+        np.save(args.stats_file, matrix)
+        print("Saved " + str(len(matrix)) + " rows with all four counts to " + args.stats_file)
+
+if __name__ == "__main__":
+    main()
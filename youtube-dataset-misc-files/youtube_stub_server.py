@@ -0,0 +1,130 @@
+"""Local stand-in for the YouTube videos API serving recorded responses
+
+Every .json file in the recordings directory holding an API response (a
+dictionary with "items", e.g. the files of a youtube_fetcher.py cache
+directory) is loaded and its items indexed by video id. A request
+
+    GET /youtube/v3/videos?id=ID1,ID2,...&key=KEY&part=...
+
+returns the recorded items of the requested ids that are known, in the
+order requested (unknown ids are left out, like the real API). Requests
+without a key get 400. With --fail-rate P a random fraction P of the
+requests (drawn from --seed) gets a 503 with Retry-After: 0, to exercise
+the retries of the fetcher.
+
+The recordings directory holds a small set of recorded responses,
+including videos with missing statistics, snippets and content details
+(see test_youtube_fetcher.py).
+
+Example:
+    python3 youtube_stub_server.py recordings --port 8001 --fail-rate 0.2
+    python3 youtube_fetcher.py trending-yt.csv trending-columns --api-key test
+        --api-url http://127.0.0.1:8001/youtube/v3/videos
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VIDEOS_PATH = "/youtube/v3/videos"
+
+def load_recordings(directory):
+    """Returns a dictionary of the recorded API items by video id"""
+    items = {}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name), "r") as file:
+            data = json.load(file)
+        for item in data.get("items", []):
+            items[item["id"]] = item
+    return items
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    """HTTP request handler of the stub API"""
+    # Keep-alive connections, like the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.random.random() < server.fail_rate
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != VIDEOS_PATH:
+            self.send_json(404, {"error": {"code": 404, "message": "Not found"}})
+            return
+        if fail:
+            self.send_json(503, {"error": {"code": 503, "message": "Backend error"}},
+                           {"Retry-After": "0"})
+            return
+        query = urllib.parse.parse_qs(url.query)
+        if not query.get("key"):
+            self.send_json(400, {"error": {"code": 400, "message": "API key required"}})
+            return
+        ids = ",".join(query.get("id", [])).split(",")
+        items = [server.items[video_id] for video_id in ids if video_id in server.items]
+        self.send_json(200, {"kind": "youtube#videoListResponse", "items": items,
+                             "pageInfo": {"totalResults": len(items),
+                                          "resultsPerPage": len(items)}})
+
+    def send_json(self, status, body, headers=None):
+        """Send a JSON response"""
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """Do not log every request"""
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server of the stub API
+
+    Attributes:
+        items: Dictionary of recorded API items by video id
+        fail_rate: Floating point fraction of requests answered with 503
+        requests: Integer number of requests received
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, items, fail_rate=0.0, seed=0):
+        super().__init__(address, StubRequestHandler)
+        self.items = items
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+def main():
+    """Runs the stub API from command line arguments"""
+    parser = argparse.ArgumentParser(description="Serve recorded YouTube API responses")
+    parser.add_argument("recordings_dir", help="directory of recorded JSON responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="fraction of requests answered with 503 (default 0)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the failures")
+    args = parser.parse_args()
+    items = load_recordings(args.recordings_dir)
+    server = StubServer((args.host, args.port), items, args.fail_rate, args.seed)
+    print("Serving " + str(len(items)) + " recorded videos on http://" + args.host + ":"
+          + str(server.server_address[1]) + VIDEOS_PATH)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()